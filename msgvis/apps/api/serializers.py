@@ -215,6 +215,7 @@ class ExampleMessageSerializer(serializers.Serializer):
     focus = serializers.ListField(child=FilterSerializer(), required=False)
     #messages = serializers.ListField(child=MessageSerializer(), required=False, read_only=True)
     groups = serializers.ListField(child=serializers.IntegerField(), required=False)
+    collapse_duplicates = serializers.BooleanField(required=False)
     messages = serializers.SerializerMethodField('paginated_messages')
     def paginated_messages(self, obj):
         request = self.context.get('request')
@@ -262,6 +263,31 @@ class KeywordListSerializer(serializers.Serializer):
     keywords = serializers.ListField(child=serializers.CharField(), required=False)
 
 
+class RelatedTermSerializer(serializers.Serializer):
+    kind = serializers.CharField()
+    term = serializers.CharField()
+    count = serializers.IntegerField()
+    score = serializers.FloatField()
+
+
+class RelatedTermListSerializer(serializers.Serializer):
+    dataset = serializers.IntegerField(required=True)
+    kind = serializers.CharField()
+    term = serializers.CharField()
+    related = RelatedTermSerializer(many=True)
+
+
+class SimilarMessageSerializer(serializers.Serializer):
+    score = serializers.FloatField()
+    message = MessageSerializer()
+
+
+class SimilarMessageListSerializer(serializers.Serializer):
+    message = serializers.IntegerField()
+    dictionary = serializers.IntegerField(allow_null=True)
+    similar = SimilarMessageSerializer(many=True)
+
+
 class PaginatedMessageSerializer(pagination.PaginationSerializer):
     class Meta:
         object_serializer_class = MessageSerializer
@@ -315,8 +341,8 @@ class DatasetSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = corpus_models.Dataset
-        fields = ('id', 'name', 'description', 'message_count', 'has_prefetched_images', )
-        read_only_fields = ('id', 'name', 'description', 'message_count', 'has_prefetched_images', )
+        fields = ('id', 'name', 'description', 'message_count', 'has_prefetched_images', 'version', )
+        read_only_fields = ('id', 'name', 'description', 'message_count', 'has_prefetched_images', 'version', )
 
 
 
@@ -336,6 +362,7 @@ class DataTableSerializer(serializers.Serializer):
     search_key = serializers.CharField(allow_null=True, allow_blank=True, required=False)
     mode = serializers.CharField(allow_null=True, allow_blank=True, required=False)
     groups = serializers.ListField(child=serializers.IntegerField(), required=False)
+    collapse_duplicates = serializers.BooleanField(required=False)
 
 class ActionHistorySerializer(serializers.ModelSerializer):
     created_at = serializers.DateTimeField(required=False)
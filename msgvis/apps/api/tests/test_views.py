@@ -250,3 +250,176 @@ class DataTableViewTest(APITestCase):
         #datatable.generate.assert_called_once_with(self.dataset.id, filters, [], 30, None, None, None )
 
         # TODO: write tests for paging and searching
+
+
+class RelatedTermsViewTest(APITestCase):
+    def setUp(self):
+        from msgvis.apps.enhance.models import TweetWord, PrecalcCategoricalDistribution
+
+        self.dataset = corpus_models.Dataset.objects.create(name="Api test dataset")
+        texts = ["mudslide", "oso", "soup", "sound", "ladies"]
+        self.words = dict((text, TweetWord.objects.create(dataset=self.dataset, original_text=text,
+                                                          pos="N", text=text)) for text in texts)
+        self.hashtag = corpus_models.Hashtag.objects.create(text="OsoMudslide")
+
+        # "soup" is more common, but "sound" appears with "oso" more often
+        for i, words in enumerate([("mudslide", "oso", "sound"), ("mudslide", "oso", "sound"),
+                                   ("mudslide", "soup"), ("soup", "ladies"), ("soup",), ("oso", "soup")]):
+            message = self.dataset.message_set.create(text=" ".join(words), time=tz.now())
+            for text in words:
+                self.words[text].messages.add(message)
+            if "mudslide" in words:
+                message.hashtags.add(self.hashtag)
+
+        for text in texts:
+            PrecalcCategoricalDistribution.objects.create(dataset=self.dataset, dimension_key="words",
+                                                          level=text, count=self.words[text].messages.count())
+
+    def tearDown(self):
+        from msgvis.apps.enhance.cooccurrence import CooccurrenceMatrix
+        CooccurrenceMatrix.delete(self.dataset.id)
+
+    def test_related_terms(self):
+        from msgvis.apps.enhance.cooccurrence import CooccurrenceMatrix
+
+        url = reverse('related-terms')
+        params = {"dataset": self.dataset.id, "term": "mudslide"}
+
+        response = self.client.get(url, params)
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(response.data['related'], [])
+
+        CooccurrenceMatrix.build(self.dataset)
+        response = self.client.get(url, params)
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals([(r['kind'], r['term'], r['count']) for r in response.data['related']],
+                          [("hashtags", "OsoMudslide", 3), ("words", "sound", 2), ("words", "oso", 2),
+                           ("words", "soup", 1)])
+        self.assertAlmostEquals(response.data['related'][0]['score'], 1.0)
+
+        params["kinds"] = "words"
+        params["limit"] = 1
+        response = self.client.get(url, params)
+        self.assertEquals([r['term'] for r in response.data['related']], ["sound"])
+
+        for limit in (0, -3, "many"):
+            params["limit"] = limit
+            self.assertEquals(self.client.get(url, params).status_code, status.HTTP_400_BAD_REQUEST)
+
+        params["limit"] = 1
+        params["kinds"] = "sounds"
+        self.assertEquals(self.client.get(url, params).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEquals(self.client.get(url, {"dataset": self.dataset.id}).status_code,
+                          status.HTTP_400_BAD_REQUEST)
+
+    def test_keyword_suggestions(self):
+        from msgvis.apps.enhance.cooccurrence import CooccurrenceMatrix
+
+        url = reverse('keyword')
+        params = {"dataset": self.dataset.id, "q": "oso so"}
+
+        def suggestions():
+            response = self.client.get(url, params)
+            self.assertEquals(response.status_code, status.HTTP_200_OK)
+            return [keyword['text'] for keyword in response.data['keywords']]
+
+        self.assertEquals(suggestions(), ["oso soup", "oso sound"])
+        CooccurrenceMatrix.build(self.dataset)
+        self.assertEquals(suggestions(), ["oso sound", "oso soup"])
+
+
+class CollapseDuplicatesViewTest(APITestCase):
+    def setUp(self):
+        self.dataset = corpus_models.Dataset.objects.create(name="Api test dataset")
+        self.original = self.dataset.message_set.create(text="a message", time=tz.now())
+        self.original.duplicate_cluster = self.original.id
+        self.original.save()
+        for i in xrange(3):
+            self.dataset.message_set.create(text="RT @someone: a message", time=tz.now(),
+                                            duplicate_cluster=self.original.id)
+        self.dataset.message_set.create(text="another message", time=tz.now())
+
+    def test_table(self):
+        url = reverse('data-table')
+        data = {"dataset": self.dataset.id, "dimensions": ["duplicate_cluster"], "collapse_duplicates": True}
+
+        response = self.client.post(url, data, format='json')
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(sorted((row['duplicate_cluster'], row['value']) for row in response.data['result']['table']),
+                          [(None, 1), (self.original.id, 1)])
+
+    def test_example_messages(self):
+        url = reverse('example-messages')
+        data = {"dataset": self.dataset.id, "filters": [], "focus": []}
+
+        response = self.client.post(url, data, format='json')
+        self.assertEquals(response.data['messages']['count'], 5)
+
+        data["collapse_duplicates"] = True
+        response = self.client.post(url, data, format='json')
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(response.data['messages']['count'], 2)
+        self.assertEquals(response.data['collapse_duplicates'], True)
+
+
+class SimilarMessagesViewTest(APITestCase):
+    def setUp(self):
+        from msgvis.apps.enhance.models import Dictionary, Word, MessageWord
+
+        self.dataset = corpus_models.Dataset.objects.create(name="Api test dataset")
+        self.dictionary = Dictionary.objects.create(name="test", dataset=self.dataset, settings="{}",
+                                                    num_docs=4, num_pos=8, num_nnz=8)
+        words = [Word.objects.create(dictionary=self.dictionary, index=i, text=text, document_frequency=1)
+                 for i, text in enumerate(["mudslide", "oso", "soup", "ladies"])]
+
+        self.messages = []
+        for vector in [{0: 1.0, 1: 1.0}, {0: 1.0, 1: 0.5}, {1: 1.0, 2: 1.0}, {2: 0.5, 3: 1.0}]:
+            message = self.dataset.message_set.create(text="some words", time=tz.now())
+            for index, tfidf in vector.items():
+                MessageWord.objects.create(dictionary=self.dictionary, word=words[index], message=message,
+                                           word_index=index, count=1, tfidf=tfidf)
+            self.messages.append(message)
+
+    def tearDown(self):
+        from msgvis.apps.enhance.tasks import BowCorpus
+        BowCorpus.get_path(self.dictionary).parent.rmtree_p()
+
+    def test_similar_messages(self):
+        from msgvis.apps.enhance.similarity import SimilarityIndex
+
+        url = reverse('similar-messages')
+        params = {"message": self.messages[0].id}
+
+        response = self.client.get(url, params)
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals(response.data['dictionary'], self.dictionary.id)
+        self.assertEquals(response.data['similar'], [])
+
+        SimilarityIndex.build(self.dictionary)
+        response = self.client.get(url, params)
+        self.assertEquals(response.status_code, status.HTTP_200_OK)
+        self.assertEquals([r['message']['id'] for r in response.data['similar']],
+                          [self.messages[1].id, self.messages[2].id])
+        self.assertAlmostEquals(response.data['similar'][0]['score'], 1.5 / (2 ** 0.5 * 1.25 ** 0.5), places=5)
+        self.assertAlmostEquals(response.data['similar'][1]['score'], 0.5, places=5)
+
+        params["limit"] = 1
+        response = self.client.get(url, params)
+        self.assertEquals([r['message']['id'] for r in response.data['similar']], [self.messages[1].id])
+
+    def test_bad_requests(self):
+        url = reverse('similar-messages')
+
+        response = self.client.get(url)
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        other = corpus_models.Dataset.objects.create(name="Other dataset")
+        response = self.client.get(url, {"message": other.message_set.create(text="hi").id + 1})
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.get(url, {"message": self.messages[0].id, "dictionary": self.dictionary.id + 1})
+        self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        for limit in (0, -3, "many"):
+            response = self.client.get(url, {"message": self.messages[0].id, "limit": limit})
+            self.assertEquals(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -8,6 +8,8 @@ api_root_urls = {
     'example-messages': url(r'^message/$', views.ExampleMessagesView.as_view(), name='example-messages'),
     'keyword-messages': url(r'^search/$', views.KeywordMessagesView.as_view(), name='keyword-messages'),
     'keyword': url(r'^keyword/$', views.KeywordView.as_view(), name='keyword'),
+    'related-terms': url(r'^related/$', views.RelatedTermsView.as_view(), name='related-terms'),
+    'similar-messages': url(r'^similar/$', views.SimilarMessagesView.as_view(), name='similar-messages'),
     'group': url(r'^group/$', csrf_exempt(views.GroupView.as_view()), name='group'),
     'research-questions': url(r'^questions/$', views.ResearchQuestionsView.as_view(), name='research-questions'),
     'action-history': url(r'^history/$', views.ActionHistoryView.as_view(), name='action-history'),
@@ -10,6 +10,10 @@ The view classes below define the API endpoints.
 +-----------------------------------------------------------------+-----------------+-------------------------------------------------+
 | :class:`Get Research Questions <ResearchQuestionsView>`         | /api/questions  | Get RQs related to dimensions/filters           |
 +-----------------------------------------------------------------+-----------------+-------------------------------------------------+
+| :class:`Get Related Terms <RelatedTermsView>`                   | /api/related    | Get terms that appear with a term               |
++-----------------------------------------------------------------+-----------------+-------------------------------------------------+
+| :class:`Get Similar Messages <SimilarMessagesView>`             | /api/similar    | Get the messages most like a message            |
++-----------------------------------------------------------------+-----------------+-------------------------------------------------+
 | Message Context                                                 | /api/context    | Get context for a message                       |
 +-----------------------------------------------------------------+-----------------+-------------------------------------------------+
 | Snapshots                                                       | /api/snapshots  | Save a visualization snapshot                   |
@@ -33,6 +37,8 @@ from msgvis.apps.corpus import models as corpus_models
 from msgvis.apps.questions import models as questions_models
 from msgvis.apps.datatable import models as datatable_models
 from msgvis.apps.enhance import models as enhance_models
+from msgvis.apps.enhance.cooccurrence import CooccurrenceMatrix, KINDS
+from msgvis.apps.enhance.similarity import SimilarityIndex
 import msgvis.apps.groups.models as groups_models
 import json
 import logging
@@ -72,6 +78,10 @@ class DataTableView(APIView):
     This is the most general output format for results, but later we may
     switch to a more compact format.
 
+    With ``"collapse_duplicates": true``, each cluster of near-duplicate
+    messages (such as retweets) is counted once, as is the case for
+    example messages.
+
     **Request:** ``POST /api/table``
 
     **Format:** (request without ``result`` key)
@@ -134,6 +144,7 @@ class DataTableView(APIView):
             groups = data.get('groups', [])
             if len(groups) == 0:
                 groups = None
+            collapse_duplicates = data.get('collapse_duplicates', False)
 
             page_size = 100
             page = None
@@ -144,7 +155,8 @@ class DataTableView(APIView):
                 page = max(1, int(data.get('page')))
 
             if type(filters) == types.ListType and len(filters) == 0 and \
-               type(exclude) == types.ListType and len(exclude) == 0 and len(dimensions) == 1 and dimensions[0].is_categorical():
+               type(exclude) == types.ListType and len(exclude) == 0 and len(dimensions) == 1 and dimensions[0].is_categorical() and \
+               not collapse_duplicates:
                 result = dataset.get_precalc_distribution(dimension=dimensions[0], search_key=search_key, page=page, page_size=page_size, mode=mode)
 
             else:
@@ -153,7 +165,8 @@ class DataTableView(APIView):
                 if mode is not None:
                     datatable.set_mode(mode)
 
-                result = datatable.generate(dataset, filters, exclude, page_size, page, search_key, groups)
+                result = datatable.generate(dataset, filters, exclude, page_size, page, search_key, groups,
+                                            collapse_duplicates=collapse_duplicates)
 
             # Just add the result key
             response_data = data
@@ -191,6 +204,7 @@ class ExampleMessagesView(APIView):
                     "value": "2015-02-28T00:23:53Z"
                 }
             ],
+            "collapse_duplicates": true,
             "messages": [
                 {
                     "id": 52,
@@ -221,11 +235,14 @@ class ExampleMessagesView(APIView):
             excludes = data.get('excludes', [])
             focus = data.get('focus', [])
             groups = data.get('groups')
+            collapse_duplicates = data.get('collapse_duplicates', False)
 
             if groups is None:
-                example_messages = dataset.get_example_messages(filters + focus, excludes)
+                example_messages = dataset.get_example_messages(filters + focus, excludes,
+                                                                collapse_duplicates=collapse_duplicates)
             else:
-                example_messages = dataset.get_example_messages_by_groups(groups, filters + focus, excludes)
+                example_messages = dataset.get_example_messages_by_groups(groups, filters + focus, excludes,
+                                                                          collapse_duplicates=collapse_duplicates)
 
             # Just add the messages key to the response
             response_data = data
@@ -493,7 +510,19 @@ class KeywordView(APIView):
                                                                                         dimension_key="words",
                                                                                         level__istartswith=keyword).order_by('-count')
 
-                response_data["keywords"] = map(lambda x: prefix + x.level, keywords[:20])
+                levels = [x.level for x in keywords[:20]]
+
+                # put the words that appear most with the ones before it first
+                context = [string for string in strings[:-1] if string]
+                if context:
+                    dataset = corpus_models.Dataset.objects.filter(id=dataset_id).first()
+                    matrix = dataset and CooccurrenceMatrix.for_dataset(dataset)
+                    if matrix:
+                        suggested = matrix.suggest('words', context, keyword, limit=20)
+                        seen = set(level.lower() for level in suggested)
+                        levels = (suggested + [level for level in levels if level.lower() not in seen])[:20]
+
+                response_data["keywords"] = map(lambda x: prefix + x, levels)
                 output = serializers.KeywordListSerializer(response_data)
 
                 for idx, keyword in enumerate(output.data['keywords']):
@@ -504,6 +533,136 @@ class KeywordView(APIView):
 
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
+class RelatedTermsView(APIView):
+    """
+    Get the words, hashtags and mentions that appear most often with a term,
+    once the dataset's co-occurrence has been built (see
+    :mod:`msgvis.apps.enhance.cooccurrence`). ``kind`` is the kind of the
+    term (``words`` by default), and ``kinds`` limits the kinds of related
+    terms.
+
+    **Request:** ``GET /api/related?dataset=1&term=oso&kind=words&kinds=words,hashtags&limit=20``
+
+    ::
+
+        {
+            "dataset": 1,
+            "kind": "words",
+            "term": "oso",
+            "related": [
+                {"kind": "words", "term": "mudslide", "count": 812, "score": 0.43},
+                {"kind": "hashtags", "term": "OsoMudslide", "count": 305, "score": 0.21},
+                ...
+            ]
+        }
+
+    ``related`` is empty if the co-occurrence hasn't been built since the
+    dataset last changed.
+    """
+
+    def get(self, request, format=None):
+        dataset_id = request.query_params.get('dataset')
+        term = request.query_params.get('term')
+        if not dataset_id or not term:
+            return Response("Please specify dataset id and term", status=status.HTTP_400_BAD_REQUEST)
+
+        kind = request.query_params.get('kind', 'words')
+        kinds = request.query_params.get('kinds')
+        kinds = kinds.split(',') if kinds else list(KINDS)
+        if kind not in KINDS or any(k not in KINDS for k in kinds):
+            return Response("Kinds must be among %s" % ", ".join(KINDS), status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            dataset = corpus_models.Dataset.objects.get(id=int(dataset_id))
+        except (ValueError, corpus_models.Dataset.DoesNotExist):
+            return Response("Dataset not exist", status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return Response("Limit must be a positive number", status=status.HTTP_400_BAD_REQUEST)
+
+        matrix = CooccurrenceMatrix.for_dataset(dataset)
+        related = matrix.related(kind, term, kinds=kinds, limit=limit) if matrix else []
+
+        output = serializers.RelatedTermListSerializer({
+            "dataset": dataset.id,
+            "kind": kind,
+            "term": term,
+            "related": related,
+        })
+        return Response(output.data, status=status.HTTP_200_OK)
+
+
+class SimilarMessagesView(APIView):
+    """
+    Get the messages most like a message, by the similarity of their tf-idf
+    vectors in a dictionary (the dataset's, unless ``dictionary`` is given),
+    once it has been indexed (see :mod:`msgvis.apps.enhance.similarity`).
+
+    **Request:** ``GET /api/similar?message=52&limit=10``
+
+    ::
+
+        {
+            "message": 52,
+            "dictionary": 3,
+            "similar": [
+                {
+                    "score": 0.83,
+                    "message": {
+                        "id": 97,
+                        "dataset": 1,
+                        "text": "Some sort of thing or other",
+                        ...
+                    }
+                },
+                ...
+            ]
+        }
+
+    ``similar`` is empty if the dictionary hasn't been indexed since its
+    word vectors last changed.
+    """
+
+    def get(self, request, format=None):
+        try:
+            message = corpus_models.Message.objects.select_related('dataset').get(
+                id=int(request.query_params.get('message')))
+        except (TypeError, ValueError, corpus_models.Message.DoesNotExist):
+            return Response("Please specify an existing message id", status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return Response("Limit must be a positive number", status=status.HTTP_400_BAD_REQUEST)
+
+        if request.query_params.get('dictionary'):
+            dictionary = enhance_models.Dictionary.objects.filter(
+                id=request.query_params.get('dictionary'), dataset=message.dataset).first()
+            if dictionary is None:
+                return Response("Dictionary not exist", status=status.HTTP_400_BAD_REQUEST)
+        else:
+            dictionary = message.dataset.get_dictionary()
+
+        index = dictionary and SimilarityIndex.for_dictionary(dictionary)
+        similar = index.similar(message.id, limit=limit) if index else []
+
+        messages = corpus_models.Message.objects.filter(dataset=message.dataset) \
+            .select_related('sender').in_bulk([message_id for message_id, score in similar])
+        output = serializers.SimilarMessageListSerializer({
+            "message": message.id,
+            "dictionary": dictionary.id if dictionary else None,
+            "similar": [{"score": score, "message": messages[message_id]}
+                        for message_id, score in similar if message_id in messages],
+        })
+        return Response(output.data, status=status.HTTP_200_OK)
+
+
 class ResearchQuestionsView(APIView):
     """
     Get a list of research questions related to a selection of dimensions and filters.
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('corpus', '0021_dataset_has_prefetched_images'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='reply_to',
+            field=models.ForeignKey(related_name='replies', default=None, blank=True, to='corpus.Message', null=True),
+            preserve_default=True,
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='retweet_of',
+            field=models.ForeignKey(related_name='retweets', default=None, blank=True, to='corpus.Message', null=True),
+            preserve_default=True,
+        ),
+    ]
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enhance', '0015_auto_20150906_0752'),
+        ('corpus', '0023_dataset_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='dominant_topic',
+            field=models.ForeignKey(related_name='dominant_messages', on_delete=django.db.models.deletion.SET_NULL, default=None, blank=True, to='enhance.Topic', null=True),
+            preserve_default=True,
+        ),
+    ]
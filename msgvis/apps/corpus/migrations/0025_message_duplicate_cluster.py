@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('corpus', '0024_message_dominant_topic'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='duplicate_cluster',
+            field=models.IntegerField(default=None, null=True, blank=True),
+            preserve_default=True,
+        ),
+        migrations.AlterIndexTogether(
+            name='message',
+            index_together=set([('dataset', 'original_id'), ('dataset', 'time'), ('dataset', 'duplicate_cluster')]),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+UPDATE_CHUNK_SIZE = 500
+
+
+def set_dominant_topics(apps, schema_editor):
+    """
+    Save the most likely topic of each message, from the latest topic model
+    of its dataset that has topic probabilities, as its ``dominant_topic``.
+    """
+    Dataset = apps.get_model("corpus", "Dataset")
+    Message = apps.get_model("corpus", "Message")
+    TopicModel = apps.get_model("enhance", "TopicModel")
+    MessageTopic = apps.get_model("enhance", "MessageTopic")
+    PrecalcCategoricalDistribution = apps.get_model("enhance", "PrecalcCategoricalDistribution")
+
+    stale = []
+    for dataset in Dataset.objects.all():
+        model = TopicModel.objects.filter(dictionary__dataset=dataset, messagetopic__isnull=False)\
+            .order_by('-id').first()
+        if model is None:
+            continue
+
+        probabilities = MessageTopic.objects.filter(topic_model=model, message__dominant_topic=None)\
+            .order_by('message', '-probability')\
+            .values_list('message_id', 'topic_id')
+
+        dominant = {}
+        last_message_id = None
+        for message_id, topic_id in probabilities.iterator():
+            if message_id != last_message_id:
+                dominant.setdefault(topic_id, []).append(message_id)
+                last_message_id = message_id
+
+        for topic_id, message_ids in dominant.iteritems():
+            for i in xrange(0, len(message_ids), UPDATE_CHUNK_SIZE):
+                Message.objects.filter(id__in=message_ids[i:i + UPDATE_CHUNK_SIZE]).update(dominant_topic=topic_id)
+
+        if PrecalcCategoricalDistribution.objects.filter(dataset=dataset, dimension_key='topics').exists():
+            stale.append(str(dataset.id))
+
+    if stale:
+        # the old distributions counted every topic of a message
+        print
+        print "  The precalculated topics distributions are out of date, rebuild them with:"
+        print "  python manage.py precalc_categorical_distribution %s topics" % ",".join(stale)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enhance', '0018_termtimeline'),
+        ('corpus', '0025_message_duplicate_cluster'),
+    ]
+
+    operations = [
+        migrations.RunPython(set_dominant_topics),
+    ]
@@ -32,6 +32,9 @@ class Dataset(models.Model):
 
     has_prefetched_images = models.BooleanField(default=False)
 
+    version = models.PositiveIntegerField(default=0)
+    """Incremented whenever new messages are ingested into the dataset"""
+
     @property
     def message_count(self):
         return self.message_set.count()
@@ -39,10 +42,15 @@ class Dataset(models.Model):
     def __unicode__(self):
         return self.name
 
-    def get_example_messages(self, filters=[], excludes=[]):
-        """Get example messages given some filters (dictionaries containing dimensions and filter params)"""
+    def get_example_messages(self, filters=[], excludes=[], collapse_duplicates=False):
+        """
+        Get example messages given some filters (dictionaries containing dimensions and filter params),
+        with only the first of each cluster of near-duplicates if ``collapse_duplicates``.
+        """
 
         messages = self.message_set.all()
+        if collapse_duplicates:
+            messages = utils.collapse_duplicates(messages)
 
         for filter in filters:
             dimension = filter["dimension"]
@@ -62,7 +70,7 @@ class Dataset(models.Model):
 
         return messages
 
-    def get_example_messages_by_groups(self, groups, filters=[], excludes=[]):
+    def get_example_messages_by_groups(self, groups, filters=[], excludes=[], collapse_duplicates=False):
         include_groups = map(lambda x: int(x['value']), filter(lambda x: x['dimension'].key=='groups', filters))
         if len(include_groups)> 0:
             groups = include_groups
@@ -75,6 +83,8 @@ class Dataset(models.Model):
         for group in groups:
             group_obj = self.groups.get(id=group)
             messages = group_obj.messages
+            if collapse_duplicates:
+                messages = utils.collapse_duplicates(messages)
             for filterA in filters:
                 dimension = filterA["dimension"]
 
@@ -343,6 +353,7 @@ class Message(models.Model):
         index_together = (
             ('dataset', 'original_id'),  # used by importer
             ('dataset', 'time'),
+            ('dataset', 'duplicate_cluster'),
         )
             
     dataset = models.ForeignKey(Dataset)
@@ -384,6 +395,12 @@ class Message(models.Model):
     shared_count = models.PositiveIntegerField(blank=True, default=0)
     """The number of times this message was shared or retweeted."""
 
+    reply_to = models.ForeignKey('self', related_name="replies", null=True, blank=True, default=None)
+    """The :class:`Message` this message replies to, if any."""
+
+    retweet_of = models.ForeignKey('self', related_name="retweets", null=True, blank=True, default=None)
+    """The :class:`Message` this message shares, if any."""
+
     contains_hashtag = models.BooleanField(blank=True, default=False)
     """True if the message has a :class:`Hashtag`."""
 
@@ -396,6 +413,17 @@ class Message(models.Model):
     contains_mention = models.BooleanField(blank=True, default=False)
     """True if the message mentions any :class:`Person`."""
 
+    dominant_topic = models.ForeignKey('enhance.Topic', related_name='dominant_messages',
+                                       null=True, blank=True, default=None, on_delete=models.SET_NULL)
+    """The most likely :class:`msgvis.apps.enhance.models.Topic` of the message, from the last topic model applied to it."""
+
+    duplicate_cluster = models.IntegerField(null=True, blank=True, default=None)
+    """
+    The id of the first message in the group of near-duplicates (such as
+    retweets) that this message belongs to, or None if it has none
+    (see :mod:`msgvis.apps.enhance.duplicates`).
+    """
+
     urls = models.ManyToManyField(Url, null=True, blank=True, default=None)
     """The set of :class:`Url` in the message."""
 
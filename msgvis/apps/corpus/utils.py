@@ -4,7 +4,7 @@ from msgvis.settings.common import TWITTER_ACCESS_TOKEN, TWITTER_ACCESS_TOKEN_SE
 import re
 import os
 import os.path
-from django.db.models import Q
+from django.db.models import Q, F
 import operator
 
 def get_embedded_html(tweet_original_id):
@@ -85,6 +85,10 @@ def levels_or(field_name, domain):
 
     return reduce(operator.or_, [Q(x) for x in filter_ors])
 
+def collapse_duplicates(queryset):
+    """Keep only the first message of each cluster of near-duplicates."""
+    return queryset.filter(Q(duplicate_cluster__isnull=True) | Q(duplicate_cluster=F('id')))
+
 def get_word_objs(queryset, text_field_name, related_field_name, words):
     word_objs = []
     for word in words:
@@ -88,6 +88,47 @@ def group_messages_by_words_with_raw_query(query, callback):
 
     return callback(query)
 
+def counted_messages(dataset, queryset=None):
+    """
+    The messages of a dataset (or of ``queryset``, some of its messages)
+    that tables count: those with a time near the dataset's time range.
+    """
+    if queryset is None:
+        queryset = dataset.message_set.all()
+
+    # Filter out null time
+    queryset = queryset.exclude(time__isnull=True)
+    if dataset.start_time and dataset.end_time:
+        range = dataset.end_time - dataset.start_time
+        buffer = timedelta(seconds=range.total_seconds() * 0.1)
+        queryset = queryset.filter(time__gte=dataset.start_time - buffer,
+                                   time__lte=dataset.end_time + buffer)
+    return queryset
+
+
+def _timeline_words_filter(filters, exclude):
+    """
+    The words a time table is filtered to, if its only filter is on words
+    levels or a value that a term timeline can look up, else None.
+    """
+    if exclude or not filters or len(filters) != 1 or filters[0]['dimension'].key != 'words':
+        return None
+
+    params = dict((key, value) for key, value in filters[0].iteritems() if key != 'dimension')
+    if params.keys() == ['levels'] and params['levels']:
+        words = params['levels']
+    elif params.keys() == ['value']:
+        words = [params['value']]
+    else:
+        return None
+
+    # empty and "false" levels mean something else to the filter
+    for word in words:
+        if not isinstance(word, basestring) or word.strip() == "" or word == "false":
+            return None
+    return words
+
+
 class DataTable(object):
     """
     This class knows how to calculate appropriate visualization data
@@ -188,6 +229,141 @@ class DataTable(object):
 
 
 
+    def generate_from_timeline(self, dataset, filters=None, exclude=None, page=None):
+        """
+        Generate words by time tables, and time tables filtered by words,
+        from the dataset's :class:`msgvis.apps.enhance.models.TermTimeline`
+        instead of joining messages to their words. The result is the same
+        as :meth:`generate`'s. Returns None if the dataset has no current
+        timeline, or the table needs anything the timeline doesn't have.
+        """
+        from msgvis.apps.enhance.models import TermTimeline
+
+        keys = [dimension.key for dimension in (self.primary_dimension, self.secondary_dimension)
+                if dimension is not None]
+        if sorted(keys) == ['time', 'words'] and not filters and not exclude:
+            filter_words = None
+        elif keys == ['time'] and page is None:
+            filter_words = _timeline_words_filter(filters, exclude)
+            if filter_words is None:
+                return None
+        else:
+            return None
+
+        timeline = TermTimeline.get_current(dataset)
+        if timeline is None:
+            return None
+
+        time_dimension = registry.get_dimension('time')
+        queryset = counted_messages(dataset)
+        domains = {}
+        domain_labels = {}
+        flags = {'words': False, 'time': False}
+
+        words = filter_words
+        if filter_words is None:
+            words = [row['text'] for row in timeline.levels()]
+            if (self.mode == 'enable_others' or self.mode == 'omit_others') and \
+                    len(words) > MAX_CATEGORICAL_LEVELS:
+                flags['words'] = True
+                words = words[:MAX_CATEGORICAL_LEVELS]
+            domains['words'] = words
+
+        # the range of the messages the table counts decides the bin size
+        if filter_words is not None or flags['words']:
+            if any(word is not None and word.strip() == "" for word in words):
+                # filtered as if they were None
+                return None
+            min_time, max_time = timeline.get_range(words)
+        else:
+            min_time, max_time = time_dimension.get_range(queryset)
+
+        if min_time is None:
+            table = []
+        else:
+            bin_size = int(time_dimension._get_bin_size(min_time, max_time, time_dimension.default_bins))
+            if bin_size <= time_dimension.min_bin_size or bin_size not in timeline.bin_sizes:
+                return None
+
+            if filter_words is None:
+                counts = timeline.counts(bin_size, words if flags['words'] else None)
+                table = [{'words': row['text'], 'time': time_dimension.grouped_value(row['start']),
+                          'value': row['count']} for row in counts]
+            else:
+                counts = timeline.counts(bin_size, words, by_text=False)
+                table = [{'time': time_dimension.grouped_value(row['start']), 'value': row['count']}
+                         for row in counts]
+
+        domains['time'], labels = self.domain(time_dimension, queryset)
+
+        if self.mode == "enable_others" and flags['words']:
+            table.extend(self.render_others(queryset, domains, flags[self.primary_dimension.key],
+                                            flags[self.secondary_dimension.key]))
+
+        return {
+            'table': table,
+            'domains': domains,
+            'domain_labels': domain_labels
+        }
+
+    def generate_from_cooccurrence(self, dataset, filters=None, exclude=None):
+        """
+        Generate tables of words, hashtags or mentions by another of them
+        from the dataset's :class:`msgvis.apps.enhance.cooccurrence.CooccurrenceMatrix`
+        instead of joining messages to both. The result is the same as
+        :meth:`generate`'s. Returns None if the dataset has no current
+        matrix, or the table needs anything the matrix doesn't have.
+        """
+        from msgvis.apps.enhance.cooccurrence import CooccurrenceMatrix, KINDS
+
+        if self.secondary_dimension is None or filters or exclude:
+            return None
+        keys = [self.primary_dimension.key, self.secondary_dimension.key]
+        if keys[0] not in KINDS or keys[1] not in KINDS or keys[0] == keys[1]:
+            return None
+
+        matrix = CooccurrenceMatrix.for_dataset(dataset)
+        if matrix is None:
+            return None
+
+        domains = {}
+        flags = {}
+        indices = {}
+        for key in keys:
+            domain = list(matrix.levels(key))
+            flags[key] = (self.mode == 'enable_others' or self.mode == 'omit_others') and \
+                len(domain) > MAX_CATEGORICAL_LEVELS
+            if flags[key]:
+                domain = domain[:MAX_CATEGORICAL_LEVELS]
+                if any(level is not None and level.strip() == "" for level in domain):
+                    # filtered as if they were None
+                    return None
+                indices[key] = set(matrix.index(key, level) for level in domain)
+            domains[key] = domain
+
+        primary_key, secondary_key = keys
+        primary_terms = matrix.terms(primary_key)
+        secondary_terms = matrix.terms(secondary_key)
+        cells = matrix.pair(primary_key, secondary_key).tocoo()
+
+        table = []
+        for i, j, count in zip(cells.row.tolist(), cells.col.tolist(), cells.data.tolist()):
+            if flags[primary_key] and i not in indices[primary_key]:
+                continue
+            if flags[secondary_key] and j not in indices[secondary_key]:
+                continue
+            table.append({primary_key: primary_terms[i], secondary_key: secondary_terms[j], 'value': count})
+
+        if self.mode == "enable_others" and (flags[primary_key] or flags[secondary_key]):
+            table.extend(self.render_others(counted_messages(dataset), domains,
+                                            flags[primary_key], flags[secondary_key]))
+
+        return {
+            'table': table,
+            'domains': domains,
+            'domain_labels': {}
+        }
+
     def render_others(self, queryset, domains, primary_flag, secondary_flag, desired_primary_bins=None, desired_secondary_bins=None):
         """
         Given a set of messages (already filtered as necessary),
@@ -335,7 +511,8 @@ class DataTable(object):
 
         return match_domain, match_labels
 
-    def generate(self, dataset, filters=None, exclude=None, page_size=100, page=None, search_key=None, groups=None):
+    def generate(self, dataset, filters=None, exclude=None, page_size=100, page=None, search_key=None, groups=None,
+                 collapse_duplicates=False):
         """
         Generate a complete data group table response.
 
@@ -346,18 +523,22 @@ class DataTable(object):
         It also includes 'domains', which provides, for both
         primary and secondary dimensions, the levels of the
         dimension irrespective of filters (except on those actual dimensions).
+
+        With ``collapse_duplicates``, each cluster of near-duplicate messages
+        is counted once (see :mod:`msgvis.apps.enhance.duplicates`).
         """
 
         if (groups is None):
-            queryset = dataset.message_set.all()
+            if not collapse_duplicates:
+                result = self.generate_from_timeline(dataset, filters, exclude, page)
+                if result is None:
+                    result = self.generate_from_cooccurrence(dataset, filters, exclude)
+                if result is not None:
+                    return result
 
-            # Filter out null time
-            queryset = queryset.exclude(time__isnull=True)
-            if dataset.start_time and dataset.end_time:
-                range = dataset.end_time - dataset.start_time
-                buffer = timedelta(seconds=range.total_seconds() * 0.1)
-                queryset = queryset.filter(time__gte=dataset.start_time - buffer,
-                                           time__lte=dataset.end_time + buffer)
+            queryset = counted_messages(dataset)
+            if collapse_duplicates:
+                queryset = utils.collapse_duplicates(queryset)
 
             unfiltered_queryset = queryset
 
@@ -488,13 +669,9 @@ class DataTable(object):
             primary_exclude = None
             secondary_exclude = None
 
-            queryset = dataset.message_set.all()
-            queryset = queryset.exclude(time__isnull=True)
-            if dataset.start_time and dataset.end_time:
-                range = dataset.end_time - dataset.start_time
-                buffer = timedelta(seconds=range.total_seconds() * 0.1)
-                queryset = queryset.filter(time__gte=dataset.start_time - buffer,
-                                           time__lte=dataset.end_time + buffer)
+            queryset = counted_messages(dataset)
+            if collapse_duplicates:
+                queryset = utils.collapse_duplicates(queryset)
             if filters is not None:
                 for filter in filters:
                     dimension = filter['dimension']
@@ -529,16 +706,9 @@ class DataTable(object):
                     group_labels.append("#%d %s"%(group_obj.order, group_obj.name))
                 else:
                     group_labels.append("%s"%(group_obj.name))
-                queryset = group_obj.messages
-
-
-                # Filter out null time
-                queryset = queryset.exclude(time__isnull=True)
-                if dataset.start_time and dataset.end_time:
-                    range = dataset.end_time - dataset.start_time
-                    buffer = timedelta(seconds=range.total_seconds() * 0.1)
-                    queryset = queryset.filter(time__gte=dataset.start_time - buffer,
-                                               time__lte=dataset.end_time + buffer)
+                queryset = counted_messages(dataset, group_obj.messages)
+                if collapse_duplicates:
+                    queryset = utils.collapse_duplicates(queryset)
 
                 unfiltered_queryset = queryset
 
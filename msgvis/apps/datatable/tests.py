@@ -575,3 +575,190 @@ class GenerateDataTableTest(DistributionTestCaseMixins, TestCase):
         datatable = MockDataTable(primary_dimension='time')
         datatable.generate(dataset)
         self.assertEquals(len(render_calls), 1)
+
+
+class TermTimelineTest(TestCase):
+    def setUp(self):
+        from msgvis.apps.enhance.models import TweetWord
+
+        base_time = tz.datetime(2012, 5, 2, 20, 10, 2, 0)
+        if settings.USE_TZ:
+            base_time = base_time.replace(tzinfo=tz.utc)
+
+        self.dataset = corpus_models.Dataset.objects.create(name="Timeline", description="Timeline",
+                                                            start_time=base_time,
+                                                            end_time=base_time + tz.timedelta(days=3))
+        words = [TweetWord.objects.create(dataset=self.dataset, original_text="w%d" % i, pos="N", text="w%d" % i)
+                 for i in xrange(12)]
+        # the same text as another part of speech
+        verb = TweetWord.objects.create(dataset=self.dataset, original_text="w0", pos="V", text="w0")
+
+        for i in xrange(200):
+            message = self.dataset.message_set.create(text="Message %d" % i,
+                                                      time=base_time + tz.timedelta(minutes=(i * 7919) % 4320))
+            for j, word in enumerate(words):
+                if i % (j + 2) == 0:
+                    word.messages.add(message)
+            if i % 10 == 0:
+                verb.messages.add(message)
+
+        self.words = registry.get_dimension('words')
+
+    def normalized(self, result):
+        table = sorted(sorted(row.items()) for row in result['table'])
+        return table, result['domains'], result['domain_labels']
+
+    def assertSameTables(self, datatable, **kwargs):
+        from msgvis.apps.enhance.models import TermTimeline
+        from msgvis.apps.enhance.tasks import build_term_timeline
+
+        expected = self.normalized(datatable.generate(self.dataset, **kwargs))
+        self.assertIsNone(datatable.generate_from_timeline(self.dataset, kwargs.get('filters')))
+
+        if TermTimeline.get_current(self.dataset) is None:
+            build_term_timeline(self.dataset.id)
+        self.assertIsNotNone(datatable.generate_from_timeline(self.dataset, kwargs.get('filters')))
+        self.assertEquals(self.normalized(datatable.generate(self.dataset, **kwargs)), expected)
+
+        TermTimeline.objects.all().update(dataset_version=-1)
+
+    def test_words_by_time(self):
+        for dimensions in (('words', 'time'), ('time', 'words')):
+            for mode in ("default", "omit_others", "enable_others"):
+                datatable = models.DataTable(*dimensions)
+                datatable.set_mode(mode)
+                self.assertSameTables(datatable)
+
+    def test_time_filtered_by_words(self):
+        datatable = models.DataTable('time')
+        self.assertSameTables(datatable, filters=[{'dimension': self.words, 'levels': ['w0', 'w3', 'w3']}])
+        self.assertSameTables(datatable, filters=[{'dimension': self.words, 'value': 'w11'}])
+        self.assertSameTables(datatable, filters=[{'dimension': self.words, 'value': 'nothing'}])
+
+    def test_unsupported_tables(self):
+        from msgvis.apps.enhance.tasks import build_term_timeline
+
+        build_term_timeline(self.dataset.id)
+        datatable = models.DataTable('time')
+        self.assertIsNotNone(datatable.generate_from_timeline(self.dataset, [{'dimension': self.words,
+                                                                              'levels': ['w1']}]))
+        self.assertIsNone(datatable.generate_from_timeline(self.dataset, [{'dimension': self.words,
+                                                                           'levels': ['w1', '']}]))
+        self.assertIsNone(datatable.generate_from_timeline(self.dataset, [{'dimension': self.words,
+                                                                           'levels': ['w1']}], page=1))
+        self.assertIsNone(models.DataTable('words').generate_from_timeline(self.dataset))
+        self.assertIsNone(models.DataTable('words', 'time').generate_from_timeline(
+            self.dataset, exclude=[{'dimension': self.words, 'levels': ['w1']}]))
+
+    def test_rebuild_replaces_timeline(self):
+        from msgvis.apps.enhance.tasks import build_term_timeline
+
+        first = build_term_timeline(self.dataset.id)
+        base_bins = first.bins.filter(bin_size=60).count()
+        self.dataset.version += 1
+        self.dataset.save()
+        self.assertIsNone(models.DataTable('words', 'time').generate_from_timeline(self.dataset))
+
+        second = build_term_timeline(self.dataset.id)
+        self.assertEquals(list(self.dataset.term_timelines.values_list('id', flat=True)), [second.id])
+        self.assertEquals(second.bins.filter(bin_size=60).count(), base_bins)
+        for bin_size in second.bin_sizes:
+            self.assertEquals(sum(second.bins.filter(bin_size=bin_size).values_list('count', flat=True)),
+                              sum(second.bins.filter(bin_size=60).values_list('count', flat=True)))
+
+
+    def test_base_bin_size_that_is_not_a_step(self):
+        from msgvis.apps.enhance.models import TermTimeline
+        from msgvis.apps.enhance.tasks import build_term_timeline
+
+        datatable = models.DataTable('words', 'time')
+        expected = self.normalized(datatable.generate(self.dataset))
+
+        timeline = build_term_timeline(self.dataset.id, base_bin_size=120)
+        self.assertNotIn(120, timeline.bin_sizes)
+        self.assertFalse(timeline.bins.filter(bin_size=120).exists())
+        total = sum(TermTimeline.get_current(self.dataset).bins.filter(bin_size=timeline.bin_sizes[-1])
+                    .values_list('count', flat=True))
+        for bin_size in timeline.bin_sizes:
+            self.assertEquals(sum(timeline.bins.filter(bin_size=bin_size).values_list('count', flat=True)), total)
+
+        self.assertIsNotNone(datatable.generate_from_timeline(self.dataset))
+        self.assertEquals(self.normalized(datatable.generate(self.dataset)), expected)
+
+
+class CooccurrenceTableTest(TestCase):
+    def setUp(self):
+        from msgvis.apps.enhance.models import TweetWord
+
+        base_time = tz.datetime(2012, 5, 2, 20, 10, 2, 0)
+        if settings.USE_TZ:
+            base_time = base_time.replace(tzinfo=tz.utc)
+
+        self.dataset = corpus_models.Dataset.objects.create(name="Cooccurrence", description="Cooccurrence",
+                                                            start_time=base_time,
+                                                            end_time=base_time + tz.timedelta(days=1))
+        words = [TweetWord.objects.create(dataset=self.dataset, original_text="w%d" % i, pos="N", text="w%d" % i)
+                 for i in xrange(12)]
+        # the same text as another part of speech
+        verb = TweetWord.objects.create(dataset=self.dataset, original_text="w0", pos="V", text="w0")
+        hashtags = [corpus_models.Hashtag.objects.create(text="h%d" % i) for i in xrange(13)]
+        people = [corpus_models.Person.objects.create(dataset=self.dataset, username="p%d" % i)
+                  for i in xrange(3)]
+
+        for i in xrange(300):
+            message = self.dataset.message_set.create(text="Message %d" % i,
+                                                      time=base_time + tz.timedelta(minutes=i))
+            for j, word in enumerate(words):
+                if i % (j + 2) == 0:
+                    word.messages.add(message)
+            if i % 10 == 0:
+                verb.messages.add(message)
+            message.hashtags = [hashtag for j, hashtag in enumerate(hashtags) if i % (j + 3) == 1]
+            message.mentions = [person for j, person in enumerate(people) if i % (j + 4) == 2]
+
+        # not counted by tables
+        self.dataset.message_set.create(text="No time")
+
+    def tearDown(self):
+        from msgvis.apps.enhance.cooccurrence import CooccurrenceMatrix
+        CooccurrenceMatrix.delete(self.dataset.id)
+
+    def normalized(self, result):
+        table = sorted(sorted(row.items()) for row in result['table'])
+        return table, result['domains'], result['domain_labels']
+
+    def test_same_tables(self):
+        from msgvis.apps.enhance.cooccurrence import CooccurrenceMatrix
+
+        pairs = (('words', 'hashtags'), ('hashtags', 'words'), ('words', 'mentions'), ('mentions', 'hashtags'))
+        expected = {}
+        for dimensions in pairs:
+            for mode in ("default", "omit_others", "enable_others"):
+                datatable = models.DataTable(*dimensions)
+                datatable.set_mode(mode)
+                self.assertIsNone(datatable.generate_from_cooccurrence(self.dataset))
+                expected[dimensions, mode] = self.normalized(datatable.generate(self.dataset))
+
+        CooccurrenceMatrix.build(self.dataset)
+        for (dimensions, mode), table in expected.iteritems():
+            datatable = models.DataTable(*dimensions)
+            datatable.set_mode(mode)
+            self.assertIsNotNone(datatable.generate_from_cooccurrence(self.dataset))
+            self.assertEquals(self.normalized(datatable.generate(self.dataset)), table)
+
+    def test_unsupported_tables(self):
+        from msgvis.apps.enhance.cooccurrence import CooccurrenceMatrix
+
+        CooccurrenceMatrix.build(self.dataset)
+        hashtags = registry.get_dimension('hashtags')
+        self.assertIsNotNone(models.DataTable('words', 'hashtags').generate_from_cooccurrence(self.dataset))
+        self.assertIsNone(models.DataTable('words', 'hashtags').generate_from_cooccurrence(
+            self.dataset, [{'dimension': hashtags, 'levels': ['h1']}]))
+        self.assertIsNone(models.DataTable('words', 'words').generate_from_cooccurrence(self.dataset))
+        self.assertIsNone(models.DataTable('words', 'time').generate_from_cooccurrence(self.dataset))
+        self.assertIsNone(models.DataTable('hashtags').generate_from_cooccurrence(self.dataset))
+
+        # until it is built again
+        self.dataset.version += 1
+        self.dataset.save()
+        self.assertIsNone(models.DataTable('words', 'hashtags').generate_from_cooccurrence(self.dataset))
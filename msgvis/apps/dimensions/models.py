@@ -529,6 +529,12 @@ class TimeDimension(QuantitativeDimension):
         'sqlite': r"DATETIME({bin_size} * CAST(STRFTIME('%%s', `{field_name}`) / {bin_size} AS INTEGER), 'unixepoch')"
     }
 
+    # The same bins as unix timestamps (the left side of each bin)
+    bin_start_expressions = {
+        'mysql': r"{bin_size} * FLOOR(UNIX_TIMESTAMP(`{field_name}`) / {bin_size})",
+        'sqlite': r"{bin_size} * CAST(STRFTIME('%%s', `{field_name}`) / {bin_size} AS INTEGER)"
+    }
+
     # A range of human-friendly time bin sizes
     # https://github.com/mbostock/d3/blob/master/src/time/scale.js
     # NOTE: these are in milliseconds! (JS uses millis)
@@ -605,6 +611,17 @@ class TimeDimension(QuantitativeDimension):
         else:
             return dt
 
+    def grouped_value(self, bin_start):
+        """
+        The value the grouping expression gives for the bin starting at
+        the unix timestamp ``bin_start``.
+        """
+        dt = datetime.utcfromtimestamp(bin_start)
+        if db_vendor() == 'sqlite':
+            # DATETIME() returns a string
+            return dt.strftime('%Y-%m-%d %H:%M:%S')
+        return dt
+
     def _iter_xrange(self, min, max, step):
         step = timedelta(seconds=step)
         max = max + step # bin values are the left side of each bin so we need an extra on the right
@@ -76,8 +76,8 @@ register(models.RelatedCategoricalDimension, dict(
 register(models.RelatedCategoricalDimension, dict(
     key='topics',
     name='Topic',
-    description='Topics found in the message.',
-    field_name='topics__name',
+    description='The most likely topic of the message.',
+    field_name='dominant_topic__name',
 ))
 
 register(models.TextDimension, dict(
@@ -148,6 +148,13 @@ register(models.ChoicesCategoricalDimension, dict(
     description='The sentiment of the message',
     field_name='sentiment',
 ))
+
+register(models.CategoricalDimension, dict(
+    key='duplicate_cluster',
+    name='Duplicate Cluster',
+    description='The group of near-duplicate messages (such as retweets) the message belongs to',
+    field_name='duplicate_cluster',
+))
 # END META DIMENSIONS
 
 # BEGIN INTERACTIONS DIMENSIONS
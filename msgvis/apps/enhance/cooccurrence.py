@@ -0,0 +1,306 @@
+"""
+How often words, hashtags and mentions appear in the same messages.
+
+For each kind of term, the messages of a dataset (the ones ``DataTable``
+counts) and their terms make a sparse incidence matrix ``A`` with a row
+per message and a column per term, counting the links between them. An
+extra ``None`` term stands for messages with none of that kind. The
+co-occurrence of two kinds is then the sparse product ``A.T * B``, so:
+
+- ``words`` by ``hashtags`` (or ``mentions``) tables are the nonzero
+  cells of a matrix, instead of a query that multiplies two
+  many-to-many joins
+- the terms related to a term are the nonzero cells of its row
+
+The matrices are saved per dataset under ``COOCCURRENCE_ROOT``:
+
+.. code-block :: text
+
+    cooccurrence/
+        dataset_3/
+            meta.json                       what it was built from, and array lengths
+            words.json                      the terms of each kind, in matrix order
+            words.counts.bin                how many times each term appears
+            words_hashtags.indptr.bin       the co-occurrence of each pair of kinds,
+            words_hashtags.indices.bin      as a compressed sparse row matrix
+            words_hashtags.data.bin
+            ...
+
+and memory-mapped when they are read. Like term timelines, they are only
+used while the dataset (with the same creation time, in case its id was
+reused) has the version and time range they were built from, and linking
+new tweet words deletes them.
+"""
+import json
+import logging
+import shutil
+from datetime import datetime
+from time import time
+
+from django.conf import settings
+from django.db import connection
+
+from msgvis.apps.enhance.tasks import MemoryMappedArrays
+
+logger = logging.getLogger(__name__)
+
+# dimension keys, with the through table of each and the term's field on it
+KINDS = ('words', 'hashtags', 'mentions')
+
+
+def _links(kind, dataset):
+    """``(message id, term)`` for each link between the dataset's messages and terms of a kind."""
+    from msgvis.apps.corpus.models import Message
+    from msgvis.apps.enhance.models import TweetWord
+
+    through, field = {
+        'words': (TweetWord.messages.through, 'tweetword__text'),
+        'hashtags': (Message.hashtags.through, 'hashtag__text'),
+        'mentions': (Message.mentions.through, 'person__username'),
+    }[kind]
+    return through.objects.filter(message__dataset=dataset).values_list('message_id', field)
+
+
+def _dtypes():
+    dtypes = {}
+    for a in KINDS:
+        dtypes['%s.counts' % a] = 'int64'
+        for b in KINDS:
+            dtypes['%s_%s.indptr' % (a, b)] = 'int64'
+            dtypes['%s_%s.indices' % (a, b)] = 'int32'
+            dtypes['%s_%s.data' % (a, b)] = 'int32'
+    return dtypes
+
+
+class CooccurrenceMatrix(MemoryMappedArrays):
+    """The co-occurrence of the words, hashtags and mentions of a dataset's messages."""
+    dtypes = _dtypes()
+
+    _loaded = {}
+
+    def __init__(self, path):
+        super(CooccurrenceMatrix, self).__init__(path)
+        self._terms = {}
+        self._index = {}
+        self._levels = {}
+
+        # MySQL compares strings case-insensitively
+        self.fold = connection.vendor == 'mysql'
+
+    @classmethod
+    def get_path(cls, dataset_id):
+        return settings.COOCCURRENCE_ROOT / ('dataset_%d' % dataset_id)
+
+    @classmethod
+    def get_signature(cls, dataset):
+        """What the matrices depend on: the dataset's version and time range."""
+        return {
+            'dataset': dataset.id,
+            'created_at': dataset.created_at.isoformat(),
+            'version': dataset.version,
+            'start_time': dataset.start_time.isoformat() if dataset.start_time else None,
+            'end_time': dataset.end_time.isoformat() if dataset.end_time else None,
+        }
+
+    @classmethod
+    def for_dataset(cls, dataset):
+        """
+        The dataset's matrices if they are up to date, else None. They stay
+        loaded in this process until they are built again.
+        """
+        matrix = cls(cls.get_path(dataset.id))
+        if not matrix.exists() or matrix.meta['signature'] != cls.get_signature(dataset):
+            return None
+
+        loaded = cls._loaded.get(dataset.id)
+        if loaded is not None and loaded.meta['built_at'] == matrix.meta['built_at']:
+            return loaded
+        cls._loaded[dataset.id] = matrix
+        return matrix
+
+    @classmethod
+    def delete(cls, dataset_id):
+        cls._loaded.pop(dataset_id, None)
+        path = cls.get_path(dataset_id)
+        if path.exists():
+            shutil.rmtree(path)
+
+    @classmethod
+    def build(cls, dataset):
+        """Count the co-occurrence of the dataset's terms and save it, replacing any saved before."""
+        import numpy
+        from scipy.sparse import coo_matrix
+        from msgvis.apps.datatable.models import counted_messages
+
+        start = time()
+        rows = {}
+        for message_id in counted_messages(dataset).order_by('id').values_list('id', flat=True).iterator():
+            rows[message_id] = len(rows)
+
+        fold = connection.vendor == 'mysql'
+        incidence = {}
+        terms = {}
+        for kind in KINDS:
+            index = {}
+            terms[kind] = []
+            message_rows = []
+            term_columns = []
+            for message_id, term in _links(kind, dataset).iterator():
+                row = rows.get(message_id)
+                if row is None:
+                    continue
+                key = term.lower() if fold and term is not None else term
+                if key not in index:
+                    index[key] = len(terms[kind])
+                    terms[kind].append(term)
+                message_rows.append(row)
+                term_columns.append(index[key])
+
+            # messages without any term of this kind
+            linked = numpy.zeros(len(rows), dtype=bool)
+            linked[message_rows] = True
+            unlinked = numpy.flatnonzero(~linked)
+            if len(unlinked):
+                if None not in index:
+                    index[None] = len(terms[kind])
+                    terms[kind].append(None)
+                message_rows.extend(unlinked.tolist())
+                term_columns.extend([index[None]] * len(unlinked))
+
+            # duplicate links add up, like the rows of a join
+            incidence[kind] = coo_matrix((numpy.ones(len(message_rows), dtype='int32'),
+                                          (message_rows, term_columns)),
+                                         shape=(len(rows), len(terms[kind]))).tocsr()
+
+        lengths = {}
+        with cls._building(cls.get_path(dataset.id)) as temp_path:
+            def write(name, values):
+                values = numpy.ascontiguousarray(values, dtype=cls.dtypes[name])
+                values.tofile(temp_path / (name + '.bin'))
+                lengths[name] = len(values)
+
+            for a in KINDS:
+                with open(temp_path / ('%s.json' % a), 'wb') as fp:
+                    json.dump(terms[a], fp)
+                write('%s.counts' % a, numpy.asarray(incidence[a].sum(axis=0)).ravel())
+
+                for b in KINDS:
+                    product = (incidence[a].T * incidence[b]).tocsr()
+                    if a == b:
+                        # a term always appears with itself
+                        product.setdiag(0)
+                        product.eliminate_zeros()
+                    product.sort_indices()
+                    write('%s_%s.indptr' % (a, b), product.indptr)
+                    write('%s_%s.indices' % (a, b), product.indices)
+                    write('%s_%s.data' % (a, b), product.data)
+
+            with open(temp_path / 'meta.json', 'wb') as fp:
+                json.dump({
+                    'signature': cls.get_signature(dataset),
+                    'built_at': datetime.utcnow().isoformat(),
+                    'messages': len(rows),
+                    'num_terms': dict((kind, len(terms[kind])) for kind in KINDS),
+                    'lengths': lengths,
+                }, fp)
+
+        cls._loaded.pop(dataset.id, None)
+        logger.info("Built the co-occurrence of %d messages' terms in %.2fs" % (len(rows), time() - start))
+        return cls(cls.get_path(dataset.id))
+
+    def terms(self, kind):
+        """The terms of a kind, in matrix order."""
+        if kind not in self._terms:
+            with open(self.path / ('%s.json' % kind), 'rb') as fp:
+                self._terms[kind] = json.load(fp)
+        return self._terms[kind]
+
+    def counts(self, kind):
+        """How many times each term of a kind appears in the messages."""
+        return self._array('%s.counts' % kind)
+
+    def _key(self, term):
+        return term.lower() if self.fold and term is not None else term
+
+    def index(self, kind, term):
+        """The matrix index of a term, or None if it never appears."""
+        if kind not in self._index:
+            self._index[kind] = dict((self._key(t), i) for i, t in enumerate(self.terms(kind)))
+        return self._index[kind].get(self._key(term))
+
+    def levels(self, kind):
+        """The terms of a kind from most to least frequent."""
+        if kind not in self._levels:
+            terms = self.terms(kind)
+            counts = self.counts(kind)
+            order = sorted(xrange(len(terms)), key=lambda i: (-counts[i], terms[i]))
+            self._levels[kind] = [terms[i] for i in order]
+        return self._levels[kind]
+
+    def pair(self, a, b):
+        """The co-occurrence of the terms of kind ``a`` (rows) with those of kind ``b`` (columns)."""
+        from scipy.sparse import csr_matrix
+
+        name = '%s_%s' % (a, b)
+        return csr_matrix((self._array(name + '.data'), self._array(name + '.indices'),
+                           self._array(name + '.indptr')),
+                          shape=(self.meta['num_terms'][a], self.meta['num_terms'][b]), copy=False)
+
+    def cooccurring(self, kind, terms, other_kind):
+        """
+        The ``(index, count)`` of each term of ``other_kind`` that appears
+        with any of ``terms``, adding up the counts for each of them.
+        """
+        totals = {}
+        matrix = self.pair(kind, other_kind)
+        for term in terms:
+            i = self.index(kind, term)
+            if i is None:
+                continue
+            start, end = matrix.indptr[i], matrix.indptr[i + 1]
+            for j, count in zip(matrix.indices[start:end].tolist(), matrix.data[start:end].tolist()):
+                totals[j] = totals.get(j, 0) + count
+        return totals.items()
+
+    def related(self, kind, term, kinds=KINDS, limit=20):
+        """
+        The terms that appear with a term most often, as dictionaries with
+        their ``kind``, ``term``, ``count`` (of messages with both) and
+        ``score`` (the count relative to how common each term is).
+        """
+        import math
+
+        i = self.index(kind, term)
+        if i is None or term is None or limit < 1:
+            return []
+        frequency = float(self.counts(kind)[i])
+
+        related = []
+        for other_kind in kinds:
+            other_terms = self.terms(other_kind)
+            other_counts = self.counts(other_kind)
+            for j, count in self.cooccurring(kind, [term], other_kind):
+                if other_terms[j] is None:
+                    continue
+                related.append({
+                    'kind': other_kind,
+                    'term': other_terms[j],
+                    'count': count,
+                    'score': count / math.sqrt(frequency * other_counts[j]),
+                })
+        related.sort(key=lambda r: (-r['count'], -r['score'], r['kind'], r['term']))
+        return related[:limit]
+
+    def suggest(self, kind, context, prefix, limit=20):
+        """
+        Terms of a kind that start with ``prefix``, ordered by how often they
+        appear with the ``context`` terms of the same kind.
+        """
+        terms = self.terms(kind)
+        prefix = prefix.lower()
+        context_keys = set(self._key(term) for term in context)
+        matches = [(count, terms[j]) for j, count in self.cooccurring(kind, context, kind)
+                   if terms[j] is not None and terms[j].lower().startswith(prefix) and
+                   self._key(terms[j]) not in context_keys]
+        matches.sort(key=lambda match: (-match[0], match[1]))
+        return [term for count, term in matches[:limit]]
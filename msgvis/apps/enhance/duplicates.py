@@ -0,0 +1,205 @@
+"""
+Grouping a dataset's near-duplicate messages, such as retweets and spam.
+
+Every message gets a MinHash signature of its shingles: the runs of
+``shingle_size`` words in its text, leaving out a leading ``RT @user:``
+and urls. The fraction of equal values in two signatures estimates how
+similar the two messages' shingles are (their Jaccard similarity).
+Comparing every pair of signatures would take quadratic time, so
+locality-sensitive hashing finds the candidates instead:
+
+.. code-block :: text
+
+    signature    | band 0 | band 1 | ... | band 15 |     num_perm values in bands of rows
+                     |
+    band hash    messages with the same values in a band are sorted together,
+                     |
+    candidates   and each of them is compared to the first of them
+                     |
+    clusters     the connected components of the pairs at least ``threshold`` similar
+
+That takes time roughly linear in the number of messages: a sort per band,
+and at most one comparison per message per band. The signatures are kept
+in memory while clustering, ``4 * num_perm`` bytes per message.
+
+Each message in a cluster stores the id of the cluster's first message in
+:attr:`msgvis.apps.corpus.models.Message.duplicate_cluster`, which is None
+for the others. Messages ingested later have no cluster until this runs again.
+"""
+import logging
+import re
+import zlib
+from time import time
+
+logger = logging.getLogger(__name__)
+
+# a prime larger than any shingle hash, for the permutations
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+RETWEET_PREFIX = re.compile(r'^\s*rt\s+@\w+:?\s*', re.IGNORECASE | re.UNICODE)
+URL = re.compile(r'https?://\S+', re.IGNORECASE)
+TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def shingles(text, shingle_size=3):
+    """The runs of ``shingle_size`` words in a message, or all of its words if it has fewer."""
+    text = URL.sub(u' ', RETWEET_PREFIX.sub(u'', text or u'')).lower()
+    tokens = TOKEN.findall(text)
+    if len(tokens) <= shingle_size:
+        return [u' '.join(tokens)] if tokens else []
+    return [u' '.join(tokens[i:i + shingle_size]) for i in xrange(len(tokens) - shingle_size + 1)]
+
+
+class MinHasher(object):
+    """Computes the MinHash signatures of many messages at once."""
+
+    def __init__(self, num_perm=64, shingle_size=3, seed=1):
+        import numpy
+
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        random = numpy.random.RandomState(seed)
+        self.a = random.randint(1, MERSENNE_PRIME, size=num_perm, dtype=numpy.uint64)
+        self.b = random.randint(0, MERSENNE_PRIME, size=num_perm, dtype=numpy.uint64)
+
+    def signatures(self, texts):
+        """
+        The signatures of the texts as rows of a ``uint32`` array, and a mask
+        of the texts that had any shingles (the others have no row).
+        """
+        import numpy
+
+        hashes = []
+        starts = []
+        has_shingles = numpy.zeros(len(texts), dtype=bool)
+        for i, text in enumerate(texts):
+            text_shingles = set(shingles(text, self.shingle_size))
+            if text_shingles:
+                has_shingles[i] = True
+                starts.append(len(hashes))
+                hashes.extend(zlib.crc32(shingle.encode('utf-8')) & MAX_HASH for shingle in text_shingles)
+
+        if not starts:
+            return numpy.zeros((0, self.num_perm), dtype=numpy.uint32), has_shingles
+
+        # each row is a permutation of the shingle hashes; the products wrap like the usual implementations
+        hashes = numpy.array(hashes, dtype=numpy.uint64)
+        permuted = (self.a[:, None] * hashes[None, :] + self.b[:, None]) % MERSENNE_PRIME & MAX_HASH
+        signatures = numpy.minimum.reduceat(permuted, starts, axis=1).T
+        return numpy.ascontiguousarray(signatures, dtype=numpy.uint32), has_shingles
+
+
+def cluster_signatures(signatures, bands=16, threshold=0.7, chunk_size=100000):
+    """
+    The cluster of each row of ``signatures``, as the index of the first
+    row in it, and the number of rows in the cluster.
+    """
+    import numpy
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    n, num_perm = signatures.shape
+    if num_perm % bands != 0:
+        raise ValueError("The number of permutations (%d) must be a multiple of the bands (%d)" % (num_perm, bands))
+    rows_per_band = num_perm / bands
+
+    multipliers = numpy.random.RandomState(0).randint(1, MERSENNE_PRIME, size=rows_per_band, dtype=numpy.uint64)
+    positions = numpy.arange(n)
+    pairs_a = []
+    pairs_b = []
+    for band in xrange(bands):
+        values = signatures[:, band * rows_per_band:(band + 1) * rows_per_band].astype(numpy.uint64)
+        keys = (values * multipliers).sum(axis=1)
+
+        # a stable sort keeps the rows of each bucket in order, so the first is the smallest
+        order = numpy.argsort(keys, kind='mergesort')
+        sorted_keys = keys[order]
+        bucket_starts = numpy.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1]))
+        firsts = order[numpy.maximum.accumulate(numpy.where(bucket_starts, positions, 0))]
+        candidates = firsts != order
+        rows, firsts = order[candidates], firsts[candidates]
+
+        # band hashes can collide, and similar bands don't make similar messages
+        for start in xrange(0, len(rows), chunk_size):
+            a, b = rows[start:start + chunk_size], firsts[start:start + chunk_size]
+            similar = (signatures[a] == signatures[b]).mean(axis=1) >= threshold
+            pairs_a.append(a[similar])
+            pairs_b.append(b[similar])
+
+    if pairs_a:
+        pairs_a = numpy.concatenate(pairs_a)
+        pairs_b = numpy.concatenate(pairs_b)
+    else:
+        pairs_a = pairs_b = numpy.zeros(0, dtype=numpy.int64)
+    graph = coo_matrix((numpy.ones(len(pairs_a), dtype=numpy.int8), (pairs_a, pairs_b)), shape=(n, n))
+    num_clusters, labels = connected_components(graph, directed=False)
+
+    firsts = numpy.full(num_clusters, n, dtype=numpy.int64)
+    numpy.minimum.at(firsts, labels, positions)
+    sizes = numpy.bincount(labels, minlength=num_clusters)
+    return firsts[labels], sizes[labels]
+
+
+def find_duplicate_clusters(dataset_id, threshold=0.7, num_perm=64, bands=16, shingle_size=3, batch_size=5000):
+    """
+    Group a dataset's near-duplicate messages and save the cluster of each
+    message. ``bands`` of ``num_perm / bands`` rows find messages that are
+    about ``(1 / bands) ** (bands / num_perm)`` similar, which are then
+    kept if their signatures are at least ``threshold`` similar.
+
+    Only the clusters that changed are written, with ``UPDATE ... CASE``
+    statements. The dataset's precalculated ``duplicate_cluster``
+    distribution, if any, is rebuilt. Returns the number of clusters, the
+    number of messages in them, and the number of messages changed.
+    """
+    import numpy
+    from django.db import transaction
+    from msgvis.apps.corpus.models import Dataset, Message
+    from msgvis.apps.enhance.parallel import keyset_pages
+    from msgvis.apps.enhance.tasks import build_categorical_distribution
+    from msgvis.apps.importer.counters import update_with_case
+
+    start = time()
+    dataset = Dataset.objects.get(id=dataset_id)
+    hasher = MinHasher(num_perm=num_perm, shingle_size=shingle_size)
+
+    ids = []
+    current = []
+    signatures = []
+    hashed_ids = []
+    messages = Message.objects.filter(dataset=dataset).only('id', 'text', 'duplicate_cluster')
+    for page in keyset_pages(messages, batch_size):
+        page_ids = numpy.array([msg.id for msg in page], dtype=numpy.int64)
+        page_signatures, has_shingles = hasher.signatures([msg.text for msg in page])
+        ids.append(page_ids)
+        current.extend(msg.duplicate_cluster for msg in page)
+        signatures.append(page_signatures)
+        hashed_ids.append(page_ids[has_shingles])
+    logger.info("Hashed %d messages in %.2fs" % (len(current), time() - start))
+
+    all_ids = numpy.concatenate(ids).tolist() if ids else []
+    clusters = dict.fromkeys(all_ids)
+    num_clusters = 0
+    clustered = 0
+    if signatures:
+        hashed_ids = numpy.concatenate(hashed_ids)
+        firsts, sizes = cluster_signatures(numpy.concatenate(signatures), bands=bands, threshold=threshold)
+        duplicated = sizes > 1
+        clustered = int(duplicated.sum())
+        num_clusters = int((duplicated & (firsts == numpy.arange(len(firsts)))).sum())
+        clusters.update(zip(hashed_ids[duplicated].tolist(), hashed_ids[firsts[duplicated]].tolist()))
+
+    updates = dict((message_id, clusters[message_id]) for message_id, was in zip(all_ids, current)
+                   if clusters[message_id] != was)
+    items = updates.items()
+    for i in xrange(0, len(items), batch_size):
+        with transaction.atomic():
+            update_with_case(Message, 'duplicate_cluster', dict(items[i:i + batch_size]))
+
+    if updates and dataset.distributions.filter(dimension_key='duplicate_cluster').exists():
+        build_categorical_distribution(dataset.id, 'duplicate_cluster')
+
+    logger.info("Found %d clusters of %d messages in %.2fs, %d changed" % (
+        num_clusters, clustered, time() - start, len(updates)))
+    return num_clusters, clustered, len(updates)
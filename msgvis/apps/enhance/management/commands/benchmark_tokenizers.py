@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, make_option, CommandError
+from time import time
+
+
+class Command(BaseCommand):
+    """
+    Tokenize the messages of a dataset with :class:`msgvis.apps.enhance.tasks.SimpleTokenizer`
+    and :class:`msgvis.apps.enhance.tasks.RegexTokenizer`, using the filters of
+    the default topic context, and compare their speed and words:
+
+    .. code-block :: bash
+
+        $ python manage.py benchmark_tokenizers <dataset id> --limit 100000
+
+    """
+    help = "Compare the speed and words of the topic modeling tokenizers."
+    args = "<dataset id>"
+    option_list = BaseCommand.option_list + (
+        make_option('--limit',
+                    dest='limit',
+                    default=100000,
+                    help='The number of messages to tokenize'),
+    )
+
+    def handle(self, dataset_id=None, *args, **options):
+        if not dataset_id:
+            raise CommandError("Dataset id is required.")
+        try:
+            dataset_id = int(dataset_id)
+        except ValueError:
+            raise CommandError("Dataset id must be a number.")
+
+        from msgvis.apps.enhance.tasks import default_topic_context, SimpleTokenizer, RegexTokenizer
+
+        context = default_topic_context("benchmark", dataset_id=dataset_id)
+        texts = list(context.queryset.order_by('id').values_list('text', flat=True)[:int(options.get('limit'))])
+        texts = [text for text in texts if text is not None]
+        print "Tokenizing %d messages" % len(texts)
+
+        results = {}
+        for tokenizer_class in (SimpleTokenizer, RegexTokenizer):
+            tokenizer = tokenizer_class(None, *context.filters)
+            start = time()
+            results[tokenizer_class] = [tokenizer.tokenize(text) for text in texts]
+            seconds = time() - start
+            print "%s: %.2fs (%.0f messages/s)" % (tokenizer_class.__name__, seconds,
+                                                  len(texts) / seconds if seconds else 0)
+
+        different = sum(1 for simple, regex in zip(results[SimpleTokenizer], results[RegexTokenizer])
+                        if simple != regex)
+        print "%d messages tokenized differently" % different
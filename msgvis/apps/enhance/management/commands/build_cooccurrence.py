@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    """
+    Count how often the words, hashtags and mentions of a dataset's messages
+    appear together, for related terms, search suggestions and tables of
+    one kind of term by another:
+
+    .. code-block :: bash
+
+        $ python manage.py build_cooccurrence <dataset id>
+
+    Run it again after the tweet parser links new words, or after new
+    messages are ingested; until then, they are queried as usual.
+    """
+    help = "Precalculate the co-occurrence of a dataset's words, hashtags and mentions."
+    args = "<dataset id>"
+
+    def handle(self, dataset_id=None, *args, **options):
+        if not dataset_id:
+            raise CommandError("Dataset id is required.")
+        try:
+            dataset_id = int(dataset_id)
+        except ValueError:
+            raise CommandError("Dataset id must be a number.")
+
+        from msgvis.apps.corpus.models import Dataset
+        from msgvis.apps.enhance.cooccurrence import CooccurrenceMatrix, KINDS
+
+        try:
+            dataset = Dataset.objects.get(id=dataset_id)
+        except Dataset.DoesNotExist:
+            raise CommandError("Dataset %d does not exist." % dataset_id)
+
+        matrix = CooccurrenceMatrix.build(dataset)
+        print "Built the co-occurrence of %d messages: %s" % (
+            matrix.meta['messages'],
+            ", ".join("%d %s" % (matrix.meta['num_terms'][kind], kind) for kind in KINDS))
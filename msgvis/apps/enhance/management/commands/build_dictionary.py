@@ -12,11 +12,21 @@ class Command(BaseCommand):
                     dest='name',
                     default='my topic model',
                     help="The name for your keyword dictionary"),
+        make_option('--workers',
+                    dest='workers',
+                    default=0,
+                    help='The number of processes to tokenize with'),
+        make_option('--no-token-cache',
+                    action='store_false',
+                    dest='use_token_cache',
+                    default=True,
+                    help='Tokenize the messages again instead of using the token cache'),
     )
 
     def handle(self, dataset_id, *args, **options):
         num_topics = options.get('num_topics')
         name = options.get('name')
+        workers = int(options.get('workers'))
 
         if not dataset_id:
             raise CommandError("Dataset id is required.")
@@ -28,9 +38,10 @@ class Command(BaseCommand):
         from msgvis.apps.enhance.tasks import default_topic_context, standard_topic_pipeline
 
         context = default_topic_context(name, dataset_id=dataset_id)
+        context.use_token_cache = options.get('use_token_cache')
         dictionary = context.find_dictionary()
         if dictionary is None:
-            dictionary = context.build_dictionary(dataset_id=dataset_id)
+            dictionary = context.build_dictionary(dataset_id=dataset_id, workers=workers)
 
         if not context.bows_exist(dictionary):
             context.build_bows(dictionary)
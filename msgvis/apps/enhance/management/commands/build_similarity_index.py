@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    """
+    Index the tf-idf vectors of a dictionary's messages so that the messages
+    most like a message can be looked up (``/api/similar``):
+
+    .. code-block :: bash
+
+        $ python manage.py build_similarity_index <dictionary id>
+
+    Run it again after the dictionary's word vectors are updated; until
+    then, lookups find nothing.
+    """
+    help = "Index the tf-idf vectors of a dictionary's messages for similar-message lookups."
+    args = "<dictionary id>"
+
+    def handle(self, dictionary_id=None, *args, **options):
+        if not dictionary_id:
+            raise CommandError("Dictionary id is required.")
+        try:
+            dictionary_id = int(dictionary_id)
+        except ValueError:
+            raise CommandError("Dictionary id must be a number.")
+
+        from msgvis.apps.enhance.models import Dictionary
+        from msgvis.apps.enhance.similarity import SimilarityIndex
+
+        try:
+            dictionary = Dictionary.objects.get(id=dictionary_id)
+        except Dictionary.DoesNotExist:
+            raise CommandError("Dictionary %d does not exist." % dictionary_id)
+
+        index = SimilarityIndex.build(dictionary)
+        print "Indexed %d messages with %d words" % (len(index), index.meta['num_terms'])
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, make_option, CommandError
+
+
+class Command(BaseCommand):
+    """
+    Count the words of a dataset's messages over time, so that words by
+    time charts are answered without joining messages to their words:
+
+    .. code-block :: bash
+
+        $ python manage.py build_term_timeline <dataset id> --bin-size 60
+
+    Run it again after the tweet parser links new words, or after new
+    messages are ingested; until then, charts are queried as usual.
+    """
+    help = "Precalculate the counts of a dataset's words over time."
+    args = "<dataset id>"
+    option_list = BaseCommand.option_list + (
+        make_option('--bin-size',
+                    dest='bin_size',
+                    default=60,
+                    help='The smallest time bin to count, in seconds'),
+    )
+
+    def handle(self, dataset_id=None, *args, **options):
+        if not dataset_id:
+            raise CommandError("Dataset id is required.")
+        try:
+            dataset_id = int(dataset_id)
+        except ValueError:
+            raise CommandError("Dataset id must be a number.")
+
+        from msgvis.apps.enhance.tasks import build_term_timeline
+
+        try:
+            timeline = build_term_timeline(dataset_id, base_bin_size=int(options.get('bin_size')))
+        except ValueError as e:
+            raise CommandError(str(e))
+        print "Built term timeline %d with bins of %s seconds" % (
+            timeline.id, ", ".join(str(bin_size) for bin_size in timeline.bin_sizes))
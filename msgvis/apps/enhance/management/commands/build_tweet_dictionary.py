@@ -1,11 +1,23 @@
 from django.core.management.base import BaseCommand, make_option, CommandError
 from time import time
+import codecs
 import path
 from django.db import transaction
 
 class Command(BaseCommand):
     help = "From Tweet Parser results, extract words and connect with messages for a dataset."
     args = '<dataset_id> <parsed_filename> [...]'
+    option_list = BaseCommand.option_list + (
+        make_option('--per-message',
+                    action='store_true',
+                    dest='per_message',
+                    default=False,
+                    help='Save each message and word separately, in one transaction per file (slow)'),
+        make_option('--batch-size',
+                    dest='batch_size',
+                    default=None,
+                    help='The number of messages to link in each transaction'),
+    )
 
     def handle(self, dataset_id, *filenames, **options):
 
@@ -23,7 +35,15 @@ class Command(BaseCommand):
             if not path.path(f).exists():
                 raise CommandError("Filename %s does not exist" % f)
 
-        from msgvis.apps.enhance.tasks import import_from_tweet_parser_results
+        from msgvis.apps.enhance.tasks import import_from_tweet_parser_results, \
+            read_tweet_parser_results, TweetWordImporter
+
+        importer = None
+        if not options.get('per_message'):
+            importer = TweetWordImporter(dataset_id)
+            if options.get('batch_size'):
+                importer.batch_size = int(options.get('batch_size'))
+
         start = time()
         for i, parsed_tweet_filename in enumerate(filenames):
             if len(filenames) > 1:
@@ -31,7 +51,11 @@ class Command(BaseCommand):
             else:
                 print "Reading file %s" % parsed_tweet_filename
 
-            with transaction.atomic(savepoint=False):
-                import_from_tweet_parser_results(dataset_id, parsed_tweet_filename)
+            if importer is not None:
+                with codecs.open(parsed_tweet_filename, encoding='utf-8', mode='r') as f:
+                    importer.run(read_tweet_parser_results(f))
+            else:
+                with transaction.atomic(savepoint=False):
+                    import_from_tweet_parser_results(dataset_id, parsed_tweet_filename)
 
-        print "Time: %.2fs" % (time() - start)
\ No newline at end of file
+        print "Time: %.2fs" % (time() - start)
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, make_option, CommandError
+
+
+class Command(BaseCommand):
+    """
+    Score the sentiment of the messages in a dataset again, or of just the
+    ones without a sentiment (for example, after ``import_corpus --no-sentiment``):
+
+    .. code-block :: bash
+
+        $ python manage.py compute_sentiment <dataset id> --workers 4 --missing
+
+    """
+    help = "Score the sentiment of the messages in a dataset."
+    args = "<dataset id>"
+    option_list = BaseCommand.option_list + (
+        make_option('--workers',
+                    dest='workers',
+                    default=0,
+                    help='The number of processes to score messages with'),
+        make_option('--batch-size',
+                    dest='batch_size',
+                    default=5000,
+                    help='The number of messages to read and update at once'),
+        make_option('--missing',
+                    action='store_true',
+                    dest='missing_only',
+                    default=False,
+                    help='Only score messages without a sentiment'),
+    )
+
+    def handle(self, dataset_id=None, *args, **options):
+        if not dataset_id:
+            raise CommandError("Dataset id is required.")
+        try:
+            dataset_id = int(dataset_id)
+        except ValueError:
+            raise CommandError("Dataset id must be a number.")
+
+        from msgvis.apps.enhance.tasks import compute_sentiment
+
+        changed = compute_sentiment(dataset_id,
+                                    workers=int(options.get('workers')),
+                                    batch_size=int(options.get('batch_size')),
+                                    missing_only=options.get('missing_only'))
+        print "Changed the sentiment of %d messages" % changed
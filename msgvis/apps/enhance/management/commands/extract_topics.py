@@ -12,11 +12,29 @@ class Command(BaseCommand):
                     dest='name',
                     default='my topic model',
                     help="The name for your keyword dictionary"),
+        make_option('--workers',
+                    dest='workers',
+                    default=0,
+                    help='The number of processes to tokenize and infer topics with'),
+        make_option('--top-k',
+                    dest='top_k',
+                    default=None,
+                    help='The number of most likely topics to save for each message (default all)'),
+        make_option('--min-probability',
+                    dest='min_probability',
+                    default=0.01,
+                    help='The smallest topic probability to save'),
+        make_option('--no-token-cache',
+                    action='store_false',
+                    dest='use_token_cache',
+                    default=True,
+                    help='Tokenize the messages again instead of using the token cache'),
     )
 
     def handle(self, dataset_id, *args, **options):
         num_topics = options.get('num_topics')
         name = options.get('name')
+        workers = int(options.get('workers'))
 
         if not dataset_id:
             raise CommandError("Dataset id is required.")
@@ -28,4 +46,8 @@ class Command(BaseCommand):
         from msgvis.apps.enhance.tasks import default_topic_context, standard_topic_pipeline
 
         context = default_topic_context(name, dataset_id=dataset_id)
-        standard_topic_pipeline(context, dataset_id=dataset_id, num_topics=int(num_topics))
+        context.use_token_cache = options.get('use_token_cache')
+        top_k = options.get('top_k')
+        standard_topic_pipeline(context, dataset_id=dataset_id, num_topics=int(num_topics), workers=workers,
+                                top_k=int(top_k) if top_k else None,
+                                min_probability=float(options.get('min_probability')))
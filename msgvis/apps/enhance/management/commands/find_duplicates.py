@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, make_option, CommandError
+
+
+class Command(BaseCommand):
+    """
+    Group the near-duplicate messages of a dataset, such as retweets and
+    spam, so they can be counted and shown once:
+
+    .. code-block :: bash
+
+        $ python manage.py find_duplicates <dataset id> --threshold 0.7
+
+    Run it again after new messages are ingested; until then, they are
+    not in any cluster.
+    """
+    help = "Group the near-duplicate messages of a dataset."
+    args = "<dataset id>"
+    option_list = BaseCommand.option_list + (
+        make_option('--threshold',
+                    dest='threshold',
+                    default=0.7,
+                    help='How similar messages must be to be grouped, from 0 to 1'),
+        make_option('--num-perm',
+                    dest='num_perm',
+                    default=64,
+                    help='The number of hashes in each signature'),
+        make_option('--bands',
+                    dest='bands',
+                    default=16,
+                    help='The number of bands to split signatures into'),
+        make_option('--batch-size',
+                    dest='batch_size',
+                    default=5000,
+                    help='The number of messages to read at once'),
+    )
+
+    def handle(self, dataset_id=None, *args, **options):
+        if not dataset_id:
+            raise CommandError("Dataset id is required.")
+        try:
+            dataset_id = int(dataset_id)
+        except ValueError:
+            raise CommandError("Dataset id must be a number.")
+
+        from msgvis.apps.enhance.duplicates import find_duplicate_clusters
+
+        try:
+            clusters, clustered, changed = find_duplicate_clusters(dataset_id,
+                                                                   threshold=float(options.get('threshold')),
+                                                                   num_perm=int(options.get('num_perm')),
+                                                                   bands=int(options.get('bands')),
+                                                                   batch_size=int(options.get('batch_size')))
+        except ValueError as e:
+            raise CommandError(str(e))
+        print "Found %d clusters of %d messages (%d changed)" % (clusters, clustered, changed)
@@ -1,32 +1,58 @@
 from django.core.management.base import BaseCommand, make_option, CommandError
 import sys
-from django.db import transaction
+
+DEFAULT_DIMENSIONS = ["hashtags", "words", "urls", "timezone", "contains_media", "sentiment", "type", "sender", "mentions"]
+
 
 class Command(BaseCommand):
-    help = "Extract topics for a dataset."
-    args = "<dataset id> [categorical_dimensions...]"
+    """
+    Precalculate the distributions of categorical dimensions for one or more
+    datasets (comma separated), all of the usual dimensions by default:
+
+    .. code-block :: bash
+
+        $ python manage.py precalc_categorical_distribution 1,2 hashtags words --workers 4
+
+    Each (dataset, dimension) is built separately, in parallel with
+    ``--workers``, and replaces the old distribution only once it is complete.
+
+    The ``topics`` dimension counts the dominant topic of each message. Its
+    distributions from before messages had one counted all of their topics,
+    so they have to be rebuilt (the migration that sets the dominant topics
+    lists the datasets).
+    """
+    help = "Precalculate the distributions of categorical dimensions."
+    args = "<dataset id>[,<dataset id>...] [categorical_dimensions...]"
+    option_list = BaseCommand.option_list + (
+        make_option('--workers',
+                    dest='workers',
+                    default=0,
+                    help='The number of processes to precalculate with'),
+    )
 
-    def handle(self, dataset_id, *dimensions, **options):
+    def handle(self, dataset_ids=None, *dimensions, **options):
 
-        if not dataset_id:
+        if not dataset_ids:
             raise CommandError("Dataset id is required.")
         try:
-            dataset_id = int(dataset_id)
+            dataset_ids = [int(dataset_id) for dataset_id in dataset_ids.split(',')]
         except ValueError:
             raise CommandError("Dataset id must be a number.")
 
-        from msgvis.apps.enhance.tasks import precalc_categorical_dimension
+        from msgvis.apps.enhance.tasks import precalc_categorical_distributions
 
-        categorical_dimensions = []
-        if len(dimensions) == 0:
-            categorical_dimensions = ["hashtags", "words", "urls", "timezone", "contains_media", "sentiment", "type", "sender", "mentions"]
-        else:
-            categorical_dimensions = dimensions
-        #categorical_dimensions = ["hashtags", "urls", "timezone", "contains_media", "sentiment", "type", "sender", "mentions"]
-        #categorical_dimensions = ["words"]
-        for dimension_key in categorical_dimensions:
-            print >>sys.stderr, "Precalculating %s..." %(dimension_key)
-            with transaction.atomic(savepoint=False):
-                precalc_categorical_dimension(dataset_id=dataset_id, dimension_key=dimension_key)
+        categorical_dimensions = dimensions or DEFAULT_DIMENSIONS
 
+        failed = 0
+        for dataset_id, dimension_key, levels, seconds, error in \
+                precalc_categorical_distributions(dataset_ids, categorical_dimensions,
+                                                  workers=int(options.get('workers'))):
+            if error is None:
+                print >>sys.stderr, "Precalculated %s of dataset %d: %d levels in %.2fs" % (
+                    dimension_key, dataset_id, levels, seconds)
+            else:
+                failed += 1
+                print >>sys.stderr, "Precalculating %s of dataset %d failed: %s" % (dimension_key, dataset_id, error)
 
+        if failed:
+            raise CommandError("%d distributions failed" % failed)
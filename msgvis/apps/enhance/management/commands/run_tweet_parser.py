@@ -15,19 +15,66 @@ def check_or_create_dir(dir_path):
             raise CommandError("Weird path error happens.")
 
 class Command(BaseCommand):
+    """
+    Tag, lemmatize and import the messages of a dataset with the tweet parser:
+
+    .. code-block :: bash
+
+        $ python manage.py run_tweet_parser <dataset_id> <file_save_path>
+
+    By default, every stage runs at once on shards of messages
+    (see :class:`msgvis.apps.enhance.tweet_pipeline.TweetParserPipeline`),
+    and running the command again resumes where it stopped.
+    Each stage can also be run alone with ``--action``. With ``--stream``,
+    ``all`` tags every message in one tweet parser process, then lemmatizes
+    and imports its output.
+
+    The command fails if the tweet parser does, after finishing the
+    files it could; run it again to retry the rest.
+    """
     help = "Run tweet parser on a dataset. Results will be saved into files."
     args = '<dataset_id> <file_save_path>'
     option_list = BaseCommand.option_list + (
         make_option('-a', '--action',
                     default='all',
                     dest='action',
-                    help='Action to run [all | dump | parse | lemmatize]'
+                    help='Action to run [all | dump | parse | lemmatize]; all also imports the results'
         ),
         make_option('-p', '--path',
                     default='/home/vagrant/textvisdrg/datasets/ark-tweet-nlp-0.3.2',
                     dest='tweet_parser_path',
                     help='Tweet parser path'
         ),
+        make_option('-w', '--workers',
+                    default=0,
+                    type='int',
+                    dest='workers',
+                    help='Number of processes writing dump files'
+        ),
+        make_option('--taggers',
+                    default=2,
+                    type='int',
+                    dest='taggers',
+                    help='Number of tweet parser processes to run at once'
+        ),
+        make_option('--lemmatizers',
+                    default=1,
+                    type='int',
+                    dest='lemmatizers',
+                    help='Number of lemmatizing processes'
+        ),
+        make_option('--shard-size',
+                    default=10000,
+                    type='int',
+                    dest='shard_size',
+                    help='Number of messages per dump file'
+        ),
+        make_option('--stream',
+                    action='store_true',
+                    default=False,
+                    dest='stream',
+                    help='Pipe messages straight into the tweet parser instead of dumping them to files'
+        ),
     )
 
 
@@ -47,19 +94,48 @@ class Command(BaseCommand):
 
         check_or_create_dir(save_path)
 
-        if action == 'all' or action == 'dump':
+        if action == 'all' and not options.get('stream'):
+            from msgvis.apps.enhance.tweet_pipeline import TweetParserPipeline
+            print "Running tweet parser pipeline..."
+            pipeline = TweetParserPipeline(dataset_id, tweet_parser_path, save_path)
+            pipeline.taggers = options.get('taggers')
+            pipeline.lemmatizers = options.get('lemmatizers')
+            pipeline.shard_size = options.get('shard_size')
+            pipeline.run()
+            if pipeline.failed:
+                raise CommandError("%d shards failed to tag: %s" % (len(pipeline.failed), ", ".join(pipeline.failed)))
+            return
+
+        if options.get('stream') and (action == 'all' or action == 'parse'):
+            from msgvis.apps.enhance.tasks import stream_tweets_to_tagger, is_done
+            output_path = "%s/parsed_tweets" %save_path
+            check_or_create_dir(output_path)
+
+            print "Parsing messages..."
+            stream_file = stream_tweets_to_tagger(dataset_id, tweet_parser_path, output_path,
+                                                  shard_size=options.get('shard_size'))
+            if not is_done(stream_file):
+                raise CommandError("The tweet parser failed on the streamed messages.")
+
+        elif action == 'dump' and options.get('stream'):
+            raise CommandError("--stream does not write dump files.")
+
+        if not options.get('stream') and (action == 'all' or action == 'dump'):
             from msgvis.apps.enhance.tasks import dump_tweets
             print "Dumping messages..."
-            dump_tweets(dataset_id, save_path)
+            dump_tweets(dataset_id, save_path,
+                        shard_size=options.get('shard_size'), workers=options.get('workers'))
 
-        if action == 'all' or action == 'parse':
+        if not options.get('stream') and (action == 'all' or action == 'parse'):
             from msgvis.apps.enhance.tasks import parse_tweets
             output_path = "%s/parsed_tweets" %save_path
             check_or_create_dir(output_path)
 
             print "\n=========="
             print "Parsing messages..."
-            parse_tweets(tweet_parser_path, save_path, output_path)
+            failed = parse_tweets(tweet_parser_path, save_path, output_path, workers=options.get('taggers'))
+            if failed:
+                raise CommandError("%d files failed to tag: %s" % (len(failed), ", ".join(failed)))
 
         if action == 'all' or action == 'lemmatize':
             from msgvis.apps.enhance.tasks import lemmatize_tweets
@@ -69,4 +145,16 @@ class Command(BaseCommand):
 
             print "\n=========="
             print "Lemmatizing messages..."
-            lemmatize_tweets(input_path, output_path)
+            lemmatize_tweets(input_path, output_path, workers=options.get('lemmatizers'))
+
+        if action == 'all':
+            # only with --stream; otherwise the pipeline has imported them already
+            import codecs
+            from msgvis.apps.enhance.tasks import read_tweet_parser_results, TweetWordImporter, \
+                _converted_filenames
+
+            print "\n=========="
+            print "Importing words..."
+            output_file, output_id_file = _converted_filenames(stream_file, "%s/converted_tweets" % save_path)
+            with codecs.open(output_id_file, encoding='utf-8', mode='r') as f:
+                TweetWordImporter(dataset_id).run(read_tweet_parser_results(f))
@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, make_option, CommandError
+
+
+class Command(BaseCommand):
+    """
+    Bring a dataset's topics up to date with the messages imported since
+    they were extracted, without processing the rest of the dataset again:
+
+    .. code-block :: bash
+
+        $ python manage.py update_topics <dataset id> --name "my topic model"
+
+    If the dataset has no topic model with that name yet, or ``--rebuild``
+    is given, the whole pipeline runs as in ``extract_topics``. Words that
+    first appear in new messages only join the topics when the model is
+    rebuilt, so rebuild now and then.
+    """
+    help = "Update the topics of a dataset with new messages."
+    args = "<dataset id>"
+    option_list = BaseCommand.option_list + (
+        make_option('--topics',
+                    dest='num_topics',
+                    default=30,
+                    help='The number of topics to model, if the model is built'),
+        make_option('--name',
+                    dest='name',
+                    default='my topic model',
+                    help="The name for your keyword dictionary"),
+        make_option('--workers',
+                    dest='workers',
+                    default=0,
+                    help='The number of processes to tokenize and infer topics with'),
+        make_option('--top-k',
+                    dest='top_k',
+                    default=None,
+                    help='The number of most likely topics to save for each message (default all)'),
+        make_option('--min-probability',
+                    dest='min_probability',
+                    default=0.01,
+                    help='The smallest topic probability to save'),
+        make_option('--rebuild',
+                    action='store_true',
+                    dest='rebuild',
+                    default=False,
+                    help='Build a new dictionary and topic model from all of the messages'),
+    )
+
+    def handle(self, dataset_id=None, *args, **options):
+        name = options.get('name')
+        workers = int(options.get('workers'))
+        top_k = options.get('top_k')
+
+        if not dataset_id:
+            raise CommandError("Dataset id is required.")
+        try:
+            dataset_id = int(dataset_id)
+        except ValueError:
+            raise CommandError("Dataset id must be a number.")
+
+        from msgvis.apps.enhance.tasks import default_topic_context, incremental_topic_pipeline
+
+        context = default_topic_context(name, dataset_id=dataset_id)
+        incremental_topic_pipeline(context, dataset_id=dataset_id, num_topics=int(options.get('num_topics')),
+                                   workers=workers,
+                                   top_k=int(top_k) if top_k else None,
+                                   min_probability=float(options.get('min_probability')),
+                                   rebuild=options.get('rebuild'))
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enhance', '0015_auto_20150906_0752'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dictionary',
+            name='last_message_id',
+            field=models.BigIntegerField(default=None, null=True, blank=True),
+            preserve_default=True,
+        ),
+    ]
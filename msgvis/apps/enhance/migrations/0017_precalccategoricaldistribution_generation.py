@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('enhance', '0016_dictionary_last_message_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='precalccategoricaldistribution',
+            name='generation',
+            field=models.IntegerField(default=0),
+            preserve_default=True,
+        ),
+        migrations.AlterIndexTogether(
+            name='precalccategoricaldistribution',
+            index_together=set([('dimension_key', 'level'), ('dataset', 'dimension_key', 'generation')]),
+        ),
+    ]
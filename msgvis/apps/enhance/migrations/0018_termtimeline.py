@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+import msgvis.apps.base.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('corpus', '0024_message_dominant_topic'),
+        ('enhance', '0017_precalccategoricaldistribution_generation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TermTimeline',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('base_bin_size', models.IntegerField(default=60)),
+                ('dataset_version', models.PositiveIntegerField(default=0)),
+                ('start_time', models.DateTimeField(default=None, null=True, blank=True)),
+                ('end_time', models.DateTimeField(default=None, null=True, blank=True)),
+                ('complete', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('dataset', models.ForeignKey(related_name='term_timelines', to='corpus.Dataset')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.CreateModel(
+            name='TermTimeBin',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('text', msgvis.apps.base.models.Utf8CharField(default=None, max_length=100, null=True, blank=True)),
+                ('bin_size', models.IntegerField()),
+                ('start', models.BigIntegerField()),
+                ('count', models.IntegerField()),
+                ('first_time', models.DateTimeField()),
+                ('last_time', models.DateTimeField()),
+                ('timeline', models.ForeignKey(related_name='bins', to='enhance.TermTimeline')),
+            ],
+            options={
+            },
+            bases=(models.Model,),
+        ),
+        migrations.AlterIndexTogether(
+            name='termtimebin',
+            index_together=set([('timeline', 'bin_size', 'text')]),
+        ),
+    ]
@@ -29,6 +29,9 @@ class Dictionary(models.Model):
     num_pos = PositiveBigIntegerField(default=0)
     num_nnz = PositiveBigIntegerField(default=0)
 
+    last_message_id = models.BigIntegerField(null=True, blank=True, default=None)
+    """Messages after this one are not in the dictionary yet."""
+
     @property
     def gensim_dictionary(self):
         if not hasattr(self, '_gensim_dict'):
@@ -117,6 +120,12 @@ class Dictionary(models.Model):
         logger.info("Building a dictionary from texts")
         dictionary = GensimDictionary(tokenized_texts)
 
+        return cls._create_from_gensim_dictionary(dictionary, name=name, dataset=dataset, settings=settings,
+                                                  minimum_frequency=minimum_frequency)
+
+    @classmethod
+    def _create_from_gensim_dictionary(cls, dictionary, name, dataset, settings, minimum_frequency=2):
+
         # Remove extremely rare words
         logger.info("Dictionary contains %d words. Filtering..." % len(dictionary.token2id))
         dictionary.filter_extremes(no_below=minimum_frequency, no_above=1, keep_n=None)
@@ -132,39 +141,120 @@ class Dictionary(models.Model):
 
         return dict_model
 
-    def _vectorize_corpus(self, queryset, tokenizer):
+    def _extend(self, tokenized_texts, minimum_frequency=2):
+        """
+        Add more documents to the dictionary. The document frequencies of
+        known words grow, and new words that appear in at least
+        ``minimum_frequency`` of the new documents are added at the end.
+        Returns the number of words added.
+        """
+        from collections import Counter
+        from msgvis.apps.importer.counters import update_with_case
+
+        gdict = self.gensim_dictionary
+
+        dfs = Counter()
+        num_docs = num_pos = num_nnz = 0
+        for tokens in tokenized_texts:
+            counts = Counter(tokens)
+            dfs.update(counts.iterkeys())
+            num_docs += 1
+            num_pos += len(tokens)
+            num_nnz += len(counts)
+
+        changed = {}
+        new_words = []
+        next_index = max(gdict.keys()) + 1 if len(gdict) else 0
+        for token, df in sorted(dfs.iteritems()):
+            word_index = gdict.token2id.get(token)
+            if word_index is not None:
+                gdict.dfs[word_index] += df
+                changed[self.get_word_id(word_index)] = gdict.dfs[word_index]
+            elif df >= minimum_frequency:
+                new_words.append(Word(dictionary=self, text=token, index=next_index, document_frequency=df))
+                next_index += 1
+
+        update_with_case(Word, 'document_frequency', changed)
+        Word.objects.bulk_create(new_words)
+
+        self.num_docs += num_docs
+        self.num_pos += num_pos
+        self.num_nnz += num_nnz
+        self.save()
+
+        # reload with the new words and their ids
+        del self._gensim_dict
+
+        logger.info("Added %d documents and %d words to dictionary %d" % (num_docs, len(new_words), self.id))
+        return len(new_words)
 
-        import math
+    def _vectorize_corpus(self, queryset, tokenizer):
+        documents = ((msg.id, tokenizer.tokenize(msg.text)) for msg in queryset.iterator())
+        return self._vectorize_documents(documents, queryset.count())
+
+    def _vectorize_documents(self, documents, total_count, batch_size=10000):
+        """
+        Save the word vectors for ``(message id, tokens)`` pairs.
+
+        Each batch of documents is counted into flat arrays, tf-idf is computed
+        for the whole batch at once, and the rows are written with
+        :func:`msgvis.apps.importer.loading.load_rows`. Returns the
+        :class:`msgvis.apps.importer.loading.LoadStats` of the writes.
+        """
+        import numpy
+        from itertools import islice
+        from time import time
+        from msgvis.apps.importer.loading import load_rows, LoadStats
 
         logger.info("Saving document word vectors in corpus.")
 
-        total_documents = self.num_docs
         gdict = self.gensim_dictionary
+
+        # word index -> Word id, and the log of each word's document frequency
+        num_words = max(gdict.keys()) + 1 if len(gdict) else 0
+        word_ids = numpy.zeros(num_words, dtype='int64')
+        log_dfs = numpy.ones(num_words)
+        for word_index in gdict.keys():
+            word_ids[word_index] = self.get_word_id(word_index)
+            log_dfs[word_index] = numpy.log(gdict.dfs[word_index])
+        log_documents = numpy.log(self.num_docs)
+
+        fields = ('dictionary', 'word', 'word_index', 'count', 'tfidf', 'message')
+        stats = LoadStats()
+        start = time()
         count = 0
-        total_count = queryset.count()
-        batch = []
-        batch_size = 1000
-        print_freq = 10000
 
-        for msg in queryset.iterator():
-            text = msg.text
-            bow = gdict.doc2bow(tokenizer.tokenize(text))
-
-            for word_index, word_freq in bow:
-                word_id = self.get_word_id(word_index)
-                document_freq = gdict.dfs[word_index]
-                tfidf = word_freq * math.log(total_documents, document_freq)
-                batch.append(MessageWord(dictionary=self,
-                                         word_id=word_id,
-                                         word_index=word_index,
-                                         count=word_freq,
-                                         tfidf=tfidf,
-                                         message=msg))
-            count += 1
+        documents = iter(documents)
+        while True:
+            batch = list(islice(documents, batch_size))
+            if not batch:
+                break
+
+            message_ids = []
+            word_indices = []
+            counts = []
+            for message_id, tokens in batch:
+                bow = gdict.doc2bow(tokens)
+                message_ids.extend([message_id] * len(bow))
+                for word_index, word_freq in bow:
+                    word_indices.append(word_index)
+                    counts.append(word_freq)
+            count += len(batch)
 
-            if len(batch) > batch_size:
-                MessageWord.objects.bulk_create(batch)
-                batch = []
+            if word_indices:
+                word_indices = numpy.array(word_indices, dtype='int64')
+                counts = numpy.array(counts, dtype='float64')
+
+                # count * log base df of the number of documents
+                tfidf = counts * log_documents / log_dfs[word_indices]
+
+                rows = zip([self.id] * len(message_ids),
+                           word_ids[word_indices].tolist(),
+                           word_indices.tolist(),
+                           counts.tolist(),
+                           tfidf.tolist(),
+                           message_ids)
+                load_rows(MessageWord, fields, rows, stats)
 
                 if settings.DEBUG:
                     # prevent memory leaks
@@ -172,15 +262,12 @@ class Dictionary(models.Model):
 
                     connection.queries = []
 
-            if count % print_freq == 0:
-                logger.info("Saved word-vectors for %d / %d documents" % (count, total_count))
-
-        if len(batch):
-            MessageWord.objects.bulk_create(batch)
-            logger.info("Saved word-vectors for %d / %d documents" % (count, total_count))
-
-        logger.info("Created %d word vector entries" % count)
+            logger.info("Saved word-vectors for %d / %d documents (%r)" % (count, total_count, stats))
 
+        seconds = time() - start
+        logger.info("Saved %d word-vectors in %.2fs (%.0f rows/s)" % (
+            stats.rows, seconds, stats.rows / seconds if seconds else 0))
+        return stats
 
     def _build_lda(self, name, corpus, num_topics=30, words_to_save=200, multicore=True):
         from gensim.models import LdaMulticore, LdaModel
@@ -202,29 +289,13 @@ class Dictionary(models.Model):
 
         topics = []
         for i in range(num_topics):
-            topic = lda.show_topic(i, topn=words_to_save)
             alpha = lda.alpha[i]
 
             topicm = Topic(model=model, name="?", alpha=alpha, index=i)
             topicm.save()
             topics.append(topicm)
 
-            words = []
-            for prob, word_text in topic:
-                word_index = gdict.token2id[word_text]
-                word_id = self.get_word_id(word_index)
-                tw = TopicWord(topic=topicm,
-                               word_id=word_id, word_index=word_index,
-                               probability=prob)
-                words.append(tw)
-            TopicWord.objects.bulk_create(words)
-
-            most_likely_word_scores = topicm.word_scores\
-                .order_by('-probability')\
-                .prefetch_related('word')
-                
-            topicm.name = ', '.join([score.word.text for score in most_likely_word_scores[:3]])
-            topicm.save()
+            self._save_topic_words(topicm, lda, words_to_save)
 
             if settings.DEBUG:
                 # prevent memory leaks
@@ -236,7 +307,73 @@ class Dictionary(models.Model):
 
         return (model, lda)
 
-    def _apply_lda(self, model, corpus, lda=None):
+    def _save_topic_words(self, topicm, lda, words_to_save=200):
+        """Save the most likely words of a topic, and name it after the top three."""
+        import numpy
+
+        # the same as lda.show_topic, which changed its output between gensim versions
+        topic = lda.state.get_lambda()[topicm.index]
+        topic = topic / topic.sum()
+        best = numpy.argsort(topic)[::-1][:words_to_save]
+
+        words = []
+        for word_index in best:
+            word_index = int(word_index)
+            word_id = self.get_word_id(word_index)
+            tw = TopicWord(topic=topicm,
+                           word_id=word_id, word_index=word_index,
+                           probability=float(topic[word_index]))
+            words.append(tw)
+        TopicWord.objects.bulk_create(words)
+
+        most_likely_word_scores = topicm.word_scores\
+            .order_by('-probability')\
+            .prefetch_related('word')
+
+        topicm.name = ', '.join([score.word.text for score in most_likely_word_scores[:3]])
+        topicm.save()
+
+    def _update_lda(self, model, corpus, lda=None, words_to_save=200):
+        """
+        Train a saved topic model further on new documents with gensim's online
+        ``update``, and save it and its topic words again. The documents may
+        only use words in the model's vocabulary.
+        """
+        if lda is None:
+            # recover the lda
+            lda = model.load_from_file()
+
+        bows = list(corpus)
+        if not bows:
+            return lda
+
+        logger.info("Updating topic model %d with %d documents" % (model.id, len(bows)))
+        lda.update(bows)
+        model.save_to_file(lda)
+
+        TopicWord.objects.filter(topic__model=model).delete()
+        for topicm in model.topics.order_by('index'):
+            self._save_topic_words(topicm, lda, words_to_save)
+
+        return lda
+
+    def _apply_lda(self, model, corpus, lda=None, workers=0, chunk_size=2000, top_k=None, min_probability=0.01,
+                   replace=True):
+        """
+        Save the topic mixture of every message in the corpus.
+
+        Messages are inferred ``chunk_size`` at a time, in ``workers``
+        processes if given. Only the ``top_k`` most likely topics (or all
+        of them) with at least ``min_probability`` are saved as
+        :class:`MessageTopic` rows, and the most likely topic is also saved
+        as the message's ``dominant_topic``. With ``replace``, the model's
+        dominant topics are cleared from all other messages first.
+        """
+        from time import time
+        from itertools import imap
+        from msgvis.apps.enhance.parallel import chunks, ordered_imap
+        from msgvis.apps.importer.bulk import chunked
+        from msgvis.apps.importer.loading import load_rows, LoadStats
 
         if lda is None:
             # recover the lda
@@ -244,43 +381,53 @@ class Dictionary(models.Model):
 
         total_documents = len(corpus)
         count = 0
-        batch = []
-        batch_size = 1000
-        print_freq = 10000
+        start = time()
+        stats = LoadStats()
 
-        topics = list(model.topics.order_by('index'))
+        topic_ids = list(model.topics.order_by('index').values_list('id', flat=True))
 
-        # Go through the bows and get their topic mixtures
-        for bow in corpus:
-            mixture = lda[bow]
-            message_id = corpus.current_message_id
+        if replace:
+            Message.objects.filter(dominant_topic__model=model).update(dominant_topic=None)
 
-            for topic_index, prob in mixture:
-                topic = topics[topic_index]
-                itemtopic = MessageTopic(topic_model=model,
-                                         topic=topic,
-                                         message_id=message_id,
-                                         probability=prob)
-                batch.append(itemtopic)
+        def documents():
+            for bow in corpus:
+                yield corpus.current_message_id, bow
 
-            count += 1
+        batches = chunks(documents(), chunk_size)
+        if workers > 0:
+            results = ordered_imap(_infer_topics, batches, workers=workers,
+                                   initializer=_init_inference_worker, initargs=(lda, top_k, min_probability),
+                                   label="inference chunks")
+        else:
+            _init_inference_worker(lda, top_k, min_probability)
+            results = imap(_infer_topics, batches)
 
-            if len(batch) > batch_size:
-                MessageTopic.objects.bulk_create(batch)
-                batch = []
+        fields = ('topic_model', 'topic', 'message', 'probability')
+        for result in results:
+            rows = []
+            dominant = {}
+            for message_id, mixture, dominant_index in result:
+                for topic_index, prob in mixture:
+                    rows.append((model.id, topic_ids[topic_index], message_id, prob))
+                dominant.setdefault(topic_ids[dominant_index], []).append(message_id)
 
-                if settings.DEBUG:
-                    # prevent memory leaks
-                    from django.db import connection
+            load_rows(MessageTopic, fields, rows, stats)
+            for topic_id, message_ids in dominant.iteritems():
+                for ids in chunked(message_ids):
+                    Message.objects.filter(id__in=ids).update(dominant_topic=topic_id)
 
-                    connection.queries = []
+            count += len(result)
 
-            if count % print_freq == 0:
-                logger.info("Saved topic-vectors for %d / %d documents" % (count, total_documents))
+            if settings.DEBUG:
+                # prevent memory leaks
+                from django.db import connection
 
-        if len(batch):
-            MessageTopic.objects.bulk_create(batch)
-            logger.info("Saved topic-vectors for %d / %d documents" % (count, total_documents))
+                connection.queries = []
+
+            logger.info("Saved topic-vectors for %d / %d documents (%.0f documents/s)" % (
+                count, total_documents, count / (time() - start)))
+
+        logger.info("Saved %d topic probabilities for %d documents (%r)" % (stats.rows, count, stats))
 
     def _evaluate_lda(self, model, corpus, lda=None):
 
@@ -294,6 +441,37 @@ class Dictionary(models.Model):
         model.save()
 
 
+_inference = None
+
+
+def _init_inference_worker(lda, top_k, min_probability):
+    """Runs once in each inference process."""
+    global _inference
+    _inference = (lda, top_k, min_probability)
+
+
+def _infer_topics(documents):
+    """
+    Runs in an inference process: infers the topic mixtures of a chunk of
+    ``(message id, bow)`` pairs at once. Returns ``(message id, [(topic
+    index, probability)], dominant topic index)`` for each message.
+    """
+    import numpy
+
+    lda, top_k, min_probability = _inference
+    gamma, _ = lda.inference([bow for message_id, bow in documents])
+    mixtures = gamma / gamma.sum(axis=1)[:, numpy.newaxis]
+
+    results = []
+    for (message_id, bow), mixture in zip(documents, mixtures):
+        order = numpy.argsort(-mixture, kind='mergesort')
+        kept = order[:top_k] if top_k else order
+        results.append((message_id,
+                        [(int(i), float(mixture[i])) for i in kept if mixture[i] >= min_probability],
+                        int(order[0])))
+    return results
+
+
 class Word(models.Model):
     dictionary = models.ForeignKey(Dictionary, related_name='words')
     index = models.IntegerField()
@@ -318,28 +496,46 @@ class TopicModel(models.Model):
     time = models.DateTimeField(auto_now_add=True)
     perplexity = models.FloatField(default=0)
 
-    def load_from_file(self):
-        from gensim.models import LdaMulticore
+    def load_from_file(self, mmap='r'):
+        """
+        Load the gensim model from the model store (see :mod:`msgvis.apps.enhance.store`),
+        read-only and shared between processes unless ``mmap`` is None.
+        """
+        from msgvis.apps.enhance.store import get_store
+
+        store = get_store()
+        if not store.exists(self.id):
+            # saved in the working directory before there was a store
+            from gensim.models import LdaMulticore
+
+            return LdaMulticore.load("lda_out_%d.model" % self.id)
 
-        return LdaMulticore.load("lda_out_%d.model" % self.id)
+        return store.load(self.id, mmap=mmap)
 
     def save_to_file(self, gensim_lda):
-        gensim_lda.save("lda_out_%d.model" % self.id)
+        from msgvis.apps.enhance.store import get_store
+
+        get_store().save(self.id, gensim_lda, {
+            'name': self.name,
+            'dictionary': self.dictionary_id,
+        })
 
     def get_probable_topic(self, message):
         """For this model, get the most likely topic for the message."""
-        message_topics = message.topic_probabilities\
-            .filter(topic_model=self)\
-            .only('topic', 'probability')
+        if message.dominant_topic_id is not None:
+            topic = message.dominant_topic
+            if topic.model_id == self.id:
+                return topic
 
-        max_prob = -100000
-        probable_topic = None
-        for mt in message_topics:
-            if mt.probability > max_prob:
-                probable_topic = mt.topic
-                max_prob = mt.probability
+        # the message's dominant topic is from another model
+        message_topic = message.topic_probabilities\
+            .filter(topic_model=self)\
+            .select_related('topic')\
+            .order_by('-probability')\
+            .first()
 
-        return probable_topic
+        if message_topic is not None:
+            return message_topic.topic
 
 
 class Topic(models.Model):
@@ -399,8 +595,13 @@ class MessageTopic(models.Model):
         return examples.order_by('-probability')
 
 
+def get_message_sentiment(text):
+    """Get the sentiment label (-1, 0, or 1) for some message text."""
+    return int(round(textblob.TextBlob(text).sentiment.polarity))
+
+
 def set_message_sentiment(message, save=True):
-    message.sentiment = int(round(textblob.TextBlob(message.text).sentiment.polarity))
+    message.sentiment = get_message_sentiment(message.text)
     if save:
         message.save()
 
@@ -429,13 +630,126 @@ class TweetWord(models.Model):
 
 
 
+class TermTimeline(models.Model):
+    """
+    A sparse cube of how many times each word (the ``text`` of a
+    :class:`TweetWord`) appears in a dataset's messages in each time bin,
+    for answering words by time charts without joining the messages to
+    their words. Bins of ``base_bin_size`` seconds are counted by the
+    database and rolled up to each coarser step of
+    :attr:`msgvis.apps.dimensions.models.TimeDimension.d3_time_scaleSteps`
+    that they divide evenly (see
+    :func:`msgvis.apps.enhance.tasks.build_term_timeline`).
+
+    A timeline is only used while its dataset has the version and time
+    range it was built from.
+    """
+    dataset = models.ForeignKey(Dataset, related_name="term_timelines")
+    base_bin_size = models.IntegerField(default=60)
+    dataset_version = models.PositiveIntegerField(default=0)
+    start_time = models.DateTimeField(null=True, default=None, blank=True)
+    end_time = models.DateTimeField(null=True, default=None, blank=True)
+    complete = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def get_current(cls, dataset):
+        """The dataset's newest complete timeline, if it is up to date."""
+        timeline = dataset.term_timelines.filter(complete=True).order_by('-id').first()
+        if timeline is None or timeline.dataset_version != dataset.version or \
+                timeline.start_time != dataset.start_time or timeline.end_time != dataset.end_time:
+            return None
+        return timeline
+
+    @property
+    def bin_sizes(self):
+        """The bin sizes in the cube, in seconds."""
+        from msgvis.apps.dimensions import registry
+
+        steps = [int(step / 1000) for step in registry.get_dimension('time').d3_time_scaleSteps]
+        return [step for step in steps if step >= self.base_bin_size and step % self.base_bin_size == 0]
+
+    def _bins(self, texts=None, bin_size=None):
+        bins = self.bins.filter(bin_size=bin_size or self.bin_sizes[-1])
+        if texts is not None:
+            texts = list(texts)
+            condition = models.Q(text__in=[text for text in texts if text is not None])
+            if None in texts:
+                condition |= models.Q(text__isnull=True)
+            bins = bins.filter(condition)
+        return bins
+
+    def levels(self):
+        """The words ordered from most to least frequent, with their counts."""
+        return self._bins().values('text').annotate(value=models.Sum('count')).order_by('-value', 'text')
+
+    def get_range(self, texts=None):
+        """
+        The times of the first and last messages with any of the words
+        (None for messages without words).
+        """
+        time_range = self._bins(texts).aggregate(min=models.Min('first_time'), max=models.Max('last_time'))
+        return time_range['min'], time_range['max']
+
+    def counts(self, bin_size, texts=None, by_text=True):
+        """
+        The ``start`` and ``value`` of each bin of ``bin_size`` seconds,
+        for each ``text`` too unless ``by_text`` is False.
+        """
+        bins = self._bins(texts, bin_size)
+        if by_text:
+            return bins.values('text', 'start', 'count')
+        return bins.values('start').annotate(count=models.Sum('count'))
+
+
+class TermTimeBin(models.Model):
+    """The messages with a word in one time bin of a :class:`TermTimeline`."""
+    timeline = models.ForeignKey(TermTimeline, related_name="bins")
+    text = base_models.Utf8CharField(max_length=100, null=True, blank=True, default=None)
+    """The word, or None for messages without words"""
+    bin_size = models.IntegerField()
+    start = models.BigIntegerField()
+    """The unix timestamp of the left side of the bin"""
+
+    count = models.IntegerField()
+    first_time = models.DateTimeField()
+    last_time = models.DateTimeField()
+
+    class Meta:
+        index_together = [
+            ["timeline", "bin_size", "text"],
+        ]
+
+
+LIVE_GENERATION = 0
+
+
+class LiveDistributionManager(models.Manager):
+    """Only the distributions in use, not ones still being built."""
+
+    def get_queryset(self):
+        return super(LiveDistributionManager, self).get_queryset().filter(generation=LIVE_GENERATION)
+
+
 class PrecalcCategoricalDistribution(models.Model):
+    """
+    The number of messages at each level of a categorical dimension in a
+    dataset. Recalculated distributions are written under a new
+    ``generation`` and swapped in all at once (see
+    :func:`msgvis.apps.enhance.tasks.build_categorical_distribution`);
+    ``objects`` and ``dataset.distributions`` only see the live generation.
+    """
     dataset = models.ForeignKey(Dataset, related_name="distributions", null=True, blank=True, default=None)
     dimension_key = models.CharField(db_index=True, max_length=64, blank=True, default="")
     level = base_models.Utf8CharField(db_index=True, max_length=128, blank=True, default="")
     count = models.IntegerField()
+    generation = models.IntegerField(default=LIVE_GENERATION)
+
+    objects = LiveDistributionManager()
+    all_generations = models.Manager()
 
     class Meta:
         index_together = [
             ["dimension_key", "level"],
+            ["dataset", "dimension_key", "generation"],
         ]
\ No newline at end of file
@@ -0,0 +1,71 @@
+"""
+Helpers for spreading topic modeling work over processes.
+
+Only the calling process reads from the database: it splits its input
+into chunks and ships them to the workers, which just compute.
+"""
+import logging
+from itertools import islice
+
+logger = logging.getLogger(__name__)
+
+
+def chunks(items, size):
+    """Split an iterable into lists of ``size`` consecutive items."""
+    items = iter(items)
+    while True:
+        chunk = list(islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def keyset_pages(queryset, page_size=10000):
+    """
+    Yield the rows of a queryset in lists of up to ``page_size``, ordered by
+    id. Each page is a separate query for ids after the last one seen, so
+    unlike slicing (``OFFSET``), reading a page costs the same however far
+    into the table it is.
+    """
+    last_id = None
+    while True:
+        page = queryset.order_by('id')
+        if last_id is not None:
+            page = page.filter(id__gt=last_id)
+        page = list(page[:page_size])
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        last_id = page[-1].id
+
+
+def ordered_imap(fn, chunks, workers=2, initializer=None, initargs=(), label="chunks"):
+    """
+    Apply ``fn`` to each chunk in a pool of ``workers`` processes,
+    yielding the results in order. Only a few chunks are in flight at
+    once, so ``chunks`` can be a generator over a huge input.
+    """
+    import multiprocessing
+    from collections import deque
+
+    pool = multiprocessing.Pool(workers, initializer, initargs)
+    try:
+        pending = deque()
+        done = 0
+        for chunk in chunks:
+            pending.append(pool.apply_async(fn, (chunk,)))
+
+            while len(pending) > workers * 2:
+                yield pending.popleft().get()
+                done += 1
+                logger.info("Processed %d %s" % (done, label))
+
+        while pending:
+            yield pending.popleft().get()
+
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
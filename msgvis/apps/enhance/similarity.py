@@ -0,0 +1,236 @@
+"""
+Finding the messages most like a message, by the cosine similarity of their
+tf-idf vectors in a :class:`msgvis.apps.enhance.models.Dictionary`.
+
+A :class:`SimilarityIndex` is built from the dictionary's
+:class:`msgvis.apps.enhance.tasks.BowCorpus` and saved next to it:
+
+.. code-block :: text
+
+    bow_corpus/
+        dictionary_3/
+            tfidf/                  the exported word vectors
+            similarity/
+                meta.json           what it was built from, and array lengths
+                message_ids.bin     the message of each row, in id order
+                indptr.bin          the word vectors with their length normalized to 1,
+                indices.bin         as a compressed sparse row matrix
+                data.bin
+                postings_indptr.bin the rows of each word (an inverted index),
+                postings.bin        from its highest weight to its lowest
+                weights.bin
+
+With normalized rows, the similarity of two messages is the dot product of
+their rows. Rather than multiplying every row by a message's row, a lookup
+reads the postings of the message's words, and only the first
+``max_postings`` of each: the rows where the word weighs the most, which
+are the ones it can add the most to. The best candidates by those partial
+scores are then scored exactly. The postings left out can add no more than
+their first weight each, so if that could still beat the last result, every
+row is scored instead; either way the results are exact.
+"""
+import json
+import logging
+from time import time
+
+from msgvis.apps.enhance.tasks import MemoryMappedArrays, BowCorpus
+
+logger = logging.getLogger(__name__)
+
+
+class SimilarityIndex(MemoryMappedArrays):
+    """The normalized tf-idf vectors of a dictionary's messages, and an inverted index of them."""
+    dtypes = {
+        'message_ids': 'int64',
+        'indptr': 'int64',
+        'indices': 'int32',
+        'data': 'float32',
+        'postings_indptr': 'int64',
+        'postings': 'int32',
+        'weights': 'float32',
+    }
+
+    # how many rows of each of a message's words to read
+    max_postings = 1000
+
+    # how many candidates to score exactly, for each result
+    rerank_factor = 10
+
+    _loaded = {}
+
+    @classmethod
+    def get_path(cls, dictionary):
+        from django.conf import settings
+
+        return settings.BOW_CORPUS_ROOT / ('dictionary_%d' % dictionary.id) / 'similarity'
+
+    @classmethod
+    def get_signature(cls, dictionary):
+        """What the index depends on: the dictionary and the messages it has seen."""
+        return {
+            'dictionary': dictionary.id,
+            'time': dictionary.time.isoformat() if dictionary.time else None,
+            'num_docs': dictionary.num_docs,
+            'num_nnz': dictionary.num_nnz,
+            'last_message_id': dictionary.last_message_id,
+        }
+
+    @classmethod
+    def for_dictionary(cls, dictionary):
+        """
+        The dictionary's index if it is up to date, else None. It stays
+        loaded in this process until it is built again.
+        """
+        index = cls(cls.get_path(dictionary))
+        if not index.exists() or index.meta['signature'] != cls.get_signature(dictionary):
+            return None
+
+        loaded = cls._loaded.get(dictionary.id)
+        if loaded is not None and loaded.meta['built_at'] == index.meta['built_at']:
+            return loaded
+        cls._loaded[dictionary.id] = index
+        return index
+
+    @classmethod
+    def build(cls, dictionary):
+        """Index the dictionary's tf-idf vectors, exporting them first if needed."""
+        import numpy
+        from datetime import datetime
+        from scipy.sparse import diags
+
+        start = time()
+        corpus = BowCorpus.for_dictionary(dictionary, 'tfidf')
+        matrix = corpus.to_csr().astype(numpy.float32)
+
+        norms = numpy.sqrt(numpy.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        matrix = (diags(1 / norms) * matrix).tocsr()
+        matrix.sort_indices()
+
+        # the inverted index, with each word's rows from the highest weight down
+        postings = matrix.T.tocsr()
+        words = numpy.repeat(numpy.arange(postings.shape[0]), numpy.diff(postings.indptr))
+        order = numpy.lexsort((-postings.data, words))
+
+        lengths = {}
+        with cls._building(cls.get_path(dictionary)) as temp_path:
+            def write(name, values):
+                values = numpy.ascontiguousarray(values, dtype=cls.dtypes[name])
+                values.tofile(temp_path / (name + '.bin'))
+                lengths[name] = len(values)
+
+            write('message_ids', corpus.message_ids)
+            write('indptr', matrix.indptr)
+            write('indices', matrix.indices)
+            write('data', matrix.data)
+            write('postings_indptr', postings.indptr)
+            write('postings', postings.indices[order])
+            write('weights', postings.data[order])
+
+            with open(temp_path / 'meta.json', 'wb') as fp:
+                json.dump({
+                    'signature': cls.get_signature(dictionary),
+                    'built_at': datetime.utcnow().isoformat(),
+                    'num_terms': matrix.shape[1],
+                    'lengths': lengths,
+                }, fp)
+
+        cls._loaded.pop(dictionary.id, None)
+        logger.info("Indexed %d messages in %.2fs" % (matrix.shape[0], time() - start))
+        return cls(cls.get_path(dictionary))
+
+    def __len__(self):
+        return self.meta['lengths']['message_ids']
+
+    def to_csr(self):
+        """The normalized vectors as a ``scipy.sparse.csr_matrix``, still backed by the memory maps."""
+        from scipy.sparse import csr_matrix
+
+        return csr_matrix((self._array('data'), self._array('indices'), self._array('indptr')),
+                          shape=(len(self), self.meta['num_terms']), copy=False)
+
+    def row(self, message_id):
+        """The row of a message, or None if it has no vector."""
+        import numpy
+
+        message_ids = self._array('message_ids')
+        i = int(numpy.searchsorted(message_ids, message_id))
+        if i < len(message_ids) and message_ids[i] == message_id:
+            return i
+        return None
+
+    def _read_postings(self, words, word_weights, max_postings=None):
+        """
+        The rows of the words' first ``max_postings`` postings (all of them
+        if None) with their weights times the words', and the most the
+        postings left out could add to any row.
+        """
+        import numpy
+
+        postings_indptr = self._array('postings_indptr')
+        postings = self._array('postings')
+        weights = self._array('weights')
+        rows = []
+        scores = []
+        missing = 0.0
+        for word, weight in zip(words.tolist(), word_weights.tolist()):
+            first, end = postings_indptr[word], postings_indptr[word + 1]
+            last = end if max_postings is None else min(end, first + max_postings)
+            rows.append(postings[first:last])
+            scores.append(weights[first:last] * weight)
+            if last < end:
+                missing += weight * float(weights[last])
+        return numpy.concatenate(rows), numpy.concatenate(scores), missing
+
+    def similar(self, message_id, limit=10):
+        """
+        The ``(message id, similarity)`` of up to ``limit`` other messages
+        most like a message, from the most similar.
+        """
+        import numpy
+
+        i = self.row(message_id)
+        if i is None or limit < 1:
+            return []
+
+        indptr = self._array('indptr')
+        start, end = indptr[i], indptr[i + 1]
+        words = self._array('indices')[start:end]
+        word_weights = self._array('data')[start:end]
+        if not len(words):
+            return []
+
+        rows, scores, missing = self._read_postings(words, word_weights, self.max_postings)
+        candidates, inverse = numpy.unique(rows, return_inverse=True)
+        partial = numpy.bincount(inverse, weights=scores)
+        partial[candidates == i] = -1
+
+        # the best by partial score, and the best of the rest
+        num_best = limit * self.rerank_factor
+        if len(candidates) > num_best:
+            split = numpy.argpartition(-partial, num_best)
+            best = candidates[split[:num_best]]
+            missing += max(partial[split[num_best:]].max(), 0)
+        else:
+            best = candidates
+        best = best[best != i]
+
+        query = numpy.zeros(self.meta['num_terms'], dtype=numpy.float32)
+        query[words] = word_weights
+        exact = self.to_csr()[best].dot(query)
+
+        # unless nothing left out could beat the last result, read all the postings
+        kth = numpy.partition(exact, len(exact) - limit)[len(exact) - limit] if len(exact) >= limit else 0
+        if missing > 0 and kth <= missing:
+            rows, scores, missing = self._read_postings(words, word_weights)
+            exact = numpy.bincount(rows, weights=scores, minlength=len(self))
+            exact[i] = 0
+            if len(exact) > limit:
+                kth = numpy.partition(exact, len(exact) - limit)[len(exact) - limit]
+            # keeping the ties with the last result, which the sort below breaks by row
+            best = numpy.flatnonzero(exact >= max(kth, numpy.finfo(numpy.float32).tiny))
+            exact = exact[best]
+
+        order = numpy.lexsort((best, -exact))[:limit]
+        message_ids = self._array('message_ids')
+        return [(int(message_ids[best[j]]), float(exact[j])) for j in order if exact[j] > 0]
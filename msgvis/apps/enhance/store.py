@@ -0,0 +1,163 @@
+"""
+Topic models on disk.
+
+Each saved gensim model gets its own directory under ``TOPIC_MODEL_ROOT``:
+
+.. code-block :: text
+
+    topic_models/
+        model_12/
+            lda.model           the pickled model
+            lda.model.state     its training state
+            *.npy               every numpy array, stored separately
+            meta.json           metadata and a sha1 checksum of each file
+
+Because the arrays are separate ``.npy`` files, models are loaded with
+``mmap='r'``: every process (web workers, the topic pipeline, inference
+workers) maps the same pages read-only instead of holding a private copy.
+Loaded models are also kept in a small per-process LRU cache, which notices
+when a model is saved again.
+"""
+import hashlib
+import json
+import logging
+import shutil
+import tempfile
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MODEL_FILENAME = 'lda.model'
+
+
+@contextmanager
+def atomic_directory(path):
+    """
+    Yields a temporary directory next to ``path`` to write into, which
+    replaces ``path`` if the block finishes without an exception.
+    """
+    if not path.parent.exists():
+        path.parent.makedirs()
+    temp_path = path.__class__(tempfile.mkdtemp(prefix='.building-', dir=path.parent))
+    try:
+        yield temp_path
+
+        if path.exists():
+            shutil.rmtree(path)
+        temp_path.rename(path)
+    except:
+        shutil.rmtree(temp_path, ignore_errors=True)
+        raise
+
+
+def file_checksum(filename, block_size=1 << 20):
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as fp:
+        while True:
+            block = fp.read(block_size)
+            if not block:
+                break
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+class TopicModelStore(object):
+    """
+    Saves gensim topic models under ``root`` and loads them memory-mapped,
+    keeping the last ``cache_size`` loaded models.
+    """
+
+    def __init__(self, root, cache_size=4):
+        self.root = root
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def path_for(self, model_id):
+        return self.root / ('model_%d' % model_id)
+
+    def exists(self, model_id):
+        return (self.path_for(model_id) / 'meta.json').exists()
+
+    def get_meta(self, model_id):
+        with open(self.path_for(model_id) / 'meta.json', 'rb') as fp:
+            return json.load(fp)
+
+    def save(self, model_id, lda, metadata=None):
+        """Save a gensim model, replacing any saved before. Returns its metadata."""
+        import gensim
+
+        path = self.path_for(model_id)
+        with atomic_directory(path) as temp_path:
+            # sep_limit=0 puts every array in its own .npy file, so all of them can be mapped
+            lda.save(temp_path / MODEL_FILENAME, sep_limit=0)
+
+            meta = dict(metadata or {})
+            meta.update({
+                'model': model_id,
+                'saved_at': datetime.utcnow().isoformat(),
+                'gensim_version': gensim.__version__,
+                'num_topics': lda.num_topics,
+                'num_terms': lda.num_terms,
+                'checksums': dict((f.name, file_checksum(f)) for f in sorted(temp_path.files())),
+            })
+            with open(temp_path / 'meta.json', 'wb') as fp:
+                json.dump(meta, fp, indent=2, sort_keys=True)
+
+        self._cache.pop(model_id, None)
+        logger.info("Saved topic model %d in %s" % (model_id, path))
+        return meta
+
+    def load(self, model_id, mmap='r'):
+        """
+        Load a saved gensim model. With the default ``mmap='r'``, its arrays
+        are read-only and the model comes from the cache if it hasn't been
+        saved again since. Pass ``mmap=None`` for a private copy that can be
+        trained further.
+        """
+        from gensim.models import LdaMulticore
+
+        if mmap is None:
+            return LdaMulticore.load(self.path_for(model_id) / MODEL_FILENAME)
+
+        saved_at = self.get_meta(model_id)['saved_at']
+        cached = self._cache.pop(model_id, None)
+        if cached is not None and cached[0] == saved_at:
+            self._cache[model_id] = cached
+            return cached[1]
+
+        lda = LdaMulticore.load(self.path_for(model_id) / MODEL_FILENAME, mmap=mmap)
+        self._cache[model_id] = (saved_at, lda)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return lda
+
+    def verify(self, model_id):
+        """Return the names of the model's files that don't match their checksums."""
+        path = self.path_for(model_id)
+        checksums = self.get_meta(model_id)['checksums']
+        return sorted(name for name, checksum in checksums.iteritems()
+                      if not (path / name).exists() or file_checksum(path / name) != checksum)
+
+    def delete(self, model_id):
+        self._cache.pop(model_id, None)
+        path = self.path_for(model_id)
+        if path.exists():
+            shutil.rmtree(path)
+
+    def clear_cache(self):
+        self._cache.clear()
+
+
+_stores = {}
+
+
+def get_store():
+    """The store for the ``TOPIC_MODEL_ROOT`` setting, shared within the process."""
+    root = settings.TOPIC_MODEL_ROOT
+    if root not in _stores:
+        _stores[root] = TopicModelStore(root, cache_size=settings.TOPIC_MODEL_CACHE_SIZE)
+    return _stores[root]
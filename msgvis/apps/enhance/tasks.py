@@ -1,14 +1,17 @@
 import logging
 
+from django.db.models import Max
+
 from models import Dictionary, MessageWord, Word, MessageTopic, TweetWord, PrecalcCategoricalDistribution
 from msgvis.apps.corpus.models import Dataset, Message
 from msgvis.apps.dimensions import registry
 from msgvis.apps.datatable import models as datatable_models
 import codecs
 import re
-from time import time
+from time import time, sleep
 import subprocess
 import os
+import errno
 import glob
 from nltk.stem import WordNetLemmatizer
 
@@ -46,14 +49,21 @@ class DbTextIterator(object):
 
 
 class DbWordVectorIterator(object):
-    def __init__(self, dictionary, freq_field='tfidf'):
+    def __init__(self, dictionary, freq_field='tfidf', after_message_id=None):
         self.dictionary = dictionary
         self.freq_field = freq_field
+        self.after_message_id = after_message_id
         self.current_message_id = None
         self.current_vector = None
 
+    def _queryset(self):
+        qset = MessageWord.objects.filter(dictionary=self.dictionary)
+        if self.after_message_id is not None:
+            qset = qset.filter(message_id__gt=self.after_message_id)
+        return qset
+
     def __iter__(self):
-        qset = MessageWord.objects.filter(dictionary=self.dictionary).order_by('message')
+        qset = self._queryset().order_by('message')
         self.current_message_id = None
         self.current_vector = []
         current_position = 0
@@ -78,19 +88,36 @@ class DbWordVectorIterator(object):
             self.current_vector.append((word_idx, freq))
 
         # one more extra one
-        yield self.current_vector
+        if self.current_message_id is not None:
+            yield self.current_vector
 
     def __len__(self):
         from django.db.models import Count
 
-        count = MessageWord.objects \
-            .filter(dictionary=self.dictionary) \
+        count = self._queryset() \
             .aggregate(Count('message', distinct=True))
 
         if count:
             return count['message__count']
 
 
+class VocabularyCorpus(object):
+    """Wraps a corpus, leaving out the words past the first ``num_terms``."""
+
+    def __init__(self, corpus, num_terms):
+        self.corpus = corpus
+        self.num_terms = num_terms
+        self.current_message_id = None
+
+    def __iter__(self):
+        for bow in self.corpus:
+            self.current_message_id = self.corpus.current_message_id
+            yield [(word_index, freq) for word_index, freq in bow if word_index < self.num_terms]
+
+    def __len__(self):
+        return len(self.corpus)
+
+
 class Tokenizer(object):
     def __init__(self, texts, *filters):
         """
@@ -164,13 +191,472 @@ class SimpleTokenizer(Tokenizer):
         return [token for sent in sents for token in self._tokenize(sent)]
 
 
+class RegexTokenizer(SimpleTokenizer):
+    """
+    Produces exactly the same words as :class:`SimpleTokenizer`, much faster.
+
+    Because :class:`SimpleTokenizer` removes all punctuation before splitting
+    on non-words, its words are the runs of letters, digits and underscores
+    between whitespace, with the punctuation in between removed. Splitting
+    into sentences first only matters when a sentence ends without
+    whitespace between two words (e.g. ``"lol!@bob"``), so only texts that
+    might contain such a break go through NLTK; the rest take one regex
+    substitution and a split.
+
+    Filters that are sets are merged into one set, and
+    :class:`PrefixWordFilter` filters are checked with one ``startswith``.
+    """
+    # a sentence end followed by punctuation or whitespace that punctuation removal drops...
+    _possible_break = re.compile(ur"[.?!](?:[?!)\";}\]*:@'({\[]|[^\S \t\n\r\f\v])", re.UNICODE)
+    # ...in a run of punctuation between two words
+    _sentence_break = re.compile(ur"[A-Za-z0-9_][^A-Za-z0-9_ \t\n\r\f\v]*[.?!]"
+                                 ur"(?=[?!)\";}\]*:@'({\[]|[^\S \t\n\r\f\v])"
+                                 ur"[^A-Za-z0-9_ \t\n\r\f\v]*[A-Za-z0-9_]", re.UNICODE)
+
+    def __init__(self, *args, **kwargs):
+        super(RegexTokenizer, self).__init__(*args, **kwargs)
+
+        stopwords = set()
+        prefix_filters = []
+        other_filters = []
+        for f in self.filters:
+            if isinstance(f, (set, frozenset)):
+                stopwords.update(f)
+            elif isinstance(f, PrefixWordFilter):
+                prefix_filters.append(f)
+            else:
+                other_filters.append(f)
+
+        self.stopwords = frozenset(stopwords)
+        self.prefixes = tuple(f.prefix for f in prefix_filters)
+        self.prefix_filters = prefix_filters
+        self.other_filters = other_filters
+
+    def tokenize(self, text):
+        stopwords = self.stopwords
+        words = [word for word in self.split(text.lower()) if word not in stopwords]
+
+        if self.prefixes:
+            prefixes = self.prefixes
+            words = [word for word in words
+                     if not (word.startswith(prefixes) and any(word in f for f in self.prefix_filters))]
+        if self.other_filters:
+            words = [word for word in words if not any(word in f for f in self.other_filters)]
+
+        max_length = self.max_length
+        return [word if len(word) < max_length else word[:max_length - 1] for word in words]
+
+    def split(self, text):
+        if self._possible_break.search(text) and self._sentence_break.search(text):
+            return super(RegexTokenizer, self).split(text)
+        return self._strip_punct.sub(u'', text).split()
+
+
+_worker_tokenizer = None
+
+
+def _init_tokenizer_worker(tokenizer_class, filters):
+    """Runs once in each tokenizer process."""
+    global _worker_tokenizer
+    _worker_tokenizer = tokenizer_class(None, *filters)
+
+
+def _build_partial_dictionary(texts):
+    """Runs in a tokenizer process: builds a gensim dictionary for one shard of texts."""
+    from gensim.corpora import Dictionary as GensimDictionary
+
+    return GensimDictionary(_worker_tokenizer.tokenize(text) for text in texts)
+
+
+def merge_gensim_dictionaries(dictionaries):
+    """
+    Merge gensim dictionaries built from consecutive shards of a corpus.
+
+    Tokens keep the order in which they first appear, so the result is the
+    same as a dictionary built from the whole corpus in one pass: the same
+    token ids, document frequencies and document, position and
+    nonzero counts.
+    """
+    from gensim.corpora import Dictionary as GensimDictionary
+
+    merged = GensimDictionary()
+    for dictionary in dictionaries:
+        for token, token_id in sorted(dictionary.token2id.iteritems(), key=lambda item: item[1]):
+            merged_id = merged.token2id.setdefault(token, len(merged.token2id))
+            merged.dfs[merged_id] = merged.dfs.get(merged_id, 0) + dictionary.dfs.get(token_id, 0)
+            if hasattr(dictionary, 'cfs'):
+                merged.cfs[merged_id] = merged.cfs.get(merged_id, 0) + dictionary.cfs.get(token_id, 0)
+
+        merged.num_docs += dictionary.num_docs
+        merged.num_pos += dictionary.num_pos
+        merged.num_nnz += dictionary.num_nnz
+
+    return merged
+
+
+def _tokenize_shard(texts):
+    """Runs in a tokenizer process: tokenizes one shard of texts."""
+    return [_worker_tokenizer.tokenize(text) for text in texts]
+
+
+def _map_shards(texts, fn, tokenizer_class, filters, workers=2, shard_size=10000):
+    """
+    Split texts into shards of ``shard_size`` consecutive texts and apply ``fn``
+    to each shard in a pool of tokenizer processes, yielding the results in order.
+    Only this process reads the texts, so the workers never touch the database.
+    """
+    from msgvis.apps.enhance.parallel import chunks, ordered_imap
+
+    return ordered_imap(fn, chunks(texts, shard_size), workers=workers,
+                        initializer=_init_tokenizer_worker, initargs=(tokenizer_class, filters),
+                        label="shards")
+
+
+def build_gensim_dictionary(texts, tokenizer_class, filters, workers=2, shard_size=10000):
+    """
+    Tokenize texts in a pool of processes and build a gensim dictionary.
+
+    Each process tokenizes a shard of consecutive texts and builds a partial
+    dictionary, and the partial dictionaries are merged in order with
+    :func:`merge_gensim_dictionaries`.
+    """
+    partials = list(_map_shards(texts, _build_partial_dictionary, tokenizer_class, filters,
+                                workers=workers, shard_size=shard_size))
+
+    logger.info("Merging %d partial dictionaries" % len(partials))
+    return merge_gensim_dictionaries(partials)
+
+
+class MemoryMappedArrays(object):
+    """
+    A directory of raw binary arrays, memory-mapped when they are read,
+    described by a ``meta.json`` that records the length of each array.
+    Subclasses list their arrays and types in ``dtypes``.
+    """
+    dtypes = {}
+
+    def __init__(self, path):
+        self.path = path
+        self._meta = None
+        self._arrays = {}
+
+    def exists(self):
+        return (self.path / 'meta.json').exists()
+
+    @property
+    def meta(self):
+        if self._meta is None:
+            import json
+
+            with open(self.path / 'meta.json', 'rb') as fp:
+                self._meta = json.load(fp)
+        return self._meta
+
+    def _array(self, name):
+        if name not in self._arrays:
+            import numpy
+
+            if self.meta['lengths'][name] == 0:
+                # empty files can't be mapped
+                self._arrays[name] = numpy.zeros(0, dtype=self.dtypes[name])
+            else:
+                self._arrays[name] = numpy.memmap(self.path / (name + '.bin'), dtype=self.dtypes[name], mode='r')
+        return self._arrays[name]
+
+    @classmethod
+    def _building(cls, path):
+        """
+        Yields a temporary directory next to ``path`` to write the arrays into,
+        which replaces ``path`` if everything was written.
+        """
+        from msgvis.apps.enhance.store import atomic_directory
+
+        return atomic_directory(path)
+
+
+class TokenCache(MemoryMappedArrays):
+    """
+    The tokens of every message in a :class:`TopicContext`, saved on disk
+    so that the dictionary, the bags of words and later reruns don't have
+    to tokenize the messages again.
+
+    A cache is a directory with the message ids, an offset into the token
+    stream for each message, and the token stream itself as token ids into
+    a vocabulary, all as raw binary arrays that are memory-mapped when read.
+    It is keyed by the context's dictionary settings and is rebuilt when the
+    messages it covers have changed.
+    """
+    dtypes = {
+        'message_ids': 'int64',
+        'offsets': 'int64',
+        'tokens': 'int32',
+    }
+
+    def __init__(self, path):
+        super(TokenCache, self).__init__(path)
+        self._vocab = None
+
+    @classmethod
+    def get_path(cls, dataset_id, settings):
+        import hashlib
+        from django.conf import settings as django_settings
+
+        key = hashlib.sha1(settings).hexdigest()
+        return django_settings.TOKEN_CACHE_ROOT / ('dataset_%d' % dataset_id) / key
+
+    @property
+    def vocab(self):
+        if self._vocab is None:
+            import json
+
+            with open(self.path / 'vocab.json', 'rb') as fp:
+                self._vocab = json.load(fp)
+        return self._vocab
+
+    def is_valid(self, queryset, settings):
+        """True if the cache exists and covers exactly the messages in the queryset."""
+        from django.db.models import Count, Max
+
+        if not self.exists():
+            return False
+
+        current = queryset.aggregate(count=Count('id'), last=Max('id'))
+        return self.meta['settings'] == settings and \
+            self.meta['message_count'] == current['count'] and \
+            self.meta['last_message_id'] == current['last']
+
+    def __len__(self):
+        return self.meta['message_count']
+
+    def documents(self):
+        """Yield ``(message id, tokens)`` for every message, in id order."""
+        vocab = self.vocab
+        message_ids = self._array('message_ids')
+        offsets = self._array('offsets')
+        tokens = self._array('tokens')
+        for i in xrange(len(message_ids)):
+            yield int(message_ids[i]), [vocab[t] for t in tokens[offsets[i]:offsets[i + 1]].tolist()]
+
+    def __iter__(self):
+        for message_id, tokens in self.documents():
+            yield tokens
+
+    @classmethod
+    def build(cls, path, queryset, tokenizer_class, filters, settings, workers=0, shard_size=10000):
+        """Tokenize the messages in the queryset, in id order, and save their tokens at ``path``."""
+        import json
+        from array import array
+
+        queryset = queryset.order_by('id')
+        message_ids = [message_id for message_id in queryset.values_list('id', flat=True).iterator()]
+        texts = queryset.values_list('text', flat=True).iterator()
+
+        if workers > 0:
+            shards = _map_shards(texts, _tokenize_shard, tokenizer_class, filters,
+                                 workers=workers, shard_size=shard_size)
+        else:
+            tokenizer = tokenizer_class(None, *filters)
+            shards = ([tokenizer.tokenize(text)] for text in texts)
+
+        with cls._building(path) as temp_path:
+            vocab = {}
+            offsets = array('l', [0])
+            position = 0
+            with open(temp_path / 'tokens.bin', 'wb') as tokens_file:
+                for documents in shards:
+                    tokens = array('i')
+                    for document in documents:
+                        for token in document:
+                            tokens.append(vocab.setdefault(token, len(vocab)))
+                        position += len(document)
+                        offsets.append(position)
+                    tokens.tofile(tokens_file)
+
+            if len(offsets) - 1 != len(message_ids):
+                raise RuntimeError("The messages changed while they were being tokenized")
+
+            # int64 on every platform
+            with open(temp_path / 'offsets.bin', 'wb') as fp:
+                fp.write(_int64_bytes(offsets))
+            with open(temp_path / 'message_ids.bin', 'wb') as fp:
+                fp.write(_int64_bytes(message_ids))
+
+            with open(temp_path / 'vocab.json', 'wb') as fp:
+                json.dump(sorted(vocab, key=vocab.get), fp)
+
+            with open(temp_path / 'meta.json', 'wb') as fp:
+                json.dump({
+                    'settings': settings,
+                    'message_count': len(message_ids),
+                    'last_message_id': message_ids[-1] if message_ids else None,
+                    'lengths': {
+                        'message_ids': len(message_ids),
+                        'offsets': len(offsets),
+                        'tokens': position,
+                    },
+                }, fp)
+
+        logger.info("Cached %d tokens for %d messages at %s" % (position, len(message_ids), path))
+        return cls(path)
+
+
+class BowCorpus(MemoryMappedArrays):
+    """
+    A dictionary's bags of words exported from :class:`MessageWord` to a
+    compressed sparse row matrix on disk, with a row per message. It is a
+    drop-in replacement for :class:`DbWordVectorIterator`: iterating yields
+    each message's ``(word index, frequency)`` pairs and sets
+    ``current_message_id``, but every pass reads memory-mapped arrays
+    instead of querying the database.
+
+    The export is reused until the dictionary's word vectors change.
+    """
+    dtypes = {
+        'message_ids': 'int64',
+        'indptr': 'int64',
+        'indices': 'int32',
+        'data': 'float64',
+    }
+
+    def __init__(self, path):
+        super(BowCorpus, self).__init__(path)
+        self.current_message_id = None
+
+    @classmethod
+    def get_path(cls, dictionary, freq_field='tfidf'):
+        from django.conf import settings
+
+        return settings.BOW_CORPUS_ROOT / ('dictionary_%d' % dictionary.id) / freq_field
+
+    @classmethod
+    def get_signature(cls, dictionary):
+        """What the export depends on: the dictionary and its word vectors."""
+        return {
+            'dictionary': dictionary.id,
+            'time': dictionary.time.isoformat() if dictionary.time else None,
+            'num_docs': dictionary.num_docs,
+            'num_nnz': dictionary.num_nnz,
+            'vectors': MessageWord.objects.filter(dictionary=dictionary).count(),
+        }
+
+    @classmethod
+    def for_dictionary(cls, dictionary, freq_field='tfidf'):
+        """Get the dictionary's corpus, exporting it first if it is missing or out of date."""
+        corpus = cls(cls.get_path(dictionary, freq_field))
+        signature = cls.get_signature(dictionary)
+        if not corpus.exists() or corpus.meta['signature'] != signature:
+            logger.info("Exporting word vectors to %s" % corpus.path)
+            corpus = cls.export(corpus.path, dictionary, freq_field, signature)
+        return corpus
+
+    @classmethod
+    def export(cls, path, dictionary, freq_field='tfidf', signature=None):
+        """Write the dictionary's word vectors at ``path``, in message order."""
+        import json
+        from array import array
+
+        if signature is None:
+            signature = cls.get_signature(dictionary)
+
+        rows = MessageWord.objects.filter(dictionary=dictionary) \
+            .order_by('message') \
+            .values_list('message_id', 'word_index', freq_field)
+
+        with cls._building(path) as temp_path:
+            message_ids = array('l')
+            indptr = array('l', [0])
+            count = 0
+            batch_size = 100000
+            with open(temp_path / 'indices.bin', 'wb') as indices_file, \
+                    open(temp_path / 'data.bin', 'wb') as data_file:
+                indices = array('i')
+                data = array('d')
+                for message_id, word_index, freq in rows.iterator():
+                    if not message_ids or message_ids[-1] != message_id:
+                        if message_ids:
+                            indptr.append(count)
+                        message_ids.append(message_id)
+                    indices.append(word_index)
+                    data.append(freq)
+                    count += 1
+
+                    if len(indices) >= batch_size:
+                        indices.tofile(indices_file)
+                        data.tofile(data_file)
+                        indices = array('i')
+                        data = array('d')
+
+                indices.tofile(indices_file)
+                data.tofile(data_file)
+            if message_ids:
+                indptr.append(count)
+
+            with open(temp_path / 'indptr.bin', 'wb') as fp:
+                fp.write(_int64_bytes(indptr))
+            with open(temp_path / 'message_ids.bin', 'wb') as fp:
+                fp.write(_int64_bytes(message_ids))
+
+            with open(temp_path / 'meta.json', 'wb') as fp:
+                json.dump({
+                    'signature': signature,
+                    'freq_field': freq_field,
+                    'num_terms': len(dictionary.gensim_dictionary),
+                    'lengths': {
+                        'message_ids': len(message_ids),
+                        'indptr': len(indptr),
+                        'indices': count,
+                        'data': count,
+                    },
+                }, fp)
+
+        logger.info("Exported %d word vectors of %d messages to %s" % (count, len(message_ids), path))
+        return cls(path)
+
+    @property
+    def message_ids(self):
+        return self._array('message_ids')
+
+    def __len__(self):
+        return self.meta['lengths']['message_ids']
+
+    def __iter__(self):
+        message_ids = self.message_ids
+        indptr = self._array('indptr')
+        indices = self._array('indices')
+        data = self._array('data')
+        self.current_message_id = None
+        for i in xrange(len(message_ids)):
+            self.current_message_id = int(message_ids[i])
+            start, end = indptr[i], indptr[i + 1]
+            yield zip(indices[start:end].tolist(), data[start:end].tolist())
+
+            if (i + 1) % 100000 == 0:
+                logger.info("Iterating through word-vectors: item %d" % (i + 1))
+
+    def to_csr(self):
+        """The whole corpus as a ``scipy.sparse.csr_matrix``, still backed by the memory maps."""
+        from scipy.sparse import csr_matrix
+
+        return csr_matrix((self._array('data'), self._array('indices'), self._array('indptr')),
+                          shape=(len(self), self.meta['num_terms']), copy=False)
+
+
+def _int64_bytes(values):
+    import numpy
+
+    return numpy.asarray(values, dtype='int64').tostring()
+
+
 class TopicContext(object):
-    def __init__(self, name, queryset, tokenizer, filters, minimum_frequency=2):
+    def __init__(self, name, queryset, tokenizer, filters, minimum_frequency=2,
+                 use_token_cache=True, use_bow_corpus=True):
         self.name = name
         self.queryset = queryset
         self.tokenizer = tokenizer
         self.filters = filters
         self.minimum_frequency = minimum_frequency
+        self.use_token_cache = use_token_cache
+        self.use_bow_corpus = use_bow_corpus
 
     def queryset_str(self):
         return str(self.queryset.query)
@@ -194,11 +680,52 @@ class TopicContext(object):
         return results.last()
 
 
-    def build_dictionary(self, dataset_id):
-        texts = DbTextIterator(self.queryset)
+    def get_token_cache(self, dataset_id, workers=0, shard_size=10000):
+        """
+        Get the :class:`TokenCache` for the context's messages, tokenizing
+        them (in ``workers`` processes, if given) if there is no valid cache.
+        """
+        settings = self.get_dict_settings()
+        cache = TokenCache(TokenCache.get_path(dataset_id, settings))
+        if not cache.is_valid(self.queryset, settings):
+            logger.info("Tokenizing messages into %s" % cache.path)
+            cache = TokenCache.build(cache.path, self.queryset, self.tokenizer, self.filters, settings,
+                                     workers=workers, shard_size=shard_size)
+        return cache
+
+    def build_dictionary(self, dataset_id, workers=0, shard_size=10000):
+        """
+        Build and save a dictionary for the context's messages. With ``workers``,
+        the messages are tokenized in that many processes, ``shard_size`` at a time.
+        Either way, the messages are read in id order, so the result is the same.
 
-        tokenized_texts = self.tokenizer(texts, *self.filters)
+        If ``use_token_cache`` is set, the tokens come from the context's
+        :class:`TokenCache`, which is built first if needed.
+        """
+        queryset = self.queryset.order_by('id')
         dataset = Dataset.objects.get(pk=dataset_id)
+
+        if self.use_token_cache:
+            cache = self.get_token_cache(dataset_id, workers=workers, shard_size=shard_size)
+            return Dictionary._create_from_texts(tokenized_texts=cache,
+                                                 name=self.name,
+                                                 minimum_frequency=self.minimum_frequency,
+                                                 dataset=dataset,
+                                                 settings=self.get_dict_settings())
+
+        if workers > 0:
+            texts = queryset.values_list('text', flat=True).iterator()
+            gensim_dict = build_gensim_dictionary(texts, self.tokenizer, self.filters,
+                                                  workers=workers, shard_size=shard_size)
+            return Dictionary._create_from_gensim_dictionary(gensim_dict,
+                                                             name=self.name,
+                                                             minimum_frequency=self.minimum_frequency,
+                                                             dataset=dataset,
+                                                             settings=self.get_dict_settings())
+
+        texts = DbTextIterator(queryset)
+
+        tokenized_texts = self.tokenizer(texts, *self.filters)
         return Dictionary._create_from_texts(tokenized_texts=tokenized_texts,
                                              name=self.name,
                                              minimum_frequency=self.minimum_frequency,
@@ -210,66 +737,189 @@ class TopicContext(object):
 
 
     def build_bows(self, dictionary):
-        texts = DbTextIterator(self.queryset)
+        if self.use_token_cache and dictionary.dataset_id is not None:
+            cache = self.get_token_cache(dictionary.dataset_id)
+            dictionary._vectorize_documents(cache.documents(), len(cache))
+            dictionary.last_message_id = cache.meta['last_message_id']
+            dictionary.save()
+            return
+
+        # messages that arrive in the meantime are left for update_topics
+        last_message_id = self.queryset.aggregate(last=Max('id'))['last']
+        queryset = self.queryset.filter(id__lte=last_message_id or 0)
+
+        texts = DbTextIterator(queryset)
         tokenized_texts = self.tokenizer(texts, *self.filters)
 
-        dictionary._vectorize_corpus(queryset=self.queryset,
+        dictionary._vectorize_corpus(queryset=queryset,
                                      tokenizer=tokenized_texts)
+        dictionary.last_message_id = last_message_id
+        dictionary.save()
+
+    def get_new_messages(self, dictionary):
+        """The context's messages that are not in the dictionary yet, in id order."""
+        last_message_id = dictionary.last_message_id
+        if last_message_id is None:
+            # from before the dictionary kept track
+            last_message_id = MessageWord.objects.filter(dictionary=dictionary) \
+                .aggregate(last=Max('message'))['last'] or 0
+        return self.queryset.filter(id__gt=last_message_id).order_by('id')
+
+    def update_topics(self, dictionary, model, workers=0, top_k=None, min_probability=0.01):
+        """
+        Bring a dictionary and its topic model up to date with the messages
+        that were added since they were built, without touching the rest:
+        the new messages are tokenized and added to the dictionary, their
+        word vectors are saved, the model is updated online with them, and
+        their topics are inferred. Returns the number of new messages.
+        """
+        messages = self.get_new_messages(dictionary)
+        rows = list(messages.values_list('id', 'text'))
+        if not rows:
+            logger.info("No new messages for dictionary %d" % dictionary.id)
+            return 0
+
+        after_message_id = dictionary.last_message_id
+        if after_message_id is None:
+            after_message_id = rows[0][0] - 1
+
+        texts = [text for message_id, text in rows]
+        if workers > 0:
+            tokenized = [tokens for shard in _map_shards(texts, _tokenize_shard, self.tokenizer, self.filters,
+                                                         workers=workers)
+                         for tokens in shard]
+        else:
+            tokenizer = self.tokenizer(None, *self.filters)
+            tokenized = [tokenizer.tokenize(text) for text in texts]
+
+        dictionary._extend(tokenized, minimum_frequency=self.minimum_frequency)
+        dictionary._vectorize_documents(((message_id, tokens) for (message_id, text), tokens in zip(rows, tokenized)),
+                                        len(rows))
+        dictionary.last_message_id = rows[-1][0]
+        dictionary.save()
+
+        # words added to the dictionary since the model was built are left out until it is rebuilt
+        lda = model.load_from_file(mmap=None)
+        corpus = VocabularyCorpus(DbWordVectorIterator(dictionary, after_message_id=after_message_id), lda.num_terms)
+
+        dictionary._update_lda(model, corpus, lda=lda)
+        dictionary._apply_lda(model, corpus, lda=lda, workers=workers,
+                              top_k=top_k, min_probability=min_probability, replace=False)
+
+        if len(corpus):
+            # perplexity on the new messages only
+            dictionary._evaluate_lda(model, corpus, lda=lda)
+
+        logger.info("Updated dictionary %d and topic model %d with %d messages" % (dictionary.id, model.id, len(rows)))
+        return len(rows)
+
+    def get_bow_corpus(self, dictionary):
+        """
+        The dictionary's word vectors, from its :class:`BowCorpus` export
+        if ``use_bow_corpus`` is set, or else straight from the database.
+        """
+        if self.use_bow_corpus:
+            return BowCorpus.for_dictionary(dictionary)
+        return DbWordVectorIterator(dictionary)
 
     def build_lda(self, dictionary, num_topics=30, **kwargs):
-        corpus = DbWordVectorIterator(dictionary)
+        corpus = self.get_bow_corpus(dictionary)
         return dictionary._build_lda(self.name, corpus, num_topics=num_topics, **kwargs)
 
-    def apply_lda(self, dictionary, model, lda=None):
-        corpus = DbWordVectorIterator(dictionary)
-        return dictionary._apply_lda(model, corpus, lda=lda)
+    def apply_lda(self, dictionary, model, lda=None, workers=0, top_k=None, min_probability=0.01):
+        corpus = self.get_bow_corpus(dictionary)
+        return dictionary._apply_lda(model, corpus, lda=lda, workers=workers,
+                                     top_k=top_k, min_probability=min_probability)
 
     def evaluate_lda(self, dictionary, model, lda=None):
-        corpus = DbWordVectorIterator(dictionary)
+        corpus = self.get_bow_corpus(dictionary)
         return dictionary._evaluate_lda(model, corpus, lda=lda)
 
 
 class LambdaWordFilter(object):
-    def __init__(self, fn):
+    def __init__(self, fn, description=None):
         self.fn = fn
+        self.description = description or fn.__name__
 
     def __contains__(self, item):
         return self.fn(item)
 
+    def __repr__(self):
+        # stable across runs, since filters are part of the dictionary settings
+        return "LambdaWordFilter(%r)" % self.description
+
+
+class PrefixWordFilter(object):
+    """Filters out words that start with ``prefix`` and are at least ``min_length`` long."""
 
-def standard_topic_pipeline(context, dataset_id, num_topics, **kwargs):
-    dictionary = context.find_dictionary()
+    def __init__(self, prefix, min_length=0):
+        self.prefix = prefix
+        self.min_length = min_length
+
+    def __contains__(self, item):
+        return item.startswith(self.prefix) and len(item) >= self.min_length
+
+    def __repr__(self):
+        return "PrefixWordFilter(%r, %d)" % (self.prefix, self.min_length)
+
+
+def standard_topic_pipeline(context, dataset_id, num_topics, workers=0, top_k=None, min_probability=0.01,
+                            rebuild=False, **kwargs):
+    dictionary = None if rebuild else context.find_dictionary()
     if dictionary is None:
-        dictionary = context.build_dictionary(dataset_id=dataset_id)
+        dictionary = context.build_dictionary(dataset_id=dataset_id, workers=workers)
 
     if not context.bows_exist(dictionary):
         context.build_bows(dictionary)
 
     model, lda = context.build_lda(dictionary, num_topics=num_topics, **kwargs)
-    context.apply_lda(dictionary, model, lda)
+    context.apply_lda(dictionary, model, lda, workers=workers, top_k=top_k, min_probability=min_probability)
     context.evaluate_lda(dictionary, model, lda)
 
 
+def incremental_topic_pipeline(context, dataset_id, num_topics, workers=0, top_k=None, min_probability=0.01,
+                               rebuild=False, **kwargs):
+    """
+    Update the context's dictionary and latest topic model with new messages,
+    or build them with :func:`standard_topic_pipeline` if there are none
+    yet or ``rebuild`` is set.
+    """
+    dictionary = None if rebuild else context.find_dictionary()
+    model = None
+    if dictionary is not None and context.bows_exist(dictionary):
+        model = dictionary.topicmodel_set.order_by('-id').first()
+
+    if model is None:
+        return standard_topic_pipeline(context, dataset_id=dataset_id, num_topics=num_topics, workers=workers,
+                                       top_k=top_k, min_probability=min_probability, rebuild=rebuild, **kwargs)
+
+    context.update_topics(dictionary, model, workers=workers, top_k=top_k, min_probability=min_probability)
+
+
 def default_topic_context(name, dataset_id):
     dataset = Dataset.objects.get(pk=dataset_id)
     queryset = dataset.message_set.filter(language__code='en')
 
     filters = [
         set(get_stoplist()),
-        LambdaWordFilter(lambda word: word.startswith('http') and len(word) > 4)
+        PrefixWordFilter('http', min_length=5)
     ]
 
     return TopicContext(name=name, queryset=queryset,
-                        tokenizer=SimpleTokenizer,
+                        tokenizer=RegexTokenizer,
                         filters=filters,
                         minimum_frequency=4)
 
 
 def import_from_tweet_parser_results(dataset_id, filename):
+    from msgvis.apps.enhance.models import TermTimeline
+    from msgvis.apps.enhance.cooccurrence import CooccurrenceMatrix
+
     current_msg_id = -1
     current_msg = None
     word_list = []
     count = 0
+    linked = False
     with codecs.open(filename, encoding='utf-8', mode='r') as f:
         print "Reading file %s" % filename
 
@@ -279,6 +929,7 @@ def import_from_tweet_parser_results(dataset_id, filename):
                 # save the previous word list
                 if len(word_list) > 0:
                     current_msg.tweet_words.add(*word_list)
+                    linked = True
                     word_list = []
                     count += 1
                     if count % 1000 == 0:
@@ -307,118 +958,768 @@ def import_from_tweet_parser_results(dataset_id, filename):
         # save the previous word list
         if len(word_list) > 0:
             current_msg.tweet_words.add(*word_list)
+            linked = True
             word_list = []
         print "Processed %d messages" % count
         print "Time: %.2fs" % (time() - start)
 
-def precalc_categorical_dimension(dataset_id=1, dimension_key=None):
-    datatable = datatable_models.DataTable(primary_dimension=dimension_key)
-    dataset = Dataset.objects.get(id=dataset_id)
-
-    # remove existing calculation
-    PrecalcCategoricalDistribution.objects.filter(dimension_key=dimension_key).delete()
-
-    result = datatable.generate(dataset)
-    bulk = []
-    for bucket in result["table"]:
-        level = bucket[dimension_key]
-        if level is None:
-            level = ""
-        count = bucket["value"]
-        obj = PrecalcCategoricalDistribution(dataset=dataset, dimension_key=dimension_key, level=level, count=count)
-        bulk.append(obj)
-
-    PrecalcCategoricalDistribution.objects.bulk_create(objs=bulk, batch_size=10000)
+    # the words have changed under the dataset's term timelines and co-occurrence
+    if linked:
+        TermTimeline.objects.filter(dataset_id=dataset_id).delete()
+        CooccurrenceMatrix.delete(dataset_id)
+
+def read_tweet_parser_results(lines):
+    """
+    Read lemmatized tweet parser results (the ``.out.id`` files from
+    :func:`lemmatize_tweets`) and yield ``(message id, [(original_text, pos, text)])``
+    for each message, leaving out punctuation, emoticons and urls like
+    :func:`import_from_tweet_parser_results` does.
+    """
+    message_id = None
+    words = []
+    for line in lines:
+        id_match = re.match("ID=(\d+)", line)
+        if id_match:
+            if message_id is not None:
+                yield message_id, words
+            message_id = int(id_match.groups()[0])
+            words = []
+            continue
+
+        word_match = re.match("(.+)\t(.+)\t(.+)", line)
+        if word_match and message_id is not None:
+            original_text, pos, text = word_match.groups()
+            if not re.search('[,~U]', pos):
+                words.append((original_text, pos, text))
+
+    if message_id is not None:
+        yield message_id, words
+
+
+class TweetWordImporter(object):
+    """
+    Links messages to their :class:`TweetWord` from tweet parser results in
+    bulk, instead of a query per message and per word.
+
+    Messages are read ``batch_size`` at a time. The dataset's words are
+    kept in a map from ``(original_text, pos, text)`` to id, so only the
+    words a batch is the first to use are inserted, and the links are
+    written with :func:`msgvis.apps.importer.loading.load_rows`. Each batch
+    is its own transaction, and messages that are already linked to a word
+    are not linked again, so an interrupted import can be run again.
+    The dataset's term timelines are deleted once any links are written.
+    """
+    batch_size = 5000
+    print_every = 50000
+
+    def __init__(self, dataset_id):
+        from django.db import connection
+
+        self.dataset_id = dataset_id
+        self.messages = 0
+        self.links = 0
+        self.new_words = 0
+        self.missing_messages = 0
+        self.timelines_deleted = False
+
+        # MySQL compares strings case-insensitively
+        self.fold = connection.vendor == 'mysql'
+
+        self.word_ids = {}
+        rows = TweetWord.objects.filter(dataset_id=dataset_id)\
+            .order_by('id')\
+            .values_list('id', 'original_text', 'pos', 'text')
+        for row in rows.iterator():
+            self.word_ids.setdefault(self._key(row[1:]), row[0])
+
+    def _key(self, word):
+        if self.fold:
+            return tuple(value.lower() if value is not None else value for value in word)
+        return tuple(word)
+
+    def run(self, results):
+        """Import ``(message id, words)`` pairs, like those from :func:`read_tweet_parser_results`."""
+        from msgvis.apps.enhance.parallel import chunks
 
+        start = time()
+        next_report = self.print_every
+        for batch in chunks(results, self.batch_size):
+            self.import_batch(batch)
+
+            if self.messages >= next_report:
+                self.report(start)
+                next_report += self.print_every
+
+        self.report(start)
+
+    def report(self, start):
+        seconds = time() - start
+        print "Processed %d messages (%.0f messages/s): %d links, %d new words, %d unknown messages" % (
+            self.messages, self.messages / seconds if seconds else 0,
+            self.links, self.new_words, self.missing_messages)
+
+    def import_batch(self, batch):
+        from django.db import transaction
+        from msgvis.apps.importer.bulk import chunked
+        from msgvis.apps.importer.loading import load_rows
+
+        through = TweetWord.messages.through
+        message_ids = [message_id for message_id, words in batch]
+
+        with transaction.atomic():
+            existing_messages = set()
+            linked = set()
+            for chunk in chunked(message_ids):
+                existing_messages.update(Message.objects.filter(id__in=chunk).values_list('id', flat=True))
+                linked.update(through.objects.filter(message_id__in=chunk).values_list('message_id', 'tweetword_id'))
+
+            # insert the words seen for the first time, then look up their ids
+            new_words = {}
+            for message_id, words in batch:
+                if message_id in existing_messages:
+                    for word in words:
+                        key = self._key(word)
+                        if key not in self.word_ids:
+                            new_words.setdefault(key, word)
+            if new_words:
+                load_rows(TweetWord, ('dataset', 'original_text', 'pos', 'text'),
+                          [(self.dataset_id,) + word for word in new_words.itervalues()])
+                original_texts = set(word[0] for word in new_words.itervalues())
+                for chunk in chunked(original_texts):
+                    rows = TweetWord.objects.filter(dataset_id=self.dataset_id, original_text__in=chunk)\
+                        .order_by('id')\
+                        .values_list('id', 'original_text', 'pos', 'text')
+                    for row in rows:
+                        self.word_ids.setdefault(self._key(row[1:]), row[0])
+                self.new_words += len(new_words)
+
+            links = []
+            for message_id, words in batch:
+                if message_id not in existing_messages:
+                    self.missing_messages += 1
+                    continue
+                for word in words:
+                    link = (message_id, self.word_ids[self._key(word)])
+                    if link not in linked:
+                        linked.add(link)
+                        links.append(link)
+            self.links += load_rows(through, ('message', 'tweetword'), links)
 
-def dump_tweets(dataset_id, save_path):
-    dataset = Dataset.objects.get(id=dataset_id)
-    total_count = dataset.message_set.count()
-    messages = dataset.message_set.all().exclude(time__isnull=True)
+            if links and not self.timelines_deleted:
+                from msgvis.apps.enhance.models import TermTimeline
+                from msgvis.apps.enhance.cooccurrence import CooccurrenceMatrix
+                TermTimeline.objects.filter(dataset_id=self.dataset_id).delete()
+                CooccurrenceMatrix.delete(self.dataset_id)
+                self.timelines_deleted = True
 
-    start = 0
-    limit = 10000
+        self.messages += len(batch)
 
-    while start < total_count:
-        filename = "%s/dataset_%d_message_%d_%d.txt" %(save_path, dataset_id, start, start + limit)
-        with codecs.open(filename, encoding='utf-8', mode='w') as f:
-            for msg in messages[start:start + limit]:
 
-                try:
-                    tweet_id = msg.id
-                    full_name = msg.sender.full_name.lower() if msg.sender.full_name is not None else ""
-                    username = msg.sender.username.lower() if msg.sender.username is not None else ""
-                    text = msg.text.lower()
+def precalc_categorical_dimension(dataset_id=1, dimension_key=None):
+    """Recalculate the distribution of one dimension in a dataset."""
+    return build_categorical_distribution(dataset_id, dimension_key)
 
-                    line = "TWEETID%dSTART\n" %(tweet_id)
-                    f.write(line)
 
-                    line = "%s @%s" %(full_name, username)
-                    f.write(line)
+def build_categorical_distribution(dataset_id, dimension_key):
+    """
+    Count a dataset's messages by level of a categorical dimension and
+    replace its precalculated distribution with the counts.
 
-                    line = "%s\n" %(text)
-                    f.write(line)
+    The new rows are written under a staging generation, which readers
+    don't see, and then swapped in within one short transaction, so a
+    reader finds either the old distribution or the whole new one. Other
+    datasets and dimensions are left alone. Returns the number of levels.
+    """
+    from django.db import transaction
+    from msgvis.apps.enhance.models import LIVE_GENERATION
+    from msgvis.apps.importer.bulk import bulk_create
 
-                    line = "TWEETID%dEND\n" %(tweet_id)
-                    f.write(line)
+    dataset = Dataset.objects.get(id=dataset_id)
+    rows = PrecalcCategoricalDistribution.all_generations.filter(dataset=dataset, dimension_key=dimension_key)
+    generation = max(rows.aggregate(Max('generation'))['generation__max'], LIVE_GENERATION) + 1
+
+    counts = count_categorical_levels(dataset, [dimension_key], dataset.message_set.all())
+    bulk_create(PrecalcCategoricalDistribution, [
+        PrecalcCategoricalDistribution(dataset=dataset, dimension_key=dimension_key, level=level,
+                                       count=count, generation=generation)
+        for (_, level), count in counts.iteritems()
+    ])
+
+    with transaction.atomic():
+        staged = rows.filter(generation=generation)
+        if staged.count() != len(counts):
+            raise RuntimeError("The %s distribution of dataset %d changed while it was built" %
+                               (dimension_key, dataset_id))
+        rows.filter(generation=LIVE_GENERATION).delete()
+        staged.update(generation=LIVE_GENERATION)
+        # leftovers of builds that were interrupted
+        rows.filter(generation__gt=LIVE_GENERATION, generation__lt=generation).delete()
+
+    return len(counts)
+
+
+def _build_distribution_job(job):
+    dataset_id, dimension_key = job
+    start = time()
+    try:
+        levels = build_categorical_distribution(dataset_id, dimension_key)
+    except Exception as e:
+        logger.exception("Precalculating %s of dataset %d failed" % (dimension_key, dataset_id))
+        return dataset_id, dimension_key, None, time() - start, repr(e)
+    return dataset_id, dimension_key, levels, time() - start, None
+
+
+def precalc_categorical_distributions(dataset_ids, dimension_keys, workers=0):
+    """
+    Rebuild the distributions of several dimensions in several datasets
+    with :func:`build_categorical_distribution`. With ``workers``, that many
+    processes each build one (dataset, dimension) at a time over their own
+    database connection. Yields ``(dataset id, dimension key, levels,
+    seconds, error)`` as each finishes; ``levels`` is None if it failed.
+    Workers need a database server; on sqlite everything runs in this process.
+    """
+    from django.db import connection
+
+    jobs = [(dataset_id, dimension_key) for dataset_id in dataset_ids for dimension_key in dimension_keys]
+
+    if workers > 0 and connection.vendor == 'sqlite':
+        # sqlite lets only one process write at a time
+        logger.warning("Precalculating in this process; sqlite can't take several writers")
+        workers = 0
+
+    if workers > 0:
+        import multiprocessing
+        from django.db import connections
+
+        # the workers must not share this process's connections
+        for connection in connections.all():
+            connection.close()
+        pool = multiprocessing.Pool(workers)
+        try:
+            for result in pool.imap_unordered(_build_distribution_job, jobs):
+                yield result
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+    else:
+        for job in jobs:
+            yield _build_distribution_job(job)
+
+
+def count_categorical_levels(dataset, dimension_keys, messages, counts=None):
+    """
+    Count some messages of a dataset by level for each of the dimensions,
+    exactly as :func:`precalc_categorical_dimension` would, adding them to
+    ``counts`` (a dictionary of ``(dimension_key, level)`` to count).
+    """
+    from django.utils.encoding import smart_text
+
+    if counts is None:
+        counts = {}
+
+    messages = datatable_models.counted_messages(dataset, messages)
+    for dimension_key in dimension_keys:
+        datatable = datatable_models.DataTable(primary_dimension=dimension_key)
+        for bucket in datatable.render(messages):
+            level = bucket[dimension_key]
+            if level is None:
+                level = ""
+            key = (dimension_key, smart_text(level))
+            counts[key] = counts.get(key, 0) + bucket["value"]
+
+    return counts
+
+
+def update_categorical_distributions(dataset, deltas):
+    """
+    Add the changes in ``deltas`` (a dictionary of ``(dimension_key, level)``
+    to a positive or negative count) to the precalculated distributions
+    of a dataset, without recounting the rest of the dataset.
+    """
+    from msgvis.apps.importer.bulk import bulk_create, chunked
+    from msgvis.apps.importer.counters import update_with_case
+
+    deltas = dict((key, delta) for key, delta in deltas.iteritems() if delta)
+
+    by_dimension = {}
+    for dimension_key, level in deltas:
+        by_dimension.setdefault(dimension_key, []).append(level)
+
+    increments = {}
+    for dimension_key, levels in by_dimension.iteritems():
+        for chunk in chunked(levels):
+            existing = dataset.distributions.filter(dimension_key=dimension_key, level__in=chunk)
+            for distribution in existing.only('id', 'level'):
+                key = (dimension_key, distribution.level)
+                if key in deltas:
+                    increments[distribution.id] = deltas.pop(key)
+
+    update_with_case(PrecalcCategoricalDistribution, 'count', increments, increment=True)
+    for ids in chunked(increments.keys()):
+        dataset.distributions.filter(id__in=ids, count__lte=0).delete()
+
+    bulk_create(PrecalcCategoricalDistribution, [
+        PrecalcCategoricalDistribution(dataset=dataset, dimension_key=dimension_key, level=level, count=count)
+        for (dimension_key, level), count in deltas.iteritems() if count > 0
+    ])
+
+
+def build_term_timeline(dataset_id, base_bin_size=60):
+    """
+    Count the words of a dataset's messages in time bins of
+    ``base_bin_size`` seconds, roll the counts up to each bin size that
+    DataTable may ask for (those that are multiples of it), and save them as a new
+    :class:`msgvis.apps.enhance.models.TermTimeline`. Once it is complete,
+    it replaces the dataset's older timelines. Returns the timeline.
+    """
+    from django.db import connection, transaction
+    from django.db.models import Count, Min
+    from msgvis.apps.enhance.models import TermTimeline, TermTimeBin
+    from msgvis.apps.enhance.parallel import chunks
+    from msgvis.apps.importer.loading import load_rows
 
-                except:
-                    pass
+    dataset = Dataset.objects.get(id=dataset_id)
+    timeline = TermTimeline.objects.create(dataset=dataset, base_bin_size=base_bin_size,
+                                           dataset_version=dataset.version,
+                                           start_time=dataset.start_time, end_time=dataset.end_time)
+    bin_sizes = timeline.bin_sizes
+    if not bin_sizes:
+        timeline.delete()
+        raise ValueError("No time step is a multiple of %d seconds" % base_bin_size)
+
+    # the same grouping DataTable uses for words by time, but on unix timestamps
+    time_dimension = registry.get_dimension('time')
+    expression = time_dimension.bin_start_expressions[connection.vendor].format(
+        field_name=time_dimension.field_name, bin_size=base_bin_size)
+    messages = datatable_models.counted_messages(dataset)._clone()
+    messages.query.extra.update({'bin_start': (expression, ())})
+    base_bins = messages.values('tweet_words__text', 'bin_start')\
+        .annotate(count=Count('id'), first_time=Min('time'), last_time=Max('time'))
+
+    columns = ('timeline', 'text', 'bin_size', 'start', 'count', 'first_time', 'last_time')
+    to_db = connection.ops.value_to_db_datetime
+
+    def rows(bin_size, cells):
+        for (text, start), (count, first_time, last_time) in cells:
+            yield (timeline.id, text, bin_size, start, count, first_time, last_time)
+
+    # the base bins are only kept if they are a step themselves
+    keep_base = base_bin_size in bin_sizes
+    rollup_sizes = [bin_size for bin_size in bin_sizes if bin_size != base_bin_size]
+
+    start = time()
+    rollups = [{} for bin_size in rollup_sizes]
+    written = 0
+    for batch in chunks(base_bins.iterator(), 10000):
+        cells = []
+        for row in batch:
+            text, bin_start = row['tweet_words__text'], int(row['bin_start'])
+            # database datetimes sort like the times, so they are converted only once
+            cell = (row['count'], to_db(row['first_time']), to_db(row['last_time']))
+            cells.append(((text, bin_start), cell))
+
+            for bin_size, rollup in zip(rollup_sizes, rollups):
+                key = (text, bin_start // bin_size * bin_size)
+                if key in rollup:
+                    count, first_time, last_time = rollup[key]
+                    rollup[key] = (count + cell[0], min(first_time, cell[1]), max(last_time, cell[2]))
+                else:
+                    rollup[key] = cell
+        if keep_base:
+            written += load_rows(TermTimeBin, columns, rows(base_bin_size, cells))
 
-        start += limit
+    for bin_size, rollup in zip(rollup_sizes, rollups):
+        written += load_rows(TermTimeBin, columns, rows(bin_size, rollup.iteritems()))
+    print "Wrote %d bins for dataset %d in %.2fs" % (written, dataset_id, time() - start)
 
-def parse_tweets(tweet_parser_path, input_path, output_path):
-    parser_cmd = "%s/runTagger.sh" %tweet_parser_path
-    input_files = glob.glob("%s/dataset_*.txt" % input_path)
+    with transaction.atomic():
+        timeline.complete = True
+        timeline.save(update_fields=['complete'])
+        dataset.term_timelines.exclude(id=timeline.id).delete()
 
-    for input_file in input_files:
-        results = re.search('(dataset_.+)\.txt', input_file)
-        filename = results.groups()[0]
+    return timeline
 
-        output_file = "%s/%s.out" % (output_path, filename)
 
-        with codecs.open(output_file, encoding='utf-8', mode='w') as f:
-            cmd = "%s --output-format conll %s" %(parser_cmd, input_file)
-            print cmd
-            try:
-                subprocess.call(cmd.split(" "), stdout=f, stderr=subprocess.PIPE)
-            except:
-                pass
+def _score_sentiment(texts):
+    from msgvis.apps.enhance.models import get_message_sentiment
+    return [get_message_sentiment(text or u"") for text in texts]
 
 
+def compute_sentiment(dataset_id, workers=0, batch_size=5000, missing_only=False):
+    """
+    Score the sentiment of a dataset's messages, or with ``missing_only``,
+    of those that have none (such as messages imported with ``--no-sentiment``).
 
-def lemmatize_tweets(input_path, output_path):
-    wordnet_lemmatizer = WordNetLemmatizer()
+    Messages are read ``batch_size`` at a time by keyset pagination and
+    scored in ``workers`` processes if given. Only the scores that changed
+    are written, with ``UPDATE ... CASE`` statements in one transaction per
+    batch, so an interrupted run keeps its progress. Afterwards, the
+    dataset's precalculated sentiment distribution is brought up to date
+    and its ``version`` incremented. Returns the number of messages changed.
+    """
+    from django.db import transaction
+    from msgvis.apps.enhance.parallel import keyset_pages, ordered_imap
+    from msgvis.apps.importer.counters import update_with_case
 
-    input_files = glob.glob("%s/dataset_*.out" % input_path)
+    dataset = Dataset.objects.get(id=dataset_id)
+    # not dataset.message_set, which would load each message's deferred dataset_id
+    messages = Message.objects.filter(dataset=dataset).only('id', 'text', 'sentiment')
+    if missing_only:
+        messages = messages.filter(sentiment__isnull=True)
+
+    def batches():
+        for page in keyset_pages(messages, batch_size):
+            yield [(msg.id, msg.sentiment) for msg in page], [msg.text for msg in page]
+
+    def scored_batches():
+        if workers > 0:
+            # only the texts go to the workers
+            pages = []
+
+            def texts():
+                for page in batches():
+                    pages.append(page[0])
+                    yield page[1]
+
+            for scores in ordered_imap(_score_sentiment, texts(), workers=workers, label="batches"):
+                yield pages.pop(0), scores
+        else:
+            for rows, texts in batches():
+                yield rows, _score_sentiment(texts)
+
+    start = time()
+    scored = 0
+    changed = 0
+    for rows, scores in scored_batches():
+        updates = dict((message_id, score) for (message_id, current), score in zip(rows, scores)
+                       if score != current)
+        with transaction.atomic():
+            update_with_case(Message, 'sentiment', updates)
+
+        scored += len(rows)
+        changed += len(updates)
+        print "Scored %d messages (%.0f messages/s), %d changed" % (scored, scored / max(time() - start, 1e-6),
+                                                                   changed)
+
+    if changed:
+        with transaction.atomic():
+            if dataset.distributions.filter(dimension_key='sentiment').exists():
+                counts = count_categorical_levels(dataset, ['sentiment'], dataset.message_set.all())
+                for distribution in dataset.distributions.filter(dimension_key='sentiment'):
+                    key = ('sentiment', distribution.level)
+                    counts[key] = counts.get(key, 0) - distribution.count
+                update_categorical_distributions(dataset, counts)
+
+            dataset = Dataset.objects.select_for_update().get(pk=dataset.pk)
+            dataset.version += 1
+            dataset.save(update_fields=['version'])
+
+    return changed
+
+
+def _tweet_dump_rows(messages):
+    """
+    The ``(id, full name, user name, text)`` of each message to give the tweet
+    parser, leaving out messages without a sender or text.
+    """
+    return [(msg.id, msg.sender.full_name, msg.sender.username, msg.text)
+            for msg in messages if msg.sender is not None and msg.text is not None]
+
+
+def format_tweet_dump(rows):
+    """Format rows from :func:`_tweet_dump_rows` as tweet parser input."""
+    lines = []
+    for tweet_id, full_name, username, text in rows:
+        lines.append(u"TWEETID%dSTART\n" % tweet_id)
+        lines.append(u"%s @%s %s\n" % ((full_name or u"").lower(), (username or u"").lower(), text.lower()))
+        lines.append(u"TWEETID%dEND\n" % tweet_id)
+    return u"".join(lines)
+
+
+def _write_tweet_dump(shard):
+    filename, rows = shard
+    with codecs.open(filename, encoding='utf-8', mode='w') as f:
+        f.write(format_tweet_dump(rows))
+    return filename
+
+
+def iter_tweet_dump_shards(dataset_id, shard_size=10000):
+    """
+    Read the timed messages of a dataset for the tweet parser, yielding
+    lists of up to ``shard_size`` rows from :func:`_tweet_dump_rows`.
+    Messages are read by keyset pagination on id, with their senders.
+    """
+    from msgvis.apps.enhance.parallel import keyset_pages
+
+    messages = Message.objects.filter(dataset_id=dataset_id)\
+        .exclude(time__isnull=True)\
+        .select_related('sender')\
+        .only('id', 'text', 'sender__full_name', 'sender__username')
+    for page in keyset_pages(messages, shard_size):
+        yield _tweet_dump_rows(page)
+
+
+def dump_tweets(dataset_id, save_path, shard_size=10000, workers=0):
+    """
+    Write the timed messages of a dataset into tweet parser input files of
+    ``shard_size`` messages each, named after the first and last message id.
+    With ``workers``, the files are formatted and written by that many
+    processes while this one reads the next pages.
+    """
+    def shards():
+        for rows in iter_tweet_dump_shards(dataset_id, shard_size):
+            if rows:
+                filename = "%s/dataset_%d_message_%d_%d.txt" % (save_path, dataset_id, rows[0][0], rows[-1][0])
+                yield filename, rows
+
+    if workers > 0:
+        from msgvis.apps.enhance.parallel import ordered_imap
+        filenames = list(ordered_imap(_write_tweet_dump, shards(), workers=workers, label="tweet dumps"))
+    else:
+        filenames = [_write_tweet_dump(shard) for shard in shards()]
+
+    print "Wrote %d files" % len(filenames)
+    return filenames
+
+
+def stream_tweets_to_tagger(dataset_id, tweet_parser_path, output_path, shard_size=10000):
+    """
+    Pipe the timed messages of a dataset straight into one tweet parser
+    process, instead of dumping them to files first, and save its output
+    where :func:`parse_tweets` would. Returns the output filename, which is
+    marked done only if the tweet parser succeeded.
+    """
+    output_file = "%s/dataset_%d_stream.out" % (output_path, dataset_id)
+    cmd = ["%s/runTagger.sh" % tweet_parser_path, "--output-format", "conll", "-"]
+    print " ".join(cmd)
+
+    # the output of an earlier run is about to be replaced
+    if is_done(output_file):
+        os.remove(output_file + '.done')
 
-    for input_file in input_files:
-        results = re.search('(dataset_.+)\.out', input_file)
+    count = 0
+    broken = False
+    with open(output_file, 'wb') as out, open(os.devnull, 'wb') as devnull:
+        tagger = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=out, stderr=devnull)
+        try:
+            for rows in iter_tweet_dump_shards(dataset_id, shard_size):
+                tagger.stdin.write(format_tweet_dump(rows).encode('utf-8'))
+                count += len(rows)
+            tagger.stdin.close()
+        except IOError as e:
+            # the tagger exited before reading every message
+            if e.errno != errno.EPIPE:
+                tagger.kill()
+                raise
+            broken = True
+        except:
+            tagger.kill()
+            raise
+        finally:
+            tagger.wait()
+
+    if tagger.returncode == 0 and not broken:
+        mark_done(output_file)
+        print "Streamed %d messages into the tweet parser" % count
+    else:
+        print "Tagging %d streamed messages failed (%d)" % (count, tagger.returncode)
+    return output_file
+
+
+def is_done(filename):
+    """True if :func:`mark_done` has been called for a file."""
+    return os.path.exists(filename + '.done')
+
+
+def mark_done(filename):
+    """Record that a file was completely written, so resumed runs can skip it."""
+    with open(filename + '.done', 'wb'):
+        pass
+
+
+def start_tagger(tweet_parser_path, input_file, output_file):
+    """
+    Start a tweet parser process tagging ``input_file`` into ``output_file``.
+    Its log goes to ``output_file.log``. Returns the ``Popen``.
+    """
+    cmd = ["%s/runTagger.sh" % tweet_parser_path, "--output-format", "conll", input_file]
+    print " ".join(cmd)
+    with open(output_file, 'wb') as out, open(output_file + '.log', 'wb') as log:
+        return subprocess.Popen(cmd, stdout=out, stderr=log)
+
+
+def run_taggers(tweet_parser_path, jobs, workers=1, poll_interval=0.1):
+    """
+    Tag ``(input_file, output_file)`` jobs with up to ``workers`` tweet
+    parser processes at once, yielding ``(input_file, output_file, returncode)``
+    as each one finishes. Successful outputs are marked done.
+    """
+    jobs = iter(jobs)
+    running = []
+    while True:
+        while len(running) < workers:
+            job = next(jobs, None)
+            if job is None:
+                break
+            running.append(job + (start_tagger(tweet_parser_path, *job),))
+
+        if not running:
+            return
+
+        finished = [job for job in running if job[2].poll() is not None]
+        if not finished:
+            sleep(poll_interval)
+            continue
+
+        for input_file, output_file, tagger in finished:
+            running.remove((input_file, output_file, tagger))
+            if tagger.returncode == 0:
+                mark_done(output_file)
+            else:
+                print "Tagging %s failed (%d), see %s.log" % (input_file, tagger.returncode, output_file)
+            yield input_file, output_file, tagger.returncode
+
+
+def parse_tweets(tweet_parser_path, input_path, output_path, workers=1):
+    """
+    Tag the dump files in ``input_path`` into ``output_path``, running up to
+    ``workers`` tweet parser processes at once. Files tagged by an earlier
+    run are skipped. Returns the dump files that failed to tag.
+    """
+    jobs = []
+    for input_file in sorted(glob.glob("%s/dataset_*.txt" % input_path)):
+        results = re.search('(dataset_.+)\.txt', input_file)
         filename = results.groups()[0]
 
-        output_file = "%s/%s_converted.out" % (output_path, filename)
-        output_file2 = "%s/%s_converted.out.id" % (output_path, filename)
-
-        with codecs.open(output_file, encoding='utf-8', mode='w') as out:
-            with codecs.open(output_file2, encoding='utf-8', mode='w') as out2:
-                print >>out, "<doc>"
-                with codecs.open(input_file, encoding='utf-8', mode='r') as f:
-                    for line in f:
-                        if re.search('TWEETID(\d+)START', line):
-                            results = re.match('TWEETID(\d+)START', line)
-                            groups = results.groups()
-                            print >>out, "<p>"
-                            print >>out2, "ID=%d" %(int(groups[0]))
-
-                        elif re.search('TWEETID(\d+)END', line):
-                            print >>out, "<\p>"
-                        elif re.search("(.+)\t(.+)\t(.+)\n", line):
-                            results = re.match("(.+)\t(.+)\t(.+)\n", line)
-                            groups = results.groups()
-                            word = groups[0]
-                            pos = groups[1]
-                            lemma = wordnet_lemmatizer.lemmatize(word)
-                            print >>out, "%s\t%s\t%s" %(word, pos, lemma)
-                            print >>out2, "%s\t%s\t%s" %(word, pos, lemma)
-
-                print >>out, "</doc>"
+        output_file = "%s/%s.out" % (output_path, filename)
+        if not is_done(output_file):
+            jobs.append((input_file, output_file))
+
+    print "Tagging %d files" % len(jobs)
+    failed = []
+    for input_file, output_file, returncode in run_taggers(tweet_parser_path, jobs, workers=workers):
+        if returncode != 0:
+            failed.append(input_file)
+    return failed
+
+
+class CachedLemmatizer(object):
+    """
+    Lemmatizes words with ``lemmatize`` (by default, WordNet's), remembering
+    the lemmas of up to ``max_size`` words. Tweets repeat the same words
+    over and over, so most words are only looked up in WordNet once.
+    """
+    max_size = 500000
+
+    def __init__(self, lemmatize=None):
+        if lemmatize is None:
+            lemmatize = WordNetLemmatizer().lemmatize
+        self.lemmatize = lemmatize
+        self.cache = {}
+
+    def __call__(self, word):
+        try:
+            return self.cache[word]
+        except KeyError:
+            if len(self.cache) >= self.max_size:
+                self.cache.clear()
+            lemma = self.cache[word] = self.lemmatize(word)
+            return lemma
+
+
+_TWEET_START = re.compile('TWEETID(\d+)START')
+_TWEET_END = re.compile('TWEETID(\d+)END')
+
+
+def lemmatize_tagged_file(input_file, output_file, output_id_file, lemmatizer):
+    """
+    Lemmatize one tweet parser output file, writing the converted file and
+    the ``.out.id`` file that :func:`read_tweet_parser_results` reads, which
+    is marked done. Returns the lines of the ``.out.id`` file.
+    """
+    id_lines = []
+    with codecs.open(output_file, encoding='utf-8', mode='w') as out:
+        print >>out, "<doc>"
+        with codecs.open(input_file, encoding='utf-8', mode='r') as f:
+            for line in f:
+                if 'TWEETID' in line:
+                    start = _TWEET_START.search(line)
+                    if start:
+                        print >>out, "<p>"
+                        id_lines.append(u"ID=%d\n" % int(start.groups()[0]))
+                        continue
+                    elif _TWEET_END.search(line):
+                        print >>out, "<\p>"
+                        continue
+
+                # word, part of speech and confidence
+                fields = line.split('\t')
+                if len(fields) < 3 or not line.endswith('\n'):
+                    continue
+                word = '\t'.join(fields[:-2])
+                pos = fields[-2]
+                if word and pos and fields[-1] != '\n':
+                    id_line = u"%s\t%s\t%s\n" % (word, pos, lemmatizer(word))
+                    out.write(id_line)
+                    id_lines.append(id_line)
+        print >>out, "</doc>"
+
+    with codecs.open(output_id_file, encoding='utf-8', mode='w') as out2:
+        out2.writelines(id_lines)
+    mark_done(output_id_file)
+    return id_lines
+
+
+def _converted_filenames(input_file, output_path):
+    results = re.search('(dataset_.+)\.out', input_file)
+    filename = results.groups()[0]
+    output_file = "%s/%s_converted.out" % (output_path, filename)
+    return output_file, output_file + '.id'
+
+
+_lemmatizer = None
+
+
+def _init_lemmatizer_worker(lemmatize=None):
+    global _lemmatizer
+    _lemmatizer = CachedLemmatizer(lemmatize)
+
+
+def _lemmatize_file(files):
+    input_file, output_file, output_id_file = files
+    lemmatize_tagged_file(input_file, output_file, output_id_file, _lemmatizer)
+    return output_id_file
+
+
+def lemmatize_tweets(input_path, output_path, workers=0, lemmatize=None):
+    """
+    Lemmatize the tagged files in ``input_path`` into ``output_path``,
+    in ``workers`` processes if given. Only files the tweet parser finished
+    are read, and files lemmatized since they were last tagged are skipped.
+    ``lemmatize`` replaces WordNet's lemmatizer (mostly for testing).
+    """
+    jobs = []
+    unfinished = 0
+    for input_file in sorted(glob.glob("%s/dataset_*.out" % input_path)):
+        if not is_done(input_file):
+            unfinished += 1
+            continue
+        output_file, output_id_file = _converted_filenames(input_file, output_path)
+        if not is_done(output_id_file) or \
+                os.path.getmtime(input_file + '.done') > os.path.getmtime(output_id_file + '.done'):
+            jobs.append((input_file, output_file, output_id_file))
+
+    if unfinished:
+        print "Skipping %d files the tweet parser did not finish" % unfinished
+    print "Lemmatizing %d files" % len(jobs)
+    if workers > 0:
+        from msgvis.apps.enhance.parallel import ordered_imap
+        for output_id_file in ordered_imap(_lemmatize_file, jobs, workers=workers,
+                                           initializer=_init_lemmatizer_worker, initargs=(lemmatize,),
+                                           label="files"):
+            pass
+    else:
+        _init_lemmatizer_worker(lemmatize)
+        for job in jobs:
+            _lemmatize_file(job)
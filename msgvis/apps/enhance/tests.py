@@ -65,6 +65,44 @@ class TopicsTest(TestCase):
         topic = msg.topics.first()
         self.assertIsInstance(topic, models.Topic)
 
+    def test_backfill_dominant_topics(self):
+        """The migration adding dominant topics sets them from the latest topic model"""
+        import sys
+        from StringIO import StringIO
+        from importlib import import_module
+        from django.apps import apps
+        migration = import_module('msgvis.apps.corpus.migrations.0026_backfill_dominant_topic')
+
+        latest_model = self.dictionary.topicmodel_set.create(name="latest topic model", description="latest")
+        topic_a = latest_model.topics.create(name="topic a", description="topic a", index=0, alpha=0)
+        topic_b = latest_model.topics.create(name="topic b", description="topic b", index=1, alpha=0)
+        # made after the others, but without any topic probabilities
+        self.dictionary.topicmodel_set.create(name="empty topic model", description="empty")
+
+        first, second, untopical = [self.dataset.message_set.create(text="message %d" % i) for i in xrange(3)]
+        for msg, probabilities in ((first, (0.7, 0.3)), (second, (0.2, 0.8))):
+            for topic, probability in zip((topic_a, topic_b), probabilities):
+                models.MessageTopic.objects.create(topic_model=latest_model, topic=topic,
+                                                   message=msg, probability=probability)
+            models.MessageTopic.objects.create(topic_model=self.topic_model, topic=self.topic,
+                                               message=msg, probability=0.9)
+        models.PrecalcCategoricalDistribution.objects.create(dataset=self.dataset, dimension_key='topics',
+                                                             level="topic a", count=2)
+
+        stdout = sys.stdout
+        sys.stdout = output = StringIO()
+        try:
+            migration.set_dominant_topics(apps, None)
+        finally:
+            sys.stdout = stdout
+
+        dominant = dict(self.dataset.message_set.values_list('id', 'dominant_topic'))
+        self.assertEquals(dominant, {first.id: topic_a.id, second.id: topic_b.id, untopical.id: None})
+        self.assertEquals(latest_model.get_probable_topic(corpus_models.Message.objects.get(id=second.id)),
+                          topic_b)
+        # the precalculated distribution counted every topic of a message
+        self.assertIn("precalc_categorical_distribution %d topics" % self.dataset.id, output.getvalue())
+
     def test_topic_modeling(self):
         """Generate some test messages and actually model topics"""
 
@@ -138,3 +176,937 @@ class TopicsTest(TestCase):
             self.assertTrue(word in topic_a.name or word in topic_b.name)
             
 
+
+
+def create_random_messages(dataset, count=200, seed=3):
+    import random
+
+    rand = random.Random(seed)
+    vocab = ["word%d" % i for i in xrange(60)] + ["the", "a"]
+    for i in xrange(count):
+        # skew the vocabulary so some words are rare
+        words = [vocab[min(int(rand.expovariate(0.08)), len(vocab) - 1)] for w in xrange(rand.randint(1, 12))]
+        dataset.message_set.create(text=" ".join(words))
+
+
+class ParallelDictionaryTest(TestCase):
+    def setUp(self):
+        self.dataset = corpus_models.Dataset.objects.create(name="Test Corpus", description="My Dataset")
+        create_random_messages(self.dataset)
+
+    def make_context(self, name):
+        return tasks.TopicContext(name=name, queryset=self.dataset.message_set.all(),
+                                  tokenizer=tasks.Tokenizer,
+                                  filters=[set(["the", "a"])],
+                                  minimum_frequency=3,
+                                  use_token_cache=False)
+
+    def test_parallel_dictionary_matches_serial(self):
+        serial = self.make_context("serial").build_dictionary(dataset_id=self.dataset.id)
+        parallel = self.make_context("parallel").build_dictionary(dataset_id=self.dataset.id,
+                                                                  workers=2, shard_size=17)
+
+        self.assertEquals((parallel.num_docs, parallel.num_pos, parallel.num_nnz),
+                          (serial.num_docs, serial.num_pos, serial.num_nnz))
+        self.assertTrue(serial.words.count() > 10)
+        self.assertEquals(sorted(parallel.words.values_list('text', 'index', 'document_frequency')),
+                          sorted(serial.words.values_list('text', 'index', 'document_frequency')))
+
+    def test_merge_gensim_dictionaries(self):
+        from gensim.corpora import Dictionary as GensimDictionary
+
+        texts = [["b", "a"], ["c", "a", "a"], ["d"], ["b", "e", "c"], ["a"]]
+        whole = GensimDictionary(texts)
+        merged = tasks.merge_gensim_dictionaries([GensimDictionary(texts[:2]), GensimDictionary(texts[2:])])
+
+        self.assertEquals(merged.token2id, whole.token2id)
+        self.assertEquals(merged.dfs, whole.dfs)
+        self.assertEquals((merged.num_docs, merged.num_pos, merged.num_nnz),
+                          (whole.num_docs, whole.num_pos, whole.num_nnz))
+
+
+class CountingTokenizer(tasks.Tokenizer):
+    calls = 0
+
+    def tokenize(self, text):
+        CountingTokenizer.calls += 1
+        return super(CountingTokenizer, self).tokenize(text)
+
+
+class TokenCacheTest(TestCase):
+    def setUp(self):
+        import tempfile
+        from path import path
+        from django.test.utils import override_settings
+
+        self.cache_root = path(tempfile.mkdtemp())
+        self.settings_override = override_settings(TOKEN_CACHE_ROOT=self.cache_root)
+        self.settings_override.enable()
+
+        self.dataset = corpus_models.Dataset.objects.create(name="Test Corpus", description="My Dataset")
+        create_random_messages(self.dataset)
+        CountingTokenizer.calls = 0
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.cache_root.rmtree()
+
+    def make_context(self, use_token_cache=True):
+        return tasks.TopicContext(name="test", queryset=self.dataset.message_set.all(),
+                                  tokenizer=CountingTokenizer,
+                                  filters=[set(["the", "a"]), tasks.LambdaWordFilter(lambda w: w == "word1", "word1")],
+                                  minimum_frequency=3,
+                                  use_token_cache=use_token_cache)
+
+    def get_vectors(self, dictionary):
+        return sorted(models.MessageWord.objects.filter(dictionary=dictionary)
+                      .values_list('message_id', 'word__text', 'count', 'tfidf'))
+
+    def test_cached_tokens_match_tokenizer(self):
+        uncached_context = self.make_context(use_token_cache=False)
+        uncached = uncached_context.build_dictionary(dataset_id=self.dataset.id)
+        uncached_context.build_bows(uncached)
+
+        context = self.make_context()
+        cached = context.build_dictionary(dataset_id=self.dataset.id)
+        context.build_bows(cached)
+
+        self.assertEquals(sorted(cached.words.values_list('text', 'index', 'document_frequency')),
+                          sorted(uncached.words.values_list('text', 'index', 'document_frequency')))
+        self.assertEquals(self.get_vectors(cached), self.get_vectors(uncached))
+
+    def test_reruns_use_cache(self):
+        context = self.make_context()
+        dictionary = context.build_dictionary(dataset_id=self.dataset.id)
+        self.assertEquals(CountingTokenizer.calls, 200)
+
+        context.build_bows(dictionary)
+        self.make_context().build_dictionary(dataset_id=self.dataset.id)
+        self.assertEquals(CountingTokenizer.calls, 200)
+
+        cache = context.get_token_cache(self.dataset.id)
+        self.assertEquals(len(cache), 200)
+        tokenizer = tasks.Tokenizer(None, *context.filters)
+        for message, (message_id, tokens) in zip(self.dataset.message_set.order_by('id'), cache.documents()):
+            self.assertEquals(message_id, message.id)
+            self.assertEquals(tokens, tokenizer.tokenize(message.text))
+
+    def test_cache_is_rebuilt_for_new_messages(self):
+        context = self.make_context()
+        context.get_token_cache(self.dataset.id)
+        self.dataset.message_set.create(text="word2 word3")
+
+        cache = context.get_token_cache(self.dataset.id)
+        self.assertEquals(CountingTokenizer.calls, 401)
+        self.assertEquals(list(cache)[-1], ["word2", "word3"])
+
+    def test_parallel_cache(self):
+        settings = self.make_context().get_dict_settings()
+        path = tasks.TokenCache.get_path(self.dataset.id, settings)
+        serial = tasks.TokenCache.build(path, self.dataset.message_set.all(), tasks.Tokenizer, [set(["the"])], settings)
+        serial_documents = list(serial.documents())
+
+        parallel = tasks.TokenCache.build(path, self.dataset.message_set.all(), tasks.Tokenizer, [set(["the"])], settings,
+                                          workers=2, shard_size=17)
+        self.assertEquals(list(parallel.documents()), serial_documents)
+
+
+class BowCorpusTest(TestCase):
+    def setUp(self):
+        import tempfile
+        from path import path
+        from django.test.utils import override_settings
+
+        self.cache_root = path(tempfile.mkdtemp())
+        self.settings_override = override_settings(TOKEN_CACHE_ROOT=self.cache_root / 'tokens',
+                                                   BOW_CORPUS_ROOT=self.cache_root / 'bows')
+        self.settings_override.enable()
+
+        self.dataset = corpus_models.Dataset.objects.create(name="Test Corpus", description="My Dataset")
+        create_random_messages(self.dataset)
+
+        self.context = tasks.TopicContext(name="test", queryset=self.dataset.message_set.all(),
+                                          tokenizer=tasks.Tokenizer,
+                                          filters=[set(["the", "a"])],
+                                          minimum_frequency=3)
+        self.dictionary = self.context.build_dictionary(dataset_id=self.dataset.id)
+        self.context.build_bows(self.dictionary)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.cache_root.rmtree()
+
+    def read_vectors(self, corpus):
+        vectors = []
+        for bow in corpus:
+            vectors.append((corpus.current_message_id, sorted(bow)))
+        return vectors
+
+    def test_corpus_matches_database(self):
+        db_corpus = tasks.DbWordVectorIterator(self.dictionary)
+        corpus = tasks.BowCorpus.for_dictionary(self.dictionary)
+
+        self.assertEquals(len(corpus), len(db_corpus))
+        self.assertEquals(self.read_vectors(corpus), self.read_vectors(db_corpus))
+
+        # a second pass reads the same vectors
+        self.assertEquals(self.read_vectors(corpus), self.read_vectors(db_corpus))
+
+        matrix = corpus.to_csr()
+        self.assertEquals(matrix.shape, (len(corpus), len(self.dictionary.gensim_dictionary)))
+        self.assertEquals(matrix.nnz, models.MessageWord.objects.filter(dictionary=self.dictionary).count())
+
+    def test_word_vectors(self):
+        import math
+        from collections import Counter
+
+        gdict = self.dictionary.gensim_dictionary
+        tokenizer = tasks.Tokenizer(None, *self.context.filters)
+        expected = []
+        for message in self.dataset.message_set.all():
+            for text, count in Counter(tokenizer.tokenize(message.text)).iteritems():
+                if text in gdict.token2id:
+                    word_index = gdict.token2id[text]
+                    expected.append((message.id, text, word_index, count,
+                                     count * math.log(self.dictionary.num_docs, gdict.dfs[word_index])))
+
+        vectors = models.MessageWord.objects.filter(dictionary=self.dictionary)\
+            .values_list('message_id', 'word__text', 'word_index', 'count', 'tfidf')
+        vectors = sorted(vectors)
+        expected.sort()
+        self.assertEquals([v[:4] for v in vectors], [e[:4] for e in expected])
+        for vector, row in zip(vectors, expected):
+            self.assertAlmostEqual(vector[4], row[4])
+
+    def test_corpus_is_reused_until_vectors_change(self):
+        corpus = tasks.BowCorpus.for_dictionary(self.dictionary)
+        exported = (corpus.path / 'meta.json').mtime
+
+        self.assertEquals((tasks.BowCorpus.for_dictionary(self.dictionary).path / 'meta.json').mtime, exported)
+
+        message = self.dataset.message_set.create(text="word2 word3")
+        word = self.dictionary.words.get(text="word2")
+        models.MessageWord.objects.create(dictionary=self.dictionary, word=word, word_index=word.index,
+                                          message=message, count=1, tfidf=1.0)
+
+        corpus = tasks.BowCorpus.for_dictionary(self.dictionary)
+        self.assertEquals(self.read_vectors(corpus), self.read_vectors(tasks.DbWordVectorIterator(self.dictionary)))
+        self.assertEquals(self.read_vectors(corpus)[-1], (message.id, [(word.index, 1.0)]))
+
+    def test_apply_lda_from_corpus(self):
+        from gensim.models import LdaModel
+
+        corpus = tasks.BowCorpus.for_dictionary(self.dictionary)
+        lda = LdaModel(corpus=corpus, num_topics=3, id2word=self.dictionary.gensim_dictionary)
+        model = self.dictionary.topicmodel_set.create(name="test topic model")
+        for i in range(3):
+            model.topics.create(name="topic %d" % i, alpha=lda.alpha[i], index=i)
+
+        self.context.apply_lda(self.dictionary, model, lda)
+        from_corpus = set(model.messagetopic_set.values_list('message_id', flat=True))
+
+        model.messagetopic_set.all().delete()
+        self.context.use_bow_corpus = False
+        self.context.apply_lda(self.dictionary, model, lda)
+        from_database = set(model.messagetopic_set.values_list('message_id', flat=True))
+
+        self.assertTrue(len(from_corpus) > 0)
+        self.assertEquals(from_corpus, from_database)
+
+    def test_apply_lda_top_k(self):
+        from gensim.models import LdaModel
+
+        corpus = tasks.BowCorpus.for_dictionary(self.dictionary)
+        lda = LdaModel(corpus=corpus, num_topics=4, id2word=self.dictionary.gensim_dictionary)
+        model = self.dictionary.topicmodel_set.create(name="test topic model")
+        for i in range(4):
+            model.topics.create(name="topic %d" % i, alpha=lda.alpha[i], index=i)
+
+        for workers in (0, 2):
+            model.messagetopic_set.all().delete()
+            self.context.apply_lda(self.dictionary, model, lda, workers=workers, top_k=1, min_probability=0)
+
+            # one row per message, for its dominant topic
+            rows = sorted(model.messagetopic_set.values_list('message_id', 'topic_id'))
+            self.assertEquals(len(rows), len(corpus))
+            dominant = sorted(corpus_models.Message.objects.filter(dominant_topic__model=model)
+                              .values_list('id', 'dominant_topic_id'))
+            self.assertEquals(rows, dominant)
+
+        message = corpus_models.Message.objects.get(pk=rows[0][0])
+        self.assertEquals(model.get_probable_topic(message).id, rows[0][1])
+
+        # another model's topics are still found through the probabilities
+        other = self.dictionary.topicmodel_set.create(name="other topic model")
+        topic = other.topics.create(name="other", alpha=1, index=0)
+        other.messagetopic_set.create(topic=topic, message=message, probability=0.5)
+        self.assertEquals(other.get_probable_topic(message), topic)
+
+
+class IncrementalTopicsTest(TestCase):
+    def setUp(self):
+        import tempfile
+        from path import path
+        from django.test.utils import override_settings
+
+        self.cache_root = path(tempfile.mkdtemp())
+        self.settings_override = override_settings(TOKEN_CACHE_ROOT=self.cache_root / 'tokens',
+                                                   BOW_CORPUS_ROOT=self.cache_root / 'bows',
+                                                   TOPIC_MODEL_ROOT=self.cache_root / 'models')
+        self.settings_override.enable()
+
+        self.dataset = corpus_models.Dataset.objects.create(name="Test Corpus", description="My Dataset")
+        create_random_messages(self.dataset)
+
+        self.context = tasks.TopicContext(name="test", queryset=self.dataset.message_set.all(),
+                                          tokenizer=tasks.Tokenizer,
+                                          filters=[set(["the", "a"])],
+                                          minimum_frequency=3)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.cache_root.rmtree()
+
+    def test_update_topics(self):
+        tasks.incremental_topic_pipeline(self.context, dataset_id=self.dataset.id, num_topics=3, multicore=False)
+        dictionary = self.context.find_dictionary()
+        model = dictionary.topicmodel_set.get()
+        old_messages = set(self.dataset.message_set.values_list('id', flat=True))
+        old_vectors = models.MessageWord.objects.filter(dictionary=dictionary).count()
+        old_dominant = sorted(self.dataset.message_set.values_list('id', 'dominant_topic'))
+        old_words = set(dictionary.words.values_list('text', flat=True))
+        self.assertEquals(dictionary.last_message_id, max(old_messages))
+
+        create_random_messages(self.dataset, count=50, seed=4)
+        for i in xrange(3):
+            self.dataset.message_set.create(text="fresh word1 word2")
+
+        tasks.incremental_topic_pipeline(self.context, dataset_id=self.dataset.id, num_topics=3)
+        dictionary = models.Dictionary.objects.get(pk=dictionary.pk)
+        self.assertEquals(models.Dictionary.objects.count(), 1)
+        self.assertEquals(dictionary.topicmodel_set.get(), model)
+        self.assertEquals(dictionary.num_docs, 253)
+        self.assertEquals(dictionary.last_message_id, self.dataset.message_set.order_by('-id')[0].id)
+
+        # document frequencies match counting everything at once
+        full = tasks.Tokenizer(None, *self.context.filters)
+        from gensim.corpora import Dictionary as GensimDictionary
+        full = GensimDictionary(full.tokenize(m.text) for m in self.dataset.message_set.all())
+        for word in dictionary.words.filter(text__in=old_words | set(["fresh"])):
+            self.assertEquals(word.document_frequency, full.dfs[full.token2id[word.text]])
+        fresh = dictionary.words.get(text="fresh")
+        self.assertEquals(fresh.document_frequency, 3)
+
+        # only the new messages were vectorized and given topics
+        new_messages = self.dataset.message_set.exclude(id__in=old_messages)
+        vectors = models.MessageWord.objects.filter(dictionary=dictionary)
+        self.assertEquals(vectors.filter(message__in=old_messages).count(), old_vectors)
+        self.assertEquals(vectors.filter(word=fresh).count(), 3)
+        self.assertEquals(sorted(self.dataset.message_set.filter(id__in=old_messages)
+                                 .values_list('id', 'dominant_topic')), old_dominant)
+        with_words = new_messages.filter(id__in=vectors.values('message'))
+        self.assertEquals(with_words.filter(dominant_topic__model=model).count(), with_words.count())
+
+        # nothing new
+        self.assertEquals(self.context.update_topics(dictionary, model), 0)
+
+        # a rebuild starts over
+        tasks.incremental_topic_pipeline(self.context, dataset_id=self.dataset.id, num_topics=3, multicore=False,
+                                         rebuild=True)
+        rebuilt = self.context.find_dictionary()
+        self.assertNotEquals(rebuilt, dictionary)
+        self.assertEquals(rebuilt.num_docs, 253)
+
+
+class TopicModelStoreTest(TestCase):
+    def setUp(self):
+        import tempfile
+        from path import path
+        from gensim.models import LdaModel
+        from gensim.corpora import Dictionary as GensimDictionary
+
+        self.root = path(tempfile.mkdtemp())
+        texts = [["apple", "banana"], ["banana", "cherry"], ["cherry", "apple", "apple"]] * 5
+        gdict = GensimDictionary(texts)
+        self.lda = LdaModel(corpus=[gdict.doc2bow(text) for text in texts], num_topics=2, id2word=gdict)
+
+    def tearDown(self):
+        self.root.rmtree()
+
+    def test_save_and_load(self):
+        import numpy
+        from msgvis.apps.enhance.store import TopicModelStore
+
+        store = TopicModelStore(self.root, cache_size=1)
+        meta = store.save(5, self.lda, {'name': "fruit"})
+        self.assertEquals(store.get_meta(5)['name'], "fruit")
+        self.assertEquals(meta['num_topics'], 2)
+        self.assertEquals(store.verify(5), [])
+
+        lda = store.load(5)
+        self.assertTrue(isinstance(lda.expElogbeta, numpy.memmap))
+        self.assertTrue(numpy.allclose(lda.expElogbeta, self.lda.expElogbeta))
+        self.assertIs(store.load(5), lda)
+
+        # a private copy for training
+        self.assertFalse(isinstance(store.load(5, mmap=None).expElogbeta, numpy.memmap))
+
+        # saving again replaces the cached model
+        store.save(5, self.lda)
+        self.assertIsNot(store.load(5), lda)
+
+        # only one model is kept
+        store.save(6, self.lda)
+        six = store.load(6)
+        self.assertIsNot(store.load(5), lda)
+        self.assertIsNot(store.load(6), six)
+
+        with open(store.path_for(5) / 'lda.model', 'ab') as fp:
+            fp.write('x')
+        self.assertEquals(store.verify(5), ['lda.model'])
+
+        store.delete(5)
+        self.assertFalse(store.exists(5))
+
+    def test_topic_model_files(self):
+        from django.test.utils import override_settings
+
+        dataset = corpus_models.Dataset.objects.create(name="Test Corpus", description="My Dataset")
+        dictionary = models.Dictionary.objects.create(name="test dictionary", dataset=dataset)
+        topic_model = dictionary.topicmodel_set.create(name="test topic model")
+
+        with override_settings(TOPIC_MODEL_ROOT=self.root):
+            topic_model.save_to_file(self.lda)
+            self.assertTrue((self.root / ('model_%d' % topic_model.id) / 'meta.json').exists())
+            self.assertEquals(topic_model.load_from_file().num_topics, 2)
+
+
+class TweetWordImportTest(TestCase):
+    def setUp(self):
+        self.dataset = corpus_models.Dataset.objects.create(name="Test Corpus", description="My Dataset")
+        self.messages = [self.dataset.message_set.create(text="message %d" % i) for i in xrange(5)]
+
+        lines = []
+        for i, message in enumerate(self.messages):
+            lines.append(u"ID=%d\n" % message.id)
+            lines.append(u"cats\tN\tcat\n")
+            lines.append(u"!\t,\t!\n")
+            lines.append(u"caf\xe9\tN\tcaf\xe9\n")
+            lines.append(u"word%d\tV\tword%d\n" % (i % 2, i % 2))
+            lines.append(u"cats\tN\tcat\n")
+        lines.append(u"ID=%d\n" % (self.messages[-1].id + 100))
+        lines.append(u"lost\tN\tlost\n")
+        self.lines = lines
+
+    def get_links(self):
+        through = models.TweetWord.messages.through
+        return sorted(through.objects.values_list('message_id', 'tweetword__original_text',
+                                                  'tweetword__pos', 'tweetword__text'))
+
+    def test_bulk_import_matches_per_message_import(self):
+        import codecs
+        import tempfile
+
+        # both importers invalidate the dataset's term timelines and co-occurrence
+        from msgvis.apps.enhance.cooccurrence import CooccurrenceMatrix
+        models.TermTimeline.objects.create(dataset=self.dataset, complete=True)
+        CooccurrenceMatrix.build(self.dataset)
+
+        # the per-message import fails on unknown messages
+        with tempfile.NamedTemporaryFile(suffix='.out.id') as fp:
+            with codecs.open(fp.name, encoding='utf-8', mode='w') as f:
+                f.writelines(self.lines[:-2])
+            tasks.import_from_tweet_parser_results(self.dataset.id, fp.name)
+        expected = self.get_links()
+        self.assertEquals(len(expected), 5 * 3)
+        self.assertFalse(self.dataset.term_timelines.exists())
+        self.assertFalse(CooccurrenceMatrix.get_path(self.dataset.id).exists())
+        models.TweetWord.objects.all().delete()
+
+        importer = tasks.TweetWordImporter(self.dataset.id)
+        importer.batch_size = 2
+        importer.run(tasks.read_tweet_parser_results(self.lines))
+        self.assertEquals(self.get_links(), expected)
+        self.assertEquals(importer.missing_messages, 1)
+        self.assertEquals(models.TweetWord.objects.count(), 4)
+
+        # importing again adds nothing
+        importer = tasks.TweetWordImporter(self.dataset.id)
+        importer.run(tasks.read_tweet_parser_results(self.lines))
+        self.assertEquals(self.get_links(), expected)
+        self.assertEquals((importer.links, importer.new_words), (0, 0))
+
+
+class TweetDumpTest(TestCase):
+    def setUp(self):
+        import tempfile
+        from django.utils import timezone
+        from path import path
+
+        self.save_path = path(tempfile.mkdtemp())
+        self.dataset = corpus_models.Dataset.objects.create(name="Test Corpus", description="My Dataset")
+        sender = corpus_models.Person.objects.create(dataset=self.dataset, username="Alice", full_name="Alice A")
+        nameless = corpus_models.Person.objects.create(dataset=self.dataset, username="bob")
+        now = timezone.now()
+        for i in xrange(7):
+            self.dataset.message_set.create(text=u"Message %d caf\xe9" % i, time=now,
+                                            sender=nameless if i == 3 else sender)
+        self.dataset.message_set.create(text="no time", sender=sender)
+        self.dataset.message_set.create(text="no sender", time=now)
+
+    def tearDown(self):
+        self.save_path.rmtree()
+
+    def read_dump(self, filenames):
+        import codecs
+        return u"".join(codecs.open(filename, encoding='utf-8').read() for filename in sorted(filenames))
+
+    def test_dump_format(self):
+        filenames = tasks.dump_tweets(self.dataset.id, self.save_path, shard_size=3)
+        self.assertEquals(len(filenames), 3)
+
+        expected = []
+        for msg in self.dataset.message_set.exclude(time__isnull=True).exclude(sender__isnull=True).order_by('id'):
+            expected.append(u"TWEETID%dSTART\n%s @%s %s\nTWEETID%dEND\n" % (
+                msg.id, (msg.sender.full_name or u"").lower(), msg.sender.username.lower(), msg.text.lower(), msg.id))
+        self.assertEquals(self.read_dump(filenames), u"".join(expected))
+
+    def test_keyset_pages(self):
+        # one query per page, senders included
+        with self.assertNumQueries(3):
+            shards = list(tasks.iter_tweet_dump_shards(self.dataset.id, shard_size=3))
+        self.assertEquals([len(rows) for rows in shards], [3, 3, 1])
+
+    def test_parallel_dump_matches_serial(self):
+        serial = self.read_dump(tasks.dump_tweets(self.dataset.id, self.save_path, shard_size=2))
+        parallel_path = self.save_path / 'parallel'
+        parallel_path.mkdir()
+        parallel = tasks.dump_tweets(self.dataset.id, parallel_path, shard_size=2, workers=2)
+        self.assertEquals(self.read_dump(parallel), serial)
+
+
+FAKE_TAGGER = """#!/bin/sh
+# tags every word as a noun, like runTagger.sh --output-format conll <file>
+awk '{ for (i = 1; i <= NF; i++) print $i "\\tN\\t0.9"; print "" }' "$3"
+"""
+
+
+def fake_lemmatize(word):
+    return word.rstrip('s')
+
+
+class TweetParserPipelineTest(TestCase):
+    def setUp(self):
+        import os
+        import tempfile
+        from path import path
+
+        self.save_path = path(tempfile.mkdtemp())
+        self.tagger_path = self.save_path / 'tagger'
+        self.tagger_path.mkdir()
+        with open(self.tagger_path / 'runTagger.sh', 'wb') as f:
+            f.write(FAKE_TAGGER)
+        os.chmod(self.tagger_path / 'runTagger.sh', 0755)
+
+        self.dataset = corpus_models.Dataset.objects.create(name="Test Corpus", description="My Dataset")
+        sender = corpus_models.Person.objects.create(dataset=self.dataset, username="alice")
+        create_random_messages(self.dataset, count=50)
+        self.dataset.message_set.update(sender=sender, time=self.dataset.created_at)
+
+    def tearDown(self):
+        self.save_path.rmtree()
+
+    def make_pipeline(self):
+        from msgvis.apps.enhance.tweet_pipeline import TweetParserPipeline
+
+        pipeline = TweetParserPipeline(self.dataset.id, self.tagger_path, self.save_path, lemmatize=fake_lemmatize)
+        pipeline.shard_size = 15
+        pipeline.taggers = 2
+        pipeline.poll_interval = 0.01
+        return pipeline
+
+    def get_links(self):
+        through = models.TweetWord.messages.through
+        return sorted(through.objects.values_list('message_id', 'tweetword__original_text', 'tweetword__text'))
+
+    def test_pipeline_matches_separate_stages(self):
+        pipeline = self.make_pipeline()
+        pipeline.run()
+        self.assertEquals(pipeline.stats['import'].messages, 50)
+        self.assertEquals(pipeline.stats['tag'].shards, 4)
+        self.assertEquals(pipeline.failed, [])
+        links = self.get_links()
+        self.assertIn((self.dataset.message_set.order_by('id')[0].id, '@alice', '@alice'), links)
+        models.TweetWord.objects.all().delete()
+
+        separate_path = self.save_path / 'separate'
+        for dirname in ('parsed_tweets', 'converted_tweets'):
+            (separate_path / dirname).makedirs()
+        tasks.dump_tweets(self.dataset.id, separate_path, shard_size=15)
+        tasks.parse_tweets(self.tagger_path, separate_path, separate_path / 'parsed_tweets', workers=2)
+        tasks._init_lemmatizer_worker(fake_lemmatize)
+        for files in (separate_path / 'parsed_tweets').files('dataset_*.out'):
+            tasks._lemmatize_file((files,) + tasks._converted_filenames(files, separate_path / 'converted_tweets'))
+
+        importer = tasks.TweetWordImporter(self.dataset.id)
+        for filename in sorted((separate_path / 'converted_tweets').files('*.out.id')):
+            with open(filename) as f:
+                importer.run(tasks.read_tweet_parser_results(line.decode('utf-8') for line in f))
+        self.assertEquals(self.get_links(), links)
+
+    def test_resume(self):
+        pipeline = self.make_pipeline()
+        pipeline.run()
+        links = self.get_links()
+
+        # forget that the last two shards were imported and lemmatized
+        shards = list(pipeline.shards())
+        shards[-2].imported_marker.remove()
+        shards[-1].imported_marker.remove()
+        (shards[-1].id_file + '.done').remove()
+        (self.tagger_path / 'runTagger.sh').remove()
+
+        pipeline = self.make_pipeline()
+        pipeline.run()
+        self.assertEquals(pipeline.skipped, 2)
+        self.assertEquals(pipeline.stats['tag'].shards, 0)
+        self.assertEquals(pipeline.stats['lemmatize'].shards, 1)
+        self.assertEquals(pipeline.stats['import'].shards, 2)
+        self.assertEquals(self.get_links(), links)
+
+    def test_stream_all_imports_results(self):
+        import mock
+        from django.core.management import call_command
+
+        pipeline = self.make_pipeline()
+        pipeline.run()
+        links = self.get_links()
+        models.TweetWord.objects.all().delete()
+
+        lemmatizer = mock.Mock()
+        lemmatizer.return_value.lemmatize = fake_lemmatize
+        with mock.patch('msgvis.apps.enhance.tasks.WordNetLemmatizer', lemmatizer):
+            call_command('run_tweet_parser', self.dataset.id, self.save_path / 'stream',
+                         tweet_parser_path=self.tagger_path, stream=True, lemmatizers=0)
+        self.assertEquals(self.get_links(), links)
+
+    def test_tagger_failures(self):
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+
+        # writes part of its output, then fails
+        with open(self.tagger_path / 'runTagger.sh', 'wb') as f:
+            f.write("#!/bin/sh\necho 'partial\tN\t0.9'\nexit 3\n")
+
+        with self.assertRaises(CommandError):
+            call_command('run_tweet_parser', self.dataset.id, self.save_path / 'shards',
+                         tweet_parser_path=self.tagger_path, shard_size=15)
+
+        with self.assertRaises(CommandError):
+            call_command('run_tweet_parser', self.dataset.id, self.save_path / 'stream',
+                         tweet_parser_path=self.tagger_path, stream=True, action='parse')
+
+        # the partial output is not lemmatized
+        tasks.lemmatize_tweets(self.save_path / 'stream' / 'parsed_tweets',
+                               self.save_path / 'stream' / 'converted_tweets', lemmatize=fake_lemmatize)
+        self.assertFalse((self.save_path / 'stream' / 'converted_tweets').exists())
+        self.assertEquals(models.TweetWord.objects.count(), 0)
+
+    def test_cached_lemmatizer(self):
+        calls = []
+
+        def lemmatize(word):
+            calls.append(word)
+            return word.rstrip('s')
+
+        lemmatizer = tasks.CachedLemmatizer(lemmatize)
+        self.assertEquals([lemmatizer(word) for word in ['cats', 'dogs', 'cats']], ['cat', 'dog', 'cat'])
+        self.assertEquals(calls, ['cats', 'dogs'])
+
+
+def punkt_installed():
+    import nltk
+    try:
+        nltk.data.find('tokenizers/punkt')
+        return True
+    except LookupError:
+        return False
+
+
+class RegexTokenizerTest(TestCase):
+    texts = [
+        u"Hello there. How are you?",
+        u"lol!@bob that's great...",
+        u"Check this out: http://t.co/abc123 #win",
+        u"e.g. the U.S. economy grew 3.5% (in Q2).Then it fell",
+        u"what?!really \u201cquotes\u201d and caf\xe9s",
+        u"end.)--start and don't stop",
+        u"wow.\xa0Unicode space and a\u2026ellipsis",
+        u"@alice: RT @bob: it's a test!!! :) <3",
+        u"",
+        u"   ",
+    ]
+
+    def make_tokenizers(self, *filters):
+        from nltk.tokenize.punkt import PunktSentenceTokenizer
+
+        simple = tasks.SimpleTokenizer(None, *filters)
+        regex = tasks.RegexTokenizer(None, *filters)
+        if not punkt_installed():
+            # an untrained model still breaks sentences the same way
+            simple._sent_tokenize = regex._sent_tokenize = PunktSentenceTokenizer().tokenize
+        return simple, regex
+
+    def random_texts(self, count=2000):
+        import random
+
+        rand = random.Random(5)
+        alphabet = list(u"abcXYZ019_") * 3 + list(u" \t\n.?!,;:@'\"()[]{}*-#/\xe9\xa0\u2026") + \
+            [u"http://t.co/x", u"e.g.", u"3.5", u"--", u"Dr."]
+        return [u"".join(rand.choice(alphabet) for c in xrange(rand.randint(0, 30))) for i in xrange(count)]
+
+    def test_same_words_as_simple_tokenizer(self):
+        simple, regex = self.make_tokenizers()
+        for text in self.texts + self.random_texts():
+            self.assertEquals(regex.tokenize(text), simple.tokenize(text), repr(text))
+
+    def test_same_words_with_filters(self):
+        filters = [set(["the", "a", "and"]), frozenset(["lol"]),
+                   tasks.PrefixWordFilter('http', min_length=5),
+                   tasks.LambdaWordFilter(lambda word: word.isdigit(), "numbers")]
+        simple, regex = self.make_tokenizers(*filters)
+        for text in self.texts + self.random_texts(500):
+            self.assertEquals(regex.tokenize(text), simple.tokenize(text), repr(text))
+
+        self.assertEquals(regex.tokenize(u"The http link HTTPstcoabc ht-tp:x and 42 lols"), [u"http", u"link", u"lols"])
+
+    def test_topic_context(self):
+        dataset = corpus_models.Dataset.objects.create(name="Test Corpus", description="My Dataset")
+        create_random_messages(dataset, count=50)
+        context = tasks.TopicContext(name="regex", queryset=dataset.message_set.all(),
+                                     tokenizer=tasks.RegexTokenizer,
+                                     filters=[set(["the", "a"]), tasks.PrefixWordFilter('http', min_length=5)],
+                                     minimum_frequency=1,
+                                     use_token_cache=False)
+        dictionary = context.build_dictionary(dataset_id=dataset.id)
+        self.assertFalse(dictionary.words.filter(text__in=["the", "a"]).exists())
+        self.assertTrue(dictionary.words.filter(text="word0").exists())
+
+
+class PrecalcDistributionTest(TestCase):
+    def setUp(self):
+        from django.utils import timezone
+
+        now = timezone.now()
+        self.datasets = []
+        for d in xrange(2):
+            dataset = corpus_models.Dataset.objects.create(name="Dataset %d" % d, description="Dataset %d" % d,
+                                                           start_time=now, end_time=now)
+            for i in xrange(10):
+                dataset.message_set.create(text="Message %d" % i, time=now, sentiment=i % (3 + d) - 1)
+            self.datasets.append(dataset)
+
+    def distribution(self, dataset, dimension_key='sentiment'):
+        return dict((d.level, d.count) for d in dataset.distributions.filter(dimension_key=dimension_key))
+
+    def test_matches_datatable(self):
+        from msgvis.apps.datatable.models import DataTable
+
+        dataset = self.datasets[0]
+        self.assertEquals(tasks.precalc_categorical_dimension(dataset_id=dataset.id, dimension_key='sentiment'), 3)
+        table = DataTable(primary_dimension='sentiment').generate(dataset)['table']
+        self.assertEquals(self.distribution(dataset),
+                          dict((unicode(bucket['sentiment']), bucket['value']) for bucket in table))
+
+    def test_only_replaces_its_dataset(self):
+        first, second = self.datasets
+        tasks.precalc_categorical_dimension(dataset_id=first.id, dimension_key='sentiment')
+        tasks.precalc_categorical_dimension(dataset_id=second.id, dimension_key='sentiment')
+        expected = self.distribution(second)
+        self.assertEquals(sum(expected.values()), 10)
+
+        tasks.precalc_categorical_dimension(dataset_id=first.id, dimension_key='sentiment')
+        self.assertEquals(self.distribution(second), expected)
+
+    def test_staged_rows_are_hidden(self):
+        dataset = self.datasets[0]
+        tasks.precalc_categorical_dimension(dataset_id=dataset.id, dimension_key='sentiment')
+        expected = self.distribution(dataset)
+
+        # an interrupted build leaves rows behind that no one reads
+        models.PrecalcCategoricalDistribution.objects.create(dataset=dataset, dimension_key='sentiment',
+                                                             level="7", count=100, generation=3)
+        self.assertEquals(self.distribution(dataset), expected)
+        self.assertEquals(models.PrecalcCategoricalDistribution.objects.filter(level="7").count(), 0)
+
+        tasks.precalc_categorical_dimension(dataset_id=dataset.id, dimension_key='sentiment')
+        self.assertEquals(self.distribution(dataset), expected)
+        rows = models.PrecalcCategoricalDistribution.all_generations.filter(dataset=dataset)
+        self.assertEquals(rows.count(), len(expected))
+        self.assertEquals(set(rows.values_list('generation', flat=True)), set([models.LIVE_GENERATION]))
+
+    def test_several_datasets_and_dimensions(self):
+        dataset_ids = [dataset.id for dataset in self.datasets]
+        results = list(tasks.precalc_categorical_distributions(dataset_ids + [0], ['sentiment', 'type']))
+        self.assertEquals(len(results), 6)
+        failed = [(dataset_id, key) for dataset_id, key, levels, seconds, error in results if error]
+        self.assertEquals(failed, [(0, 'sentiment'), (0, 'type')])
+
+        for dataset in self.datasets:
+            self.assertEquals(sum(self.distribution(dataset).values()), 10)
+            self.assertEquals(sum(self.distribution(dataset, 'type').values()), 10)
+
+
+class DuplicateClustersTest(TestCase):
+    def setUp(self):
+        from django.utils import timezone as tz
+
+        self.dataset = corpus_models.Dataset.objects.create(name="Duplicates", description="Duplicates")
+        now = tz.now()
+
+        def create(text):
+            return self.dataset.message_set.create(text=text, time=now)
+
+        original = "Mudslide near Oso has closed highway 530 in both directions, crews are on the way"
+        self.original = create(original)
+        self.retweets = [create("RT @news: " + original + " http://t.co/%d" % i) for i in xrange(3)]
+        self.edited = create(original.replace("on the way", "on the road"))
+        self.others = [create("Message number %d about something entirely different, %s" % (i, word))
+                       for i, word in enumerate(("soup", "puppies", "weather"))]
+        self.empty = create("")
+
+    def test_shingles(self):
+        from msgvis.apps.enhance.duplicates import shingles
+
+        self.assertEquals(shingles("RT @someone: Big news http://t.co/abc here"), ["big news here"])
+        self.assertEquals(shingles("one two three four"), ["one two three", "two three four"])
+        self.assertEquals(shingles(" http://t.co/abc "), [])
+
+    def test_find_duplicate_clusters(self):
+        from msgvis.apps.enhance.duplicates import find_duplicate_clusters
+
+        self.assertEquals(find_duplicate_clusters(self.dataset.id, batch_size=3), (1, 5, 5))
+        clusters = dict(self.dataset.message_set.values_list('id', 'duplicate_cluster'))
+        for message in [self.original, self.edited] + self.retweets:
+            self.assertEquals(clusters[message.id], self.original.id)
+        for message in self.others + [self.empty]:
+            self.assertIsNone(clusters[message.id])
+
+        # nothing changes the second time
+        self.assertEquals(find_duplicate_clusters(self.dataset.id), (1, 5, 0))
+
+        # or after a message stops being a duplicate
+        self.dataset.message_set.filter(id=self.edited.id).update(text="Something else")
+        self.assertEquals(find_duplicate_clusters(self.dataset.id), (1, 4, 1))
+
+    def test_collapse_duplicates(self):
+        from msgvis.apps.datatable.models import DataTable
+        from msgvis.apps.enhance.duplicates import find_duplicate_clusters
+
+        find_duplicate_clusters(self.dataset.id)
+        collapsed = [self.original] + self.others + [self.empty]
+
+        examples = self.dataset.get_example_messages(collapse_duplicates=True)
+        self.assertEquals(sorted(message.id for message in examples), sorted(m.id for m in collapsed))
+        self.assertEquals(self.dataset.get_example_messages().count(), 9)
+
+        table = DataTable('duplicate_cluster').generate(self.dataset, collapse_duplicates=True)
+        self.assertEquals(sorted((row['duplicate_cluster'], row['value']) for row in table['table']),
+                          [(None, 4), (self.original.id, 1)])
+        table = DataTable('duplicate_cluster').generate(self.dataset)
+        self.assertEquals(sorted((row['duplicate_cluster'], row['value']) for row in table['table']),
+                          [(None, 4), (self.original.id, 5)])
+
+
+class SimilarityIndexTest(TestCase):
+    def setUp(self):
+        import tempfile
+        from path import path
+        from django.test.utils import override_settings
+
+        self.cache_root = path(tempfile.mkdtemp())
+        self.settings_override = override_settings(TOKEN_CACHE_ROOT=self.cache_root / 'tokens',
+                                                   BOW_CORPUS_ROOT=self.cache_root / 'bows')
+        self.settings_override.enable()
+
+        self.dataset = corpus_models.Dataset.objects.create(name="Test Corpus", description="My Dataset")
+        create_random_messages(self.dataset)
+
+        context = tasks.TopicContext(name="test", queryset=self.dataset.message_set.all(),
+                                     tokenizer=tasks.Tokenizer,
+                                     filters=[set(["the", "a"])],
+                                     minimum_frequency=3)
+        self.dictionary = context.build_dictionary(dataset_id=self.dataset.id)
+        context.build_bows(self.dictionary)
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.cache_root.rmtree()
+
+    def brute_force(self):
+        """The cosine similarity of every pair of messages, from the tf-idf weights in the database."""
+        import math
+        from collections import defaultdict
+
+        vectors = defaultdict(dict)
+        for message_id, word_index, tfidf in models.MessageWord.objects.filter(dictionary=self.dictionary)\
+                .values_list('message_id', 'word_index', 'tfidf'):
+            vectors[message_id][word_index] = tfidf
+        norms = dict((message_id, math.sqrt(sum(w * w for w in vector.values())))
+                     for message_id, vector in vectors.iteritems())
+
+        def similarity(a, b):
+            dot = sum(weight * vectors[b].get(word, 0) for word, weight in vectors[a].iteritems())
+            return dot / (norms[a] * norms[b])
+
+        return vectors.keys(), similarity
+
+    def assertSimilar(self, index, limit):
+        message_ids, similarity = self.brute_force()
+        for message_id in message_ids[:40]:
+            similar = index.similar(message_id, limit=limit)
+            expected = sorted((similarity(message_id, other) for other in message_ids if other != message_id),
+                              reverse=True)
+            expected = [score for score in expected if score > 0][:limit]
+
+            self.assertEquals(len(similar), len(expected))
+            for (other, score), expected_score in zip(similar, expected):
+                self.assertNotEqual(other, message_id)
+                self.assertAlmostEquals(score, similarity(message_id, other), places=5)
+                self.assertAlmostEquals(score, expected_score, places=5)
+
+    def test_similar_messages(self):
+        from msgvis.apps.enhance.similarity import SimilarityIndex
+
+        self.assertIsNone(SimilarityIndex.for_dictionary(self.dictionary))
+        SimilarityIndex.build(self.dictionary)
+        index = SimilarityIndex.for_dictionary(self.dictionary)
+        self.assertEquals(len(index), models.MessageWord.objects.filter(dictionary=self.dictionary)
+                          .values('message').distinct().count())
+        self.assertSimilar(index, limit=5)
+
+        message_id = models.MessageWord.objects.filter(dictionary=self.dictionary)[0].message_id
+        self.assertEquals(index.similar(message_id, limit=0), [])
+        self.assertEquals(index.similar(message_id, limit=-2), [])
+
+        # messages without any words in the dictionary
+        self.assertEquals(index.similar(self.dataset.message_set.create(text="nothing").id), [])
+
+        # until the dictionary's vectors change
+        self.dictionary.num_docs += 1
+        self.dictionary.save()
+        self.assertIsNone(SimilarityIndex.for_dictionary(self.dictionary))
+
+    def test_pruned_postings(self):
+        from msgvis.apps.enhance.similarity import SimilarityIndex
+
+        index = SimilarityIndex.build(self.dictionary)
+        index.max_postings = 3
+        message_ids, similarity = self.brute_force()
+        for message_id in message_ids[:40]:
+            similar = index.similar(message_id, limit=5)
+            self.assertTrue(0 < len(similar) <= 5)
+            self.assertEquals([score for other, score in similar],
+                              sorted([score for other, score in similar], reverse=True))
+            for other, score in similar:
+                self.assertAlmostEquals(score, similarity(message_id, other), places=5)
@@ -0,0 +1,215 @@
+"""
+Tagging, lemmatizing and importing a dataset's messages in one pass.
+
+Running the tweet parser used to take three steps that each finished before
+the next began: dump every message to files, tag the files one after
+another, and lemmatize all of the tagged files. Their results were then
+imported by ``build_tweet_dictionary``. :class:`TweetParserPipeline` runs
+the same stages on shards of messages as they become ready:
+
+.. code-block :: text
+
+    dump         this process reads a page of messages and writes its dump file
+      |
+    tag          up to ``taggers`` tweet parser processes at once
+      |
+    lemmatize    a pool of ``lemmatizers`` processes, each with a lemma cache
+      |
+    import       this process links the messages to their TweetWords
+
+Each stage marks the files of a shard done when it finishes them (see
+:func:`msgvis.apps.enhance.tasks.mark_done`), and shards are marked imported
+at the end, so a run that is stopped can be started again and only redoes
+the stages that hadn't finished. Shards are pages of ``shard_size``
+messages in id order, so resuming needs the same ``shard_size``.
+"""
+import codecs
+import logging
+import os
+from collections import deque
+from time import time, sleep
+
+from msgvis.apps.enhance import tasks
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('dump', 'tag', 'lemmatize', 'import')
+
+
+class StageStats(object):
+    """
+    Counts the shards and messages through a stage and the time spent on
+    them. Stages with several workers add up the time of each.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.shards = 0
+        self.messages = 0
+        self.seconds = 0.0
+
+    def add(self, messages, seconds):
+        self.shards += 1
+        self.messages += messages
+        self.seconds += seconds
+
+    @property
+    def messages_per_second(self):
+        if self.seconds == 0:
+            return 0.0
+        return self.messages / self.seconds
+
+    def __repr__(self):
+        return "%s: %d shards, %d messages in %.2fs (%.0f messages/s)" % (
+            self.name, self.shards, self.messages, self.seconds, self.messages_per_second)
+
+
+class Shard(object):
+    """The files of one page of messages as it moves through the pipeline."""
+
+    def __init__(self, dataset_id, rows, save_path):
+        self.rows = rows
+        self.name = "dataset_%d_message_%d_%d" % (dataset_id, rows[0][0], rows[-1][0])
+        self.dump_file = save_path / ("%s.txt" % self.name)
+        self.tagged_file = save_path / 'parsed_tweets' / ("%s.out" % self.name)
+        self.converted_file = save_path / 'converted_tweets' / ("%s_converted.out" % self.name)
+        self.id_file = self.converted_file + '.id'
+        self.imported_marker = save_path / 'converted_tweets' / ("%s.imported" % self.name)
+        self.started = None
+
+    def __len__(self):
+        return len(self.rows)
+
+
+def _lemmatize_shard(files):
+    tagged_file, converted_file, id_file = files
+    id_lines = tasks.lemmatize_tagged_file(tagged_file, converted_file, id_file, tasks._lemmatizer)
+    return list(tasks.read_tweet_parser_results(id_lines))
+
+
+class TweetParserPipeline(object):
+    """
+    Runs the tweet parser stages for a dataset concurrently, keeping its
+    files under ``save_path`` in the same places ``run_tweet_parser`` does.
+    ``lemmatize`` replaces WordNet's lemmatizer (mostly for testing).
+    """
+    shard_size = 10000
+    taggers = 2
+    lemmatizers = 1
+    poll_interval = 0.1
+
+    def __init__(self, dataset_id, tweet_parser_path, save_path, lemmatize=None):
+        from path import path
+
+        self.dataset_id = dataset_id
+        self.tweet_parser_path = tweet_parser_path
+        self.save_path = path(save_path)
+        self.lemmatize = lemmatize
+        self.stats = dict((name, StageStats(name)) for name in STAGES)
+        self.skipped = 0
+        self.failed = []
+
+    def shards(self):
+        for rows in tasks.iter_tweet_dump_shards(self.dataset_id, self.shard_size):
+            if rows:
+                yield Shard(self.dataset_id, rows, self.save_path)
+
+    def run(self):
+        import multiprocessing
+
+        for dirname in ('parsed_tweets', 'converted_tweets'):
+            if not (self.save_path / dirname).exists():
+                (self.save_path / dirname).makedirs()
+
+        self.importer = tasks.TweetWordImporter(self.dataset_id)
+        start = time()
+
+        pool = multiprocessing.Pool(self.lemmatizers, tasks._init_lemmatizer_worker, (self.lemmatize,))
+        try:
+            shards = self.shards()
+            tagging = []
+            lemmatizing = deque()
+            exhausted = False
+
+            while True:
+                busy = False
+
+                # start taggers while there is room, unless the lemmatizers are behind
+                while not exhausted and len(tagging) < self.taggers and len(lemmatizing) <= self.lemmatizers * 2:
+                    read_start = time()
+                    shard = next(shards, None)
+                    if shard is None:
+                        exhausted = True
+                    elif os.path.exists(shard.imported_marker):
+                        self.skipped += 1
+                    elif tasks.is_done(shard.id_file):
+                        with codecs.open(shard.id_file, encoding='utf-8', mode='r') as f:
+                            self.import_shard(shard, list(tasks.read_tweet_parser_results(f)))
+                    elif tasks.is_done(shard.tagged_file):
+                        lemmatizing.append(self.start_lemmatizing(pool, shard))
+                    else:
+                        tagging.append(self.start_tagging(shard, time() - read_start))
+                    busy = True
+
+                for shard, tagger in list(tagging):
+                    if tagger.poll() is None:
+                        continue
+                    tagging.remove((shard, tagger))
+                    busy = True
+                    if tagger.returncode != 0:
+                        print "Tagging %s failed (%d), see %s.log" % (shard.name, tagger.returncode, shard.tagged_file)
+                        self.failed.append(shard.name)
+                        continue
+                    tasks.mark_done(shard.tagged_file)
+                    self.stats['tag'].add(len(shard), time() - shard.started)
+                    lemmatizing.append(self.start_lemmatizing(pool, shard))
+
+                while lemmatizing and lemmatizing[0][1].ready():
+                    shard, result = lemmatizing.popleft()
+                    self.stats['lemmatize'].add(len(shard), time() - shard.started)
+                    self.import_shard(shard, result.get())
+                    busy = True
+
+                if exhausted and not tagging and not lemmatizing:
+                    break
+                if not busy:
+                    sleep(self.poll_interval)
+
+            pool.close()
+        finally:
+            pool.terminate()
+            pool.join()
+
+        self.report(start)
+
+    def start_tagging(self, shard, read_seconds):
+        start = time()
+        with open(shard.dump_file, 'wb') as f:
+            f.write(tasks.format_tweet_dump(shard.rows).encode('utf-8'))
+        self.stats['dump'].add(len(shard), read_seconds + time() - start)
+
+        shard.started = time()
+        return shard, tasks.start_tagger(self.tweet_parser_path, shard.dump_file, shard.tagged_file)
+
+    def start_lemmatizing(self, pool, shard):
+        # the stage time includes waiting for a free lemmatizer
+        shard.started = time()
+        files = (shard.tagged_file, shard.converted_file, shard.id_file)
+        return shard, pool.apply_async(_lemmatize_shard, (files,))
+
+    def import_shard(self, shard, results):
+        from msgvis.apps.enhance.parallel import chunks
+
+        start = time()
+        for batch in chunks(results, self.importer.batch_size):
+            self.importer.import_batch(batch)
+        with open(shard.imported_marker, 'wb'):
+            pass
+        self.stats['import'].add(len(shard), time() - start)
+
+    def report(self, start):
+        print "Finished in %.2fs (%d shards already imported)" % (time() - start, self.skipped)
+        for name in STAGES:
+            print "  %r" % self.stats[name]
+        if self.failed:
+            print "  %d shards failed to tag: %s" % (len(self.failed), ", ".join(self.failed))
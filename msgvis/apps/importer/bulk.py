@@ -0,0 +1,613 @@
+"""
+Bulk tweet import.
+
+The per-line importer in :mod:`msgvis.apps.importer.models` issues a
+``get_or_create`` and a ``save`` for every message, person, hashtag, url and
+media object it touches, which makes large corpora very slow to load.
+
+This module splits importing into two steps:
+
+1. :func:`normalize_json_line` turns a line of Twitter JSON into a list of
+   plain operations (person and message field updates, counter increments and
+   entity references). It does not touch the database, so it can run anywhere.
+
+2. :class:`BulkTweetWriter` merges the operations for a whole batch of lines
+   in memory and writes them with a handful of queries: lookups with ``IN``
+   for the entities and rows that already exist, ``bulk_create`` for the ones
+   that don't, and ``UPDATE ... CASE`` statements for changed fields and
+   counters (see :mod:`msgvis.apps.importer.counters`).
+
+The resulting database state matches what
+:func:`msgvis.apps.importer.models.create_an_instance_from_json` produces
+for the same lines.
+"""
+import json
+import traceback
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from email.utils import parsedate
+from urlparse import urlparse
+
+from django.db import connection
+from django.utils.timezone import utc
+
+from msgvis.apps.corpus.models import Message, Person, Language, Timezone, MessageType, Hashtag, Url, Media
+from msgvis.apps.enhance.models import get_message_sentiment
+from msgvis.apps.importer.counters import CounterDeltas, update_with_case
+
+PERSON = 'person'
+MESSAGE = 'message'
+
+# The number of values to put in a single IN (...) lookup.
+# Sqlite allows at most 999 parameters per query.
+LOOKUP_CHUNK_SIZE = 500
+INSERT_BATCH_SIZE = 1000
+
+PERSON_FIELDS = ('username', 'full_name', 'language',
+                 'friend_count', 'follower_count', 'message_count',
+                 'profile_image_url')
+
+MESSAGE_LINKS = ('reply_to', 'retweet_of')
+
+MESSAGE_FIELDS = ('text', 'time', 'language', 'timezone', 'sender', 'type', 'sentiment',
+                  'contains_hashtag', 'contains_url', 'contains_media', 'contains_mention') + MESSAGE_LINKS
+
+FOREIGN_KEY_FIELDS = ('language', 'timezone', 'sender', 'type') + MESSAGE_LINKS
+
+MESSAGE_RELATIONS = ('hashtags', 'urls', 'media', 'mentions')
+
+
+def chunked(items, size=LOOKUP_CHUNK_SIZE):
+    items = list(items)
+    for i in xrange(0, len(items), size):
+        yield items[i:i + size]
+
+
+def bulk_create(model, objs):
+    """``bulk_create`` in batches no larger than the database allows."""
+    fields = [f for f in model._meta.local_concrete_fields if not f.primary_key]
+    batch_size = min(INSERT_BATCH_SIZE, max(connection.ops.bulk_batch_size(fields, objs), 1))
+    model.objects.bulk_create(objs, batch_size=batch_size)
+
+
+def _attnames(values):
+    """Convert foreign key field names (with id values) into constructor arguments."""
+    return dict((key + '_id' if key in FOREIGN_KEY_FIELDS else key, value)
+                for key, value in values.iteritems())
+
+
+def _normalize_user(user_data):
+    """Mirrors :func:`msgvis.apps.importer.models.create_an_user_from_json_obj`."""
+    fields = {}
+    if user_data.get('screen_name'):
+        fields['username'] = user_data['screen_name']
+    if user_data.get('name'):
+        fields['full_name'] = user_data['name']
+    if user_data.get('friends_count'):
+        fields['friend_count'] = user_data['friends_count']
+    if user_data.get('followers_count'):
+        fields['follower_count'] = user_data['followers_count']
+    if user_data.get('statuses_count'):
+        fields['message_count'] = user_data['statuses_count']
+    if user_data.get('profile_image_url'):
+        fields['profile_image_url'] = user_data['profile_image_url']
+
+    return {
+        'original_id': long(user_data['id']),
+        'fields': fields,
+        'language': user_data.get('lang') or None,
+        'mentioned': 0,
+    }
+
+
+def _normalize_tweet(tweet_data, ops, sentiment=True):
+    """
+    Append the operations for importing a tweet object (and the tweets it
+    refers to) to ``ops``, in the order the per-line importer performs them.
+    Mirrors :func:`msgvis.apps.importer.models.get_or_create_a_tweet_from_json_obj`.
+    Without ``sentiment``, the text is not scored.
+
+    Returns the message operation, or None if the object is not a tweet.
+    """
+    if 'in_reply_to_status_id' not in tweet_data:
+        return None
+
+    op = {
+        'original_id': long(tweet_data['id']),
+        'fields': {},
+        'language': None,
+        'timezone': None,
+        'sender': None,
+        'type': None,
+        'reply_to': None,
+        'retweet_of': None,
+        'contains': set(),
+        'hashtags': [],
+        'urls': [],
+        'media': [],
+        'mentions': [],
+        'shared': 0,
+        'replied': 0,
+        'sentiment': None,
+    }
+
+    if tweet_data.get('text'):
+        op['fields']['text'] = tweet_data['text']
+
+    if tweet_data.get('created_at'):
+        op['fields']['time'] = datetime(*(parsedate(tweet_data['created_at']))[:6], tzinfo=utc)
+
+    if tweet_data.get('lang'):
+        op['language'] = tweet_data['lang']
+
+    if tweet_data.get('user'):
+        sender = _normalize_user(tweet_data['user'])
+        ops.append((PERSON, sender))
+        op['sender'] = sender['original_id']
+
+        if tweet_data['user'].get('time_zone'):
+            op['timezone'] = tweet_data['user']['time_zone']
+
+    if tweet_data.get('retweeted_status') is not None:
+        op['type'] = 'retweet'
+        original = _normalize_tweet(tweet_data['retweeted_status'], ops, sentiment)
+        if original is not None:
+            original['shared'] += 1
+            op['retweet_of'] = original['original_id']
+
+    elif tweet_data.get('in_reply_to_status_id') is not None:
+        op['type'] = 'reply'
+        stub = {
+            'id': tweet_data['in_reply_to_status_id'],
+            'user': {
+                'id': tweet_data['in_reply_to_user_id'],
+                'screen_name': tweet_data['in_reply_to_screen_name'],
+            },
+            'in_reply_to_status_id': None
+        }
+        original = _normalize_tweet(stub, ops, sentiment)
+        if original is not None:
+            original['replied'] += 1
+            op['reply_to'] = original['original_id']
+
+    else:
+        op['type'] = 'tweet'
+
+    entities = tweet_data.get('entities')
+    if entities:
+        if entities.get('hashtags'):
+            op['contains'].add('contains_hashtag')
+            for hashtag in entities['hashtags']:
+                op['hashtags'].append((hashtag['text'],))
+
+        if entities.get('urls'):
+            op['contains'].add('contains_url')
+            for url in entities['urls']:
+                domain = urlparse(url['expanded_url']).netloc
+                op['urls'].append((url['expanded_url'], domain, url['url']))
+
+        if entities.get('media'):
+            op['contains'].add('contains_media')
+            for me in entities['media']:
+                op['media'].append((me['media_url'], me['type']))
+
+        if entities.get('user_mentions'):
+            op['contains'].add('contains_mention')
+            for mention in entities['user_mentions']:
+                mentioned = _normalize_user(mention)
+                mentioned['mentioned'] = 1
+                ops.append((PERSON, mentioned))
+                op['mentions'].append(mentioned['original_id'])
+
+    if sentiment and 'text' in op['fields']:
+        op['sentiment'] = get_message_sentiment(op['fields']['text'])
+
+    ops.append((MESSAGE, op))
+    return op
+
+
+class NormalizedTweet(object):
+    """The database operations needed to import one line of a corpus."""
+
+    def __init__(self, ops, message_op):
+        self.ops = ops
+        self.original_id = message_op['original_id']
+        self.time = message_op['fields'].get('time')
+
+
+def normalize_json_line(json_str, sentiment=True):
+    """
+    Parse one line of Twitter JSON without touching the database.
+
+    Like :func:`msgvis.apps.importer.models.create_an_instance_from_json`,
+    returns False for non-English tweets and None for objects that are not
+    tweets. Otherwise returns a :class:`NormalizedTweet`. Without
+    ``sentiment``, the text is not scored.
+    """
+    tweet_data = json.loads(json_str)
+    if tweet_data.get('lang'):
+        if tweet_data.get('lang') != "en":
+            return False
+
+    ops = []
+    message_op = _normalize_tweet(tweet_data, ops, sentiment)
+    if message_op is None:
+        return None
+    return NormalizedTweet(ops, message_op)
+
+
+def normalize_lines(first_line, lines, sentiment=True):
+    """
+    Normalize a group of corpus lines, numbered from ``first_line``.
+    Returns the list of :class:`NormalizedTweet` records, the number of
+    non-tweets, and a list of ``(line number, traceback)`` pairs for lines
+    that could not be parsed.
+    """
+    records = []
+    not_tweets = 0
+    errors = []
+
+    for offset, json_str in enumerate(lines):
+        if len(json_str) > 0:
+            try:
+                record = normalize_json_line(json_str, sentiment)
+                if record:
+                    records.append(record)
+                else:
+                    not_tweets += 1
+            except Exception:
+                errors.append((first_line + offset, traceback.format_exc()))
+
+    return records, not_tweets, errors
+
+
+def _fold(key):
+    return tuple(value.lower() if isinstance(value, basestring) else value for value in key)
+
+
+class BulkTweetWriter(object):
+    """
+    Writes batches of :class:`NormalizedTweet` objects into a dataset.
+
+    Languages, timezones and message types are cached for the lifetime
+    of the writer; everything else is looked up once per batch.
+    Each call to :meth:`write` should be wrapped in a transaction.
+
+    Without ``sentiment``, messages are not scored: new messages and
+    messages whose text changes are left without a sentiment, for
+    ``compute_sentiment`` to fill in later.
+    """
+
+    def __init__(self, dataset, sentiment=True):
+        self.dataset = dataset
+        self.sentiment = sentiment
+        self._languages = {}
+        self._timezones = {}
+        self._types = {}
+
+    def write(self, records):
+        """Write a batch of normalized tweets. Returns a dictionary of row counts."""
+        ops = [op for record in records for op in record.ops]
+        persons, messages = self._merge(ops)
+
+        languages = self._resolve(Language, ('code',),
+                                  set((state['language'],) for state in persons.itervalues() if state['language']) |
+                                  set((state['language'],) for state in messages.itervalues() if state['language']),
+                                  self._languages)
+        timezones = self._resolve(Timezone, ('name',),
+                                  set((state['timezone'],) for state in messages.itervalues() if state['timezone']),
+                                  self._timezones)
+        types = self._resolve(MessageType, ('name',),
+                              set((state['type'],) for state in messages.itervalues()),
+                              self._types)
+        targets = {
+            'hashtags': self._resolve(Hashtag, ('text',), self._collect(messages, 'hashtags')),
+            'urls': self._resolve(Url, ('full_url', 'domain', 'short_url'), self._collect(messages, 'urls')),
+            'media': self._resolve(Media, ('media_url', 'type'), self._collect(messages, 'media')),
+        }
+
+        existing_messages = self._load_existing(Message, messages.keys(), ('id', 'original_id') + MESSAGE_FIELDS)
+
+        # Replies and shares are also counted on the sender of the original message
+        sender_deltas = defaultdict(lambda: defaultdict(int))
+        for original_id, state in messages.iteritems():
+            if not state['shared'] and not state['replied']:
+                continue
+            if state['sender'] is not None:
+                deltas = sender_deltas[('original_id', state['sender'])]
+            elif original_id in existing_messages and existing_messages[original_id]['sender'] is not None:
+                deltas = sender_deltas[('id', existing_messages[original_id]['sender'])]
+            else:
+                continue
+            deltas['shared_count'] += state['shared']
+            deltas['replied_to_count'] += state['replied']
+
+        counters = CounterDeltas()
+
+        person_ids, persons_created = self._write_persons(persons, languages, sender_deltas, counters)
+        targets['mentions'] = dict(((original_id,), pk) for original_id, pk in person_ids.iteritems())
+
+        message_ids, messages_created = self._write_messages(messages, existing_messages, person_ids,
+                                                             languages, timezones, types, counters)
+        counters.apply()
+
+        links_created = 0
+        for relation in MESSAGE_RELATIONS:
+            links_created += self._write_relation(relation, messages, message_ids,
+                                                  existing_messages, targets[relation])
+
+        return {
+            'persons': len(persons),
+            'persons_created': persons_created,
+            'messages': len(messages),
+            'messages_created': messages_created,
+            'links_created': links_created,
+        }
+
+    def _merge(self, ops):
+        """
+        Combine all the operations on each person and message.
+        Later field values win, counters add up, and related objects accumulate.
+        """
+        persons = OrderedDict()
+        messages = OrderedDict()
+
+        for kind, op in ops:
+            if kind == PERSON:
+                state = persons.get(op['original_id'])
+                if state is None:
+                    state = persons[op['original_id']] = {
+                        'fields': {},
+                        'language': None,
+                        'mentioned': 0,
+                    }
+                state['fields'].update(op['fields'])
+                if op['language']:
+                    state['language'] = op['language']
+                state['mentioned'] += op['mentioned']
+
+            else:
+                state = messages.get(op['original_id'])
+                if state is None:
+                    state = messages[op['original_id']] = {
+                        'fields': {},
+                        'language': None,
+                        'timezone': None,
+                        'sender': None,
+                        'type': None,
+                        'reply_to': None,
+                        'retweet_of': None,
+                        'contains': set(),
+                        'hashtags': OrderedDict(),
+                        'urls': OrderedDict(),
+                        'media': OrderedDict(),
+                        'mentions': OrderedDict(),
+                        'shared': 0,
+                        'replied': 0,
+                        'has_text': False,
+                        'sentiment': None,
+                    }
+                state['fields'].update(op['fields'])
+                for key in ('language', 'timezone', 'sender') + MESSAGE_LINKS:
+                    if op[key] is not None:
+                        state[key] = op[key]
+                state['type'] = op['type']
+                state['contains'].update(op['contains'])
+                for relation in MESSAGE_RELATIONS:
+                    for key in op[relation]:
+                        state[relation][key] = True
+                state['shared'] += op['shared']
+                state['replied'] += op['replied']
+
+                # the sentiment is always computed from the latest text
+                if 'text' in op['fields']:
+                    state['has_text'] = True
+                    state['sentiment'] = op['sentiment']
+
+        return persons, messages
+
+    def _collect(self, messages, relation):
+        keys = set()
+        for state in messages.itervalues():
+            keys.update(state[relation].iterkeys())
+        return keys
+
+    def _resolve(self, model, field_names, keys, cache=None):
+        """
+        Get a dictionary mapping key tuples (values for ``field_names``)
+        to the ids of matching ``model`` rows, inserting rows for any keys
+        that don't exist yet.
+        """
+        if cache is None:
+            cache = {}
+
+        missing = [key for key in keys if key not in cache]
+        if missing:
+            self._lookup(model, field_names, missing, cache)
+
+            to_create = [key for key in missing if key not in cache]
+            if to_create:
+                bulk_create(model, [model(**dict(zip(field_names, key))) for key in to_create])
+                self._lookup(model, field_names, to_create, cache)
+
+        return cache
+
+    def _lookup(self, model, field_names, keys, cache):
+        queryset = model.objects.all()
+        if hasattr(queryset, 'no_cache'):
+            # cache-machine may otherwise return results from before our inserts
+            queryset = queryset.no_cache()
+
+        wanted = set(keys)
+
+        # MySQL compares strings case-insensitively, so get_or_create
+        # would match rows that differ only in case
+        folded = None
+        if connection.vendor == 'mysql':
+            folded = defaultdict(list)
+            for key in keys:
+                folded[_fold(key)].append(key)
+
+        for chunk in chunked(set(key[0] for key in keys)):
+            rows = queryset.filter(**{field_names[0] + '__in': chunk})\
+                .order_by('id')\
+                .values_list('id', *field_names)
+            for row in rows:
+                key = tuple(row[1:])
+                if key in wanted:
+                    cache.setdefault(key, row[0])
+                elif folded is not None:
+                    for match in folded.get(_fold(key), ()):
+                        cache.setdefault(match, row[0])
+
+    def _load_existing(self, model, original_ids, fields):
+        """Get the current values of the dataset's rows with the given original ids."""
+        existing = {}
+        for chunk in chunked(original_ids):
+            rows = model.objects.filter(dataset=self.dataset, original_id__in=chunk)\
+                .order_by('id')\
+                .values(*fields)
+            for row in rows:
+                existing.setdefault(row['original_id'], row)
+        return existing
+
+    def _load_ids(self, model, original_ids):
+        ids = {}
+        for chunk in chunked(original_ids):
+            rows = model.objects.filter(dataset=self.dataset, original_id__in=chunk)\
+                .order_by('id')\
+                .values_list('original_id', 'id')
+            for original_id, pk in rows:
+                ids.setdefault(original_id, pk)
+        return ids
+
+    def _record_changes(self, changes, current, values):
+        """Note the values that differ from the ``current`` row, by field and primary key."""
+        for key, value in values.iteritems():
+            if current[key] != value:
+                changes[key][current['id']] = value
+
+    def _apply_changes(self, model, changes):
+        for field_name, values in changes.iteritems():
+            update_with_case(model, field_name, values)
+
+    def _write_persons(self, persons, languages, sender_deltas, counters):
+        existing = self._load_existing(Person, persons.keys(), ('id', 'original_id') + PERSON_FIELDS)
+
+        for (key, value), deltas in sender_deltas.iteritems():
+            if key == 'id':
+                for field_name, amount in deltas.iteritems():
+                    counters.add(Person, value, field_name, amount)
+
+        changes = defaultdict(dict)
+        new_persons = []
+        for original_id, state in persons.iteritems():
+            values = dict(state['fields'])
+            if state['language']:
+                values['language'] = languages[(state['language'],)]
+
+            deltas = dict(sender_deltas.get(('original_id', original_id), {}))
+            deltas['mentioned_count'] = state['mentioned']
+
+            current = existing.get(original_id)
+            if current is not None:
+                self._record_changes(changes, current, values)
+                for field_name, amount in deltas.iteritems():
+                    counters.add(Person, current['id'], field_name, amount)
+            else:
+                values.update(deltas)
+                new_persons.append(Person(dataset=self.dataset, original_id=original_id, **_attnames(values)))
+
+        if new_persons:
+            bulk_create(Person, new_persons)
+        self._apply_changes(Person, changes)
+
+        person_ids = dict((original_id, row['id']) for original_id, row in existing.iteritems())
+        person_ids.update(self._load_ids(Person, [p.original_id for p in new_persons]))
+        return person_ids, len(new_persons)
+
+    def _write_messages(self, messages, existing, person_ids, languages, timezones, types, counters):
+        changes = defaultdict(dict)
+        new_messages = []
+
+        for original_id, state in messages.iteritems():
+            current = existing.get(original_id)
+
+            values = dict(state['fields'])
+            if state['language']:
+                values['language'] = languages[(state['language'],)]
+            if state['timezone']:
+                values['timezone'] = timezones[(state['timezone'],)]
+            if state['sender'] is not None:
+                values['sender'] = person_ids[state['sender']]
+            values['type'] = types[(state['type'],)]
+            for flag in state['contains']:
+                values[flag] = True
+
+            if not self.sentiment:
+                if current is None or (state['has_text'] and values['text'] != current['text']):
+                    values['sentiment'] = None
+            elif state['has_text']:
+                values['sentiment'] = state['sentiment']
+            elif current is not None:
+                values['sentiment'] = get_message_sentiment(current['text'])
+            else:
+                values['sentiment'] = get_message_sentiment("")
+
+            if current is not None:
+                self._record_changes(changes, current, values)
+                counters.add(Message, current['id'], 'shared_count', state['shared'])
+                counters.add(Message, current['id'], 'replied_to_count', state['replied'])
+            else:
+                values['shared_count'] = state['shared']
+                values['replied_to_count'] = state['replied']
+                new_messages.append(Message(dataset=self.dataset, original_id=original_id, **_attnames(values)))
+
+        if new_messages:
+            bulk_create(Message, new_messages)
+
+        message_ids = dict((original_id, row['id']) for original_id, row in existing.iteritems())
+        message_ids.update(self._load_ids(Message, [m.original_id for m in new_messages]))
+
+        # replies and retweets can point at messages created in this batch,
+        # so the links are filled in once every message has an id
+        for link in MESSAGE_LINKS:
+            for original_id, state in messages.iteritems():
+                if state[link] is not None:
+                    target = message_ids[state[link]]
+                    current = existing.get(original_id)
+                    if current is None or current[link] != target:
+                        changes[link][message_ids[original_id]] = target
+
+        self._apply_changes(Message, changes)
+
+        return message_ids, len(new_messages)
+
+    def _write_relation(self, relation, messages, message_ids, existing_messages, target_ids):
+        """Insert the many-to-many rows that don't exist yet for a message relation."""
+        field = Message._meta.get_field(relation)
+        through = field.rel.through
+        source_column = field.m2m_column_name()
+        target_column = field.m2m_reverse_name()
+
+        wanted = OrderedDict()
+        for original_id, state in messages.iteritems():
+            message_id = message_ids[original_id]
+            for key in state[relation].iterkeys():
+                if not isinstance(key, tuple):
+                    key = (key,)
+                wanted[(message_id, target_ids[key])] = True
+
+        # only messages that were already in the database can have links
+        already_linked = set()
+        previous = [row['id'] for row in existing_messages.itervalues()]
+        for chunk in chunked(previous):
+            already_linked.update(through.objects.filter(**{source_column + '__in': chunk})
+                                  .values_list(source_column, target_column))
+
+        rows = [through(**{source_column: message_id, target_column: target_id})
+                for message_id, target_id in wanted.iterkeys()
+                if (message_id, target_id) not in already_linked]
+        if rows:
+            bulk_create(through, rows)
+        return len(rows)
@@ -0,0 +1,152 @@
+"""
+Set-based maintenance of the reply, share and mention counters.
+
+Incrementing ``replied_to_count``, ``shared_count`` and ``mentioned_count``
+with a ``save()`` per retweet, reply and mention costs extra writes and
+makes popular tweets and people a point of lock contention. Instead, the
+importers collect the increments in a :class:`CounterDeltas` and apply them
+once per transaction with :func:`update_with_case`, which issues a single
+``UPDATE ... CASE`` statement per counter (and per few hundred rows).
+
+:func:`recompute_counters` rebuilds all of the counters of a dataset
+from the messages themselves.
+"""
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+
+from msgvis.apps.corpus.models import Message, Person
+
+# Each row uses three query parameters; sqlite allows at most 999.
+CASE_CHUNK_SIZE = 300
+
+
+def update_with_case(model, field_name, values, increment=False):
+    """
+    Update a column on many rows with as few statements as possible:
+
+    .. code-block:: sql
+
+        UPDATE table SET column = CASE id WHEN 1 THEN 5 WHEN 2 THEN 7 ELSE column END
+        WHERE id IN (1, 2)
+
+    ``values`` maps primary keys to new values. With ``increment``,
+    the values are added to the current ones instead.
+    """
+    if not values:
+        return
+
+    qn = connection.ops.quote_name
+    field = model._meta.get_field(field_name)
+    table = qn(model._meta.db_table)
+    column = qn(field.column)
+    pk_column = qn(model._meta.pk.column)
+
+    if increment:
+        assignment = "%s + CASE %s {cases} ELSE 0 END" % (column, pk_column)
+    else:
+        assignment = "CASE %s {cases} ELSE %s END" % (pk_column, column)
+
+    items = values.items()
+    cursor = connection.cursor()
+    for i in xrange(0, len(items), CASE_CHUNK_SIZE):
+        chunk = items[i:i + CASE_CHUNK_SIZE]
+
+        sql = "UPDATE %s SET %s = %s WHERE %s IN (%s)" % (
+            table, column,
+            assignment.format(cases=" ".join(["WHEN %s THEN %s"] * len(chunk))),
+            pk_column, ", ".join(["%s"] * len(chunk))
+        )
+
+        params = []
+        for pk, value in chunk:
+            params.append(pk)
+            params.append(field.get_db_prep_save(value, connection=connection))
+        params.extend(pk for pk, value in chunk)
+
+        cursor.execute(sql, params)
+
+
+class CounterDeltas(object):
+    """
+    Accumulates counter increments in memory until :meth:`apply` is called.
+
+    .. code-block:: python
+
+        counters = CounterDeltas()
+        counters.add(Message, message.pk, 'shared_count')
+        counters.add(Person, message.sender_id, 'shared_count')
+        counters.apply()
+
+    """
+
+    def __init__(self):
+        self.deltas = defaultdict(lambda: defaultdict(int))
+
+    def add(self, model, pk, field_name, amount=1):
+        if pk is not None and amount:
+            self.deltas[(model, field_name)][pk] += amount
+
+    def __len__(self):
+        return sum(len(deltas) for deltas in self.deltas.itervalues())
+
+    def apply(self):
+        """Write the accumulated increments and start over."""
+        for (model, field_name), deltas in self.deltas.iteritems():
+            update_with_case(model, field_name, dict((pk, amount) for pk, amount in deltas.iteritems() if amount),
+                             increment=True)
+        self.deltas.clear()
+
+
+def _count_by(queryset, field_name):
+    rows = queryset.values(field_name).annotate(count=Count('id'))
+    return dict((row[field_name], row['count']) for row in rows)
+
+
+def recompute_counters(dataset):
+    """
+    Recalculate the reply, share and mention counters for every message
+    and person in a dataset from the messages, their reply/retweet links
+    and their mentions.
+
+    Returns a dictionary with the number of nonzero counters of each kind.
+    """
+    messages = Message.objects.filter(dataset=dataset)
+    persons = Person.objects.filter(dataset=dataset)
+
+    with transaction.atomic():
+        messages.update(shared_count=0, replied_to_count=0)
+        persons.update(shared_count=0, replied_to_count=0, mentioned_count=0)
+
+        shared = _count_by(messages.filter(retweet_of__isnull=False), 'retweet_of')
+        update_with_case(Message, 'shared_count', shared)
+
+        replied = _count_by(messages.filter(reply_to__isnull=False), 'reply_to')
+        update_with_case(Message, 'replied_to_count', replied)
+
+        mentions = Message.mentions.through.objects.filter(message__dataset=dataset)
+        mentioned = _count_by(mentions, 'person')
+        update_with_case(Person, 'mentioned_count', mentioned)
+
+        # people are credited with the shares and replies of their messages
+        sender_shared = {}
+        sender_replied = {}
+        totals = messages.filter(sender__isnull=False)\
+            .values('sender')\
+            .annotate(shared=Sum('shared_count'), replied=Sum('replied_to_count'))
+        for row in totals:
+            if row['shared']:
+                sender_shared[row['sender']] = row['shared']
+            if row['replied']:
+                sender_replied[row['sender']] = row['replied']
+        update_with_case(Person, 'shared_count', sender_shared)
+        update_with_case(Person, 'replied_to_count', sender_replied)
+
+    return {
+        'shared_messages': len(shared),
+        'replied_messages': len(replied),
+        'mentioned_persons': len(mentioned),
+        'shared_persons': len(sender_shared),
+        'replied_persons': len(sender_replied),
+    }
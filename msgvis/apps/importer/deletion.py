@@ -0,0 +1,203 @@
+"""
+Fast deletion of whole datasets.
+
+``dataset.delete()`` makes Django's collector load every related message,
+person, many-to-many row, word score and topic probability into memory
+before deleting anything, which takes hours on a large dataset.
+:func:`delete_dataset` instead removes the large tables with raw
+``DELETE`` statements, a window of ids at a time, children before parents:
+
+1. the message links (urls, hashtags, media, mentions, tweet words,
+   word scores and topic probabilities), then the messages themselves
+2. the people
+3. the dictionaries' topic words and words
+4. the dataset and whatever small rows remain (dictionaries, topic models,
+   groups, precalculated distributions...), through the ORM as usual
+
+Each window is its own transaction, so locks are held briefly and an
+interrupted deletion can simply be run again.
+
+:func:`delete_orphans` then removes the hashtags, urls and media that no
+message uses any more with ``NOT EXISTS`` anti-joins.
+"""
+from collections import OrderedDict
+
+from django.db import connection, transaction
+from django.db.models import Min, Max
+
+from msgvis.apps.corpus.models import Message, Person, Hashtag, Url, Media
+from msgvis.apps.enhance.models import Dictionary, Word, TopicWord, MessageWord, MessageTopic, TweetWord
+
+# The number of ids covered by each DELETE
+DELETE_CHUNK_SIZE = 10000
+
+# Tables that refer to messages, deleted before the messages
+MESSAGE_CHILDREN = (
+    (Message.urls.through, 'message'),
+    (Message.hashtags.through, 'message'),
+    (Message.media.through, 'message'),
+    (Message.mentions.through, 'message'),
+    (TweetWord.messages.through, 'message'),
+    (MessageWord, 'message'),
+    (MessageTopic, 'message'),
+)
+
+# Shared tables whose rows are only kept while a message uses them
+ORPHANS = (
+    (Media, Message.media.through, 'media'),
+    (Hashtag, Message.hashtags.through, 'hashtag'),
+    (Url, Message.urls.through, 'url'),
+)
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def _column(model, field_name):
+    return connection.ops.quote_name(model._meta.get_field(field_name).column)
+
+
+def _id_windows(queryset, chunk_size):
+    """Split the id range of a queryset into ``[start, end)`` windows."""
+    bounds = queryset.aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return []
+    return [(start, start + chunk_size) for start in xrange(bounds['low'], bounds['high'] + 1, chunk_size)]
+
+
+class _Step(object):
+    """Runs one kind of statement over a list of id windows, reporting progress."""
+
+    def __init__(self, label, windows, statements, counts, progress=None):
+        self.label = label
+        self.windows = windows
+        self.statements = statements
+        self.counts = counts
+        self.progress = progress
+
+    def run(self):
+        cursor = connection.cursor()
+        for i, (start, end) in enumerate(self.windows):
+            with transaction.atomic():
+                for label, sql, params in self.statements:
+                    cursor.execute(sql, params(start, end))
+                    self.counts[label] = self.counts.get(label, 0) + max(cursor.rowcount, 0)
+            if self.progress is not None:
+                self.progress(self.label, i + 1, len(self.windows), self.counts)
+
+
+def delete_dataset(dataset, chunk_size=DELETE_CHUNK_SIZE, progress=None):
+    """
+    Delete a dataset and everything that belongs to it.
+
+    If given, ``progress(step, windows_done, windows_total, counts)`` is
+    called after each window. Returns an ordered dictionary of the number
+    of rows deleted from each table.
+    """
+    counts = OrderedDict()
+    dataset_id = dataset.pk
+
+    message_table = _table(Message)
+    message_windows = _id_windows(Message.objects.filter(dataset=dataset), chunk_size)
+    messages_in_window = "SELECT id FROM %s WHERE %s = %%s AND id >= %%s AND id < %%s" % (
+        message_table, _column(Message, 'dataset'))
+
+    # Replies and retweets point at other messages of the dataset,
+    # which may be in an earlier window.
+    _Step("Unlinking replies and retweets", message_windows, [
+        ("links", "UPDATE %s SET %s = NULL, %s = NULL WHERE %s = %%s AND id >= %%s AND id < %%s "
+                  "AND (%s IS NOT NULL OR %s IS NOT NULL)" % (
+            message_table, _column(Message, 'reply_to'), _column(Message, 'retweet_of'),
+            _column(Message, 'dataset'), _column(Message, 'reply_to'), _column(Message, 'retweet_of')),
+         lambda start, end: [dataset_id, start, end]),
+    ], counts, progress).run()
+    counts.pop("links", None)
+
+    statements = []
+    for model, field_name in MESSAGE_CHILDREN:
+        column = _column(model, field_name)
+        # the range test lets the database use the message index
+        statements.append((model._meta.db_table,
+                           "DELETE FROM %s WHERE %s >= %%s AND %s < %%s AND %s IN (%s)" % (
+                               _table(model), column, column, column, messages_in_window),
+                           lambda start, end: [start, end, dataset_id, start, end]))
+    statements.append((Message._meta.db_table,
+                       "DELETE FROM %s WHERE %s = %%s AND id >= %%s AND id < %%s" % (
+                           message_table, _column(Message, 'dataset')),
+                       lambda start, end: [dataset_id, start, end]))
+    _Step("Deleting messages", message_windows, statements, counts, progress).run()
+
+    mentions = Message.mentions.through
+    _Step("Deleting people", _id_windows(Person.objects.filter(dataset=dataset), chunk_size), [
+        (mentions._meta.db_table,
+         "DELETE FROM %s WHERE %s IN (SELECT id FROM %s WHERE %s = %%s AND id >= %%s AND id < %%s)" % (
+             _table(mentions), _column(mentions, 'person'), _table(Person), _column(Person, 'dataset')),
+         lambda start, end: [dataset_id, start, end]),
+        (Person._meta.db_table,
+         "DELETE FROM %s WHERE %s = %%s AND id >= %%s AND id < %%s" % (_table(Person), _column(Person, 'dataset')),
+         lambda start, end: [dataset_id, start, end]),
+    ], counts, progress).run()
+
+    tweet_words = TweetWord.objects.filter(dataset=dataset)
+    _Step("Deleting tweet words", _id_windows(tweet_words, chunk_size), [
+        (TweetWord._meta.db_table,
+         "DELETE FROM %s WHERE %s = %%s AND id >= %%s AND id < %%s" % (
+             _table(TweetWord), _column(TweetWord, 'dataset')),
+         lambda start, end: [dataset_id, start, end]),
+    ], counts, progress).run()
+
+    for dictionary_id in Dictionary.objects.filter(dataset=dataset).values_list('id', flat=True):
+        words_in_window = "SELECT id FROM %s WHERE %s = %%s AND id >= %%s AND id < %%s" % (
+            _table(Word), _column(Word, 'dictionary'))
+        _Step("Deleting words of dictionary %d" % dictionary_id,
+              _id_windows(Word.objects.filter(dictionary_id=dictionary_id), chunk_size), [
+            (MessageWord._meta.db_table,
+             "DELETE FROM %s WHERE %s IN (%s)" % (_table(MessageWord), _column(MessageWord, 'word'), words_in_window),
+             lambda start, end: [dictionary_id, start, end]),
+            (TopicWord._meta.db_table,
+             "DELETE FROM %s WHERE %s IN (%s)" % (_table(TopicWord), _column(TopicWord, 'word'), words_in_window),
+             lambda start, end: [dictionary_id, start, end]),
+            (Word._meta.db_table,
+             "DELETE FROM %s WHERE %s = %%s AND id >= %%s AND id < %%s" % (
+                 _table(Word), _column(Word, 'dictionary')),
+             lambda start, end: [dictionary_id, start, end]),
+        ], counts, progress).run()
+
+    # Everything left is small, so the collector can handle it
+    # (and anything else that refers to datasets).
+    with transaction.atomic():
+        dataset.delete()
+    if progress is not None:
+        progress("Deleting dataset", 1, 1, counts)
+
+    return counts
+
+
+def delete_orphans(chunk_size=DELETE_CHUNK_SIZE, progress=None):
+    """
+    Delete the media, hashtags and urls that no message refers to.
+    Returns an ordered dictionary of the number of rows deleted from each table.
+    """
+    counts = OrderedDict()
+    for model, through, field_name in ORPHANS:
+        table = _table(model)
+        through_table = _table(through)
+        _Step("Deleting unused rows of %s" % model._meta.db_table, _id_windows(model.objects.all(), chunk_size), [
+            (model._meta.db_table,
+             "DELETE FROM %s WHERE id >= %%s AND id < %%s AND NOT EXISTS "
+             "(SELECT 1 FROM %s WHERE %s.%s = %s.id)" % (
+                 table, through_table, through_table, _column(through, field_name), table),
+             lambda start, end: [start, end]),
+        ], counts, progress).run()
+    return counts
+
+
+def collector_delete(dataset):
+    """
+    Delete a dataset through the ORM and scan for orphans the way
+    ``delete_corpus`` used to. Kept for comparison with :func:`delete_dataset`.
+    """
+    dataset.delete()
+    for model in (Media, Hashtag, Url):
+        model.objects.filter(message=None).delete()
@@ -0,0 +1,359 @@
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+from time import time
+import itertools
+import tempfile
+import datetime
+import json
+import os
+import shutil
+import sys
+import traceback
+
+from msgvis.apps.corpus.models import Dataset
+from msgvis.apps.dimensions import registry
+from msgvis.apps.datatable.models import DataTable
+from msgvis.apps.importer.synthetic import SyntheticTweetGenerator
+from msgvis.apps.importer.deletion import delete_dataset, delete_orphans, collector_delete
+from msgvis.apps.importer.management.commands.import_corpus import Importer, ParallelImporter, BulkImporter, \
+    MultiFileImporter
+
+# Dimensions that can't be rendered without extra context
+SKIP_DIMENSIONS = ('groups',)
+
+
+def git_revision():
+    import subprocess
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.PIPE).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def import_synthetic_dataset(filename, name, workers=0):
+    """Import a generated corpus file the same way import_corpus does, returning (dataset, timings)."""
+    dataset = Dataset.objects.create(name=name, description=name)
+
+    start = time()
+    with open(filename, 'rb') as fp:
+        if workers > 0:
+            importer = ParallelImporter(fp, dataset, workers=workers)
+        else:
+            importer = Importer(fp, dataset)
+        importer.run()
+
+    dataset.start_time, dataset.end_time = importer.get_time_range()
+    dataset.save()
+
+    elapsed = time() - start
+    return dataset, {
+        'seconds': elapsed,
+        'lines': importer.line,
+        'imported': importer.imported,
+        'errors': importer.errors,
+        'lines_per_second': importer.line / elapsed if elapsed > 0 else None,
+        'workers': workers,
+    }
+
+
+def import_synthetic_files(filenames, name, file_workers=0):
+    """
+    Import a corpus split across several files, one after another with the
+    bulk importer or with ``file_workers`` files at a time, returning (dataset, timings).
+    """
+    dataset = Dataset.objects.create(name=name, description=name)
+
+    start = time()
+    if file_workers > 0:
+        importer = MultiFileImporter([(filename, None) for filename in filenames], dataset, workers=file_workers)
+        importer.run()
+        importers = importer.importers
+    else:
+        importers = []
+        for filename in filenames:
+            with open(filename, 'rb') as fp:
+                importer = BulkImporter(fp, dataset)
+                importer.run()
+            importers.append(importer)
+
+    lines = sum(importer.line for importer in importers)
+    dataset.start_time = min(importer.min_time for importer in importers if importer.min_time is not None)
+    dataset.end_time = max(importer.max_time for importer in importers if importer.max_time is not None)
+    dataset.save()
+
+    elapsed = time() - start
+    return dataset, {
+        'seconds': elapsed,
+        'files': len(filenames),
+        'lines': lines,
+        'imported': sum(importer.imported for importer in importers),
+        'errors': sum(importer.errors for importer in importers),
+        'lines_per_second': lines / elapsed if elapsed > 0 else None,
+        'file_workers': file_workers,
+    }
+
+
+def time_datatable(dataset, dimension_keys, repeat=1):
+    """Time DataTable.generate for the given dimensions, returning the best of ``repeat`` runs."""
+    best = None
+    rows = None
+    try:
+        for i in xrange(repeat):
+            start = time()
+            datatable = DataTable(*dimension_keys)
+            result = datatable.generate(dataset)
+            # tables are usually lazy querysets
+            rows = len(list(result['table'])) if result is not None else 0
+            elapsed = time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+    except Exception as e:
+        traceback.print_exc()
+        return {'error': "%s: %s" % (type(e).__name__, e)}
+
+    return {'seconds': best, 'rows': rows}
+
+
+class Command(BaseCommand):
+    """
+    Benchmark importing and charting synthetic datasets of increasing size.
+
+    For each size, a corpus is generated and imported, then every registered
+    dimension and every pair of dimensions is timed through
+    :meth:`DataTable.generate <msgvis.apps.datatable.models.DataTable.generate>`.
+    The results are written as JSON so runs can be compared across versions.
+
+    .. code-block :: bash
+
+        $ python manage.py benchmark_corpus --sizes 10000,100000 --output before.json
+
+    With ``--workers 0,1,2,4`` each corpus is also imported with that many
+    parser processes (0 is the serial importer) to show how imports scale.
+    The first worker count is used for the dataset that gets charted.
+
+    With ``--file-workers 0,2,4`` the corpus is also split into ``--files``
+    files and imported with that many files at a time, where 0 imports the
+    files one after another with the bulk importer.
+
+    Unless ``--keep`` is given, deleting the dataset is timed as well. With
+    ``--compare-delete`` a second copy is imported and deleted through the
+    Django ORM, as ``delete_corpus`` used to, for comparison.
+
+    """
+    help = "Benchmark import and data table generation on synthetic corpora."
+    option_list = BaseCommand.option_list + (
+        make_option('--sizes',
+                    action='store',
+                    dest='sizes',
+                    default='1000,10000',
+                    help='Comma-separated list of corpus sizes (number of tweets)'
+        ),
+        make_option('-o', '--output',
+                    action='store',
+                    dest='output',
+                    default='benchmark_report.json',
+                    help='Where to write the JSON report'
+        ),
+        make_option('--seed',
+                    action='store',
+                    dest='seed',
+                    default=0,
+                    help='Random seed for the corpus generator'
+        ),
+        make_option('--dimensions',
+                    action='store',
+                    dest='dimensions',
+                    default=None,
+                    help='Comma-separated dimension keys to time (defaults to all)'
+        ),
+        make_option('--no-pairs',
+                    action='store_false',
+                    dest='pairs',
+                    default=True,
+                    help='Only time single dimensions'
+        ),
+        make_option('--repeat',
+                    action='store',
+                    dest='repeat',
+                    default=1,
+                    help='Report the best of this many runs per data table'
+        ),
+        make_option('--keep',
+                    action='store_true',
+                    dest='keep',
+                    default=False,
+                    help='Keep the benchmark datasets instead of deleting them'
+        ),
+        make_option('--workers',
+                    action='store',
+                    dest='workers',
+                    default='0',
+                    help='Comma-separated parser process counts to import with'
+        ),
+        make_option('--compare-delete',
+                    action='store_true',
+                    dest='compare_delete',
+                    default=False,
+                    help='Also time deleting a copy of each dataset through the ORM'
+        ),
+        make_option('--file-workers',
+                    action='store',
+                    dest='file_workers',
+                    default=None,
+                    help='Comma-separated file process counts to import a split corpus with'
+        ),
+        make_option('--files',
+                    action='store',
+                    dest='files',
+                    default=8,
+                    help='The number of files to split the corpus into for --file-workers'
+        ),
+    )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(s) for s in options.get('sizes').split(',')]
+        except ValueError:
+            raise CommandError("Sizes must be a comma-separated list of numbers.")
+
+        try:
+            workers = [int(w) for w in options.get('workers').split(',')]
+        except ValueError:
+            raise CommandError("Workers must be a comma-separated list of numbers.")
+
+        file_workers = []
+        if options.get('file_workers'):
+            try:
+                file_workers = [int(w) for w in options.get('file_workers').split(',')]
+            except ValueError:
+                raise CommandError("File workers must be a comma-separated list of numbers.")
+
+        seed = int(options.get('seed'))
+        repeat = max(1, int(options.get('repeat')))
+
+        if options.get('dimensions'):
+            dimension_keys = options.get('dimensions').split(',')
+        else:
+            dimension_keys = sorted(key for key in registry.get_dimension_ids() if key not in SKIP_DIMENSIONS)
+
+        from django.db import connection
+
+        report = {
+            'created_at': datetime.datetime.utcnow().isoformat(),
+            'revision': git_revision(),
+            'database': connection.vendor,
+            'seed': seed,
+            'runs': [],
+        }
+
+        for size in sizes:
+            print >> sys.stderr, "Benchmarking %d messages..." % size
+            report['runs'].append(self.benchmark_size(size, seed, dimension_keys,
+                                                      pairs=options.get('pairs'),
+                                                      repeat=repeat,
+                                                      keep=options.get('keep'),
+                                                      workers=workers,
+                                                      file_workers=file_workers,
+                                                      files=int(options.get('files')),
+                                                      compare_delete=options.get('compare_delete')))
+
+            # write as we go so partial results survive a crash
+            with open(options.get('output'), 'w') as out:
+                json.dump(report, out, indent=2, sort_keys=True)
+
+        print "Wrote benchmark report to %s" % options.get('output')
+
+    def benchmark_size(self, size, seed, dimension_keys, pairs=True, repeat=1, keep=False, workers=(0,),
+                       file_workers=(), files=8, compare_delete=False):
+        run = {'size': size}
+
+        fd, corpus_filename = tempfile.mkstemp(suffix='.json', prefix='synthetic_corpus_')
+        os.close(fd)
+        try:
+            generator = SyntheticTweetGenerator(seed=seed, num_users=max(100, size / 10))
+            start = time()
+            with open(corpus_filename, 'wb') as fp:
+                generator.write(fp, size)
+            run['generate'] = {'seconds': time() - start,
+                               'bytes': os.path.getsize(corpus_filename)}
+
+            dataset, run['import'] = import_synthetic_dataset(corpus_filename,
+                                                              "benchmark-%d-%d" % (size, seed),
+                                                              workers=workers[0])
+
+            if len(workers) > 1:
+                run['import_scaling'] = {str(workers[0]): run['import']}
+                for count in workers[1:]:
+                    extra, timings = import_synthetic_dataset(corpus_filename,
+                                                              "benchmark-%d-%d-workers-%d" % (size, seed, count),
+                                                              workers=count)
+                    run['import_scaling'][str(count)] = timings
+                    print >> sys.stderr, "  import with %d workers: %.2fs" % (count, timings['seconds'])
+                    delete_dataset(extra)
+
+            if file_workers:
+                run['file_scaling'] = self.benchmark_files(corpus_filename, size, seed, file_workers, files)
+
+            if compare_delete:
+                copy, timings = import_synthetic_dataset(corpus_filename, "benchmark-%d-%d-copy" % (size, seed))
+                start = time()
+                collector_delete(copy)
+                run['delete_collector'] = {'seconds': time() - start}
+                print >> sys.stderr, "  delete through the ORM: %.2fs" % run['delete_collector']['seconds']
+        finally:
+            os.remove(corpus_filename)
+
+        try:
+            run['messages'] = dataset.message_set.count()
+
+            single = {}
+            for key in dimension_keys:
+                single[key] = time_datatable(dataset, [key], repeat=repeat)
+                print >> sys.stderr, "  %s: %s" % (key, single[key])
+            run['single'] = single
+
+            if pairs:
+                pair_timings = {}
+                for primary, secondary in itertools.combinations(dimension_keys, 2):
+                    label = "%s|%s" % (primary, secondary)
+                    pair_timings[label] = time_datatable(dataset, [primary, secondary], repeat=repeat)
+                    print >> sys.stderr, "  %s: %s" % (label, pair_timings[label])
+                run['pairs'] = pair_timings
+
+        finally:
+            if not keep:
+                start = time()
+                counts = delete_dataset(dataset)
+                counts.update(delete_orphans())
+                run['delete'] = {'seconds': time() - start, 'rows': sum(counts.itervalues())}
+                print >> sys.stderr, "  delete: %.2fs" % run['delete']['seconds']
+
+        return run
+
+    def benchmark_files(self, corpus_filename, size, seed, file_workers, files):
+        """Split the corpus into ``files`` files and time importing them with each number of file workers."""
+        directory = tempfile.mkdtemp(prefix='synthetic_corpus_')
+        try:
+            with open(corpus_filename, 'rb') as fp:
+                lines = fp.readlines()
+
+            per_file = max(1, (len(lines) + files - 1) / files)
+            filenames = []
+            for i in xrange(0, len(lines), per_file):
+                filename = os.path.join(directory, 'part-%04d.json' % len(filenames))
+                with open(filename, 'wb') as out:
+                    out.writelines(lines[i:i + per_file])
+                filenames.append(filename)
+
+            scaling = {}
+            for count in file_workers:
+                extra, timings = import_synthetic_files(filenames,
+                                                        "benchmark-%d-%d-files-%d" % (size, seed, count),
+                                                        file_workers=count)
+                scaling[str(count)] = timings
+                print >> sys.stderr, "  import %d files with %d file workers: %.2fs" % (len(filenames), count,
+                                                                                      timings['seconds'])
+                delete_dataset(extra)
+            return scaling
+        finally:
+            shutil.rmtree(directory)
@@ -1,17 +1,40 @@
 from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+from time import time
+
+from msgvis.apps.corpus.models import Dataset
+from msgvis.apps.importer.deletion import delete_dataset, delete_orphans, collector_delete, DELETE_CHUNK_SIZE
 
-from msgvis.apps.corpus.models import Dataset, Hashtag, Url, Media
 
 class Command(BaseCommand):
     """
-    Import a corpus of message data into the database.
+    Delete a dataset, then any media, hashtags and urls no longer used by a message.
 
     .. code-block :: bash
 
-        $ python manage.py import_corpus <file_path>
+        $ python manage.py delete_corpus <corpus_name_or_id>
+
+    Messages, people and their related rows are deleted with chunked set-based
+    queries (see :mod:`msgvis.apps.importer.deletion`). ``--use-collector``
+    deletes through the Django ORM instead, which is much slower on large datasets.
 
     """
     args = "<corpus_name_or_id>"
+    help = "Delete a dataset and the hashtags, urls and media only it used."
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size',
+                    action='store',
+                    dest='chunk_size',
+                    default=DELETE_CHUNK_SIZE,
+                    help='The number of ids to delete per query'
+        ),
+        make_option('--use-collector',
+                    action='store_true',
+                    dest='use_collector',
+                    default=False,
+                    help='Delete through the Django ORM'
+        ),
+    )
 
     def handle(self, corpus_name_or_id=None, *args, **options):
 
@@ -27,16 +50,25 @@ class Command(BaseCommand):
         print "Deleting dataset %s with %d messages and %d people..." % (dataset.name,
                                                                          dataset.message_set.count(),
                                                                          dataset.person_set.count())
-        dataset.delete()
-
-        # Now delete all the unused crap
-        media = Media.objects.filter(message=None)
-        print "Deleting %d unused media..." % media.count()
-        media.delete()
-        
-        hashtags = Hashtag.objects.filter(message=None)
-        print "Deleting %d unused hashtags..." % hashtags.count()
-        hashtags.delete()
-        urls = Url.objects.filter(message=None)
-        print "Deleting %d unused urls..." % urls.count()
-        urls.delete()
+        start = time()
+        if options.get('use_collector'):
+            collector_delete(dataset)
+        else:
+            chunk_size = int(options.get('chunk_size'))
+            self._start = start
+            self._last_report = 0
+            counts = delete_dataset(dataset, chunk_size=chunk_size, progress=self.report)
+            counts.update(delete_orphans(chunk_size=chunk_size, progress=self.report))
+
+            for table, count in counts.iteritems():
+                print "  %s: %d rows" % (table, count)
+
+        print "Time: %.2fs" % (time() - start)
+
+    def report(self, step, done, total, counts):
+        # at most one line every few seconds, plus the end of each step
+        elapsed = time() - self._start
+        if done == total or elapsed - self._last_report >= 5:
+            self._last_report = elapsed
+            print "%6.2fs | %s: %d of %d chunks (%d rows so far)" % (elapsed, step, done, total,
+                                                                     sum(counts.itervalues()))
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+from time import time
+
+from msgvis.apps.importer.synthetic import SyntheticTweetGenerator
+
+
+class Command(BaseCommand):
+    """
+    Write a synthetic tweet corpus that can be loaded with ``import_corpus``.
+
+    .. code-block :: bash
+
+        $ python manage.py generate_tweets tweets.json --count 1000000 --seed 1
+
+    """
+    args = '<output_filename>'
+    help = "Generate a synthetic tweet corpus."
+    option_list = BaseCommand.option_list + (
+        make_option('-n', '--count',
+                    action='store',
+                    dest='count',
+                    default=10000,
+                    help='The number of tweets to generate'
+        ),
+        make_option('--seed',
+                    action='store',
+                    dest='seed',
+                    default=0,
+                    help='Random seed'
+        ),
+        make_option('--users',
+                    action='store',
+                    dest='num_users',
+                    default=None,
+                    help='The number of distinct senders (defaults to count / 10)'
+        ),
+        make_option('--days',
+                    action='store',
+                    dest='days',
+                    default=7,
+                    help='The approximate time span of the corpus in days'
+        ),
+    )
+
+    def handle(self, output_filename=None, *args, **options):
+        if not output_filename:
+            raise CommandError("Output filename must be provided.")
+
+        from datetime import timedelta
+
+        count = int(options.get('count'))
+        num_users = options.get('num_users')
+        if num_users is None:
+            num_users = max(100, count / 10)
+
+        generator = SyntheticTweetGenerator(seed=int(options.get('seed')),
+                                            num_users=int(num_users),
+                                            duration=timedelta(days=float(options.get('days'))))
+
+        start = time()
+        with open(output_filename, 'wb') as fp:
+            written = generator.write(fp, count)
+
+        print "Wrote %d tweets to %s" % (written, output_filename)
+        print "Time: %.2fs" % (time() - start)
@@ -1,11 +1,20 @@
 from django.core.management.base import BaseCommand, CommandError
-from msgvis.apps.importer.models import create_an_instance_from_json
+from msgvis.apps.importer.models import create_an_instance_from_json, ImportCheckpoint
+from msgvis.apps.importer.streams import open_corpus_file
+from msgvis.apps.importer.bulk import normalize_lines, BulkTweetWriter
+from msgvis.apps.importer.counters import CounterDeltas
 from optparse import make_option
 
 from msgvis.apps.corpus.models import Dataset
 from django.db import transaction
 import traceback
 import sys
+import os
+import functools
+import multiprocessing
+import threading
+import Queue
+from collections import defaultdict, deque
 import path
 from time import time
 from django.conf import settings
@@ -18,6 +27,47 @@ class Command(BaseCommand):
 
         $ python manage.py import_corpus <file_path>
 
+    With ``--bulk``, each batch of lines is parsed in memory and written
+    with a few set-based queries instead of one round trip per object.
+
+    .. code-block :: bash
+
+        $ python manage.py import_corpus --bulk --batch-size 5000 <file_path>
+
+    With ``--workers``, JSON parsing and sentiment scoring run in that many
+    worker processes while this process writes to the database.
+
+    .. code-block :: bash
+
+        $ python manage.py import_corpus --workers 4 <file_path>
+
+    Files ending in ``.gz``, ``.bz2`` or ``.xz`` are decompressed as they
+    are read. Progress through each file is checkpointed with every
+    transaction, and ``--resume`` continues an interrupted import from its
+    last checkpoint, skipping files that were already finished.
+
+    .. code-block :: bash
+
+        $ python manage.py import_corpus --resume -d my_dataset tweets-*.json.gz
+
+    With ``--file-workers``, several files are read and parsed at once,
+    one per process (see :class:`MultiFileImporter`).
+
+    .. code-block :: bash
+
+        $ python manage.py import_corpus --file-workers 4 -d my_dataset hourly/*.json.gz
+
+    With ``--no-sentiment``, messages are imported without scoring their
+    sentiment, which can then be done in parallel by ``compute_sentiment``.
+
+    .. code-block :: bash
+
+        $ python manage.py import_corpus --workers 4 --no-sentiment -d my_dataset <file_path>
+        $ python manage.py compute_sentiment --workers 4 --missing <dataset_id>
+
+    The dataset's ``version`` is incremented after each file that writes any
+    messages, even if it fails part way, so term timelines and co-occurrence
+    built before the import are no longer used.
     """
     args = '<corpus_filename> [...]'
     help = "Import a corpus into the database."
@@ -27,6 +77,42 @@ class Command(BaseCommand):
                     dest='dataset',
                     help='Set a target dataset to add to'
         ),
+        make_option('--bulk',
+                    action='store_true',
+                    dest='bulk',
+                    default=False,
+                    help='Resolve entities in memory and write each batch with bulk queries'
+        ),
+        make_option('--batch-size',
+                    action='store',
+                    dest='batch_size',
+                    default=None,
+                    help='The number of lines per transaction'
+        ),
+        make_option('--workers',
+                    action='store',
+                    dest='workers',
+                    default=0,
+                    help='The number of parser processes (implies --bulk)'
+        ),
+        make_option('--file-workers',
+                    action='store',
+                    dest='file_workers',
+                    default=0,
+                    help='Import this many files at once, each parsed in its own process (implies --bulk)'
+        ),
+        make_option('--resume',
+                    action='store_true',
+                    dest='resume',
+                    default=False,
+                    help='Continue from the last checkpoint of each file'
+        ),
+        make_option('--no-sentiment',
+                    action='store_false',
+                    dest='sentiment',
+                    default=True,
+                    help='Leave new and changed messages without a sentiment, for compute_sentiment'
+        ),
     )
 
     def handle(self, *filenames, **options):
@@ -42,7 +128,25 @@ class Command(BaseCommand):
             if not path.path(f).exists():
                 raise CommandError("Filename %s does not exist" % f)
 
+        workers = int(options.get('workers'))
+        file_workers = int(options.get('file_workers'))
+        if workers > 0 and file_workers > 0:
+            raise CommandError("Use either --workers or --file-workers, not both.")
+
+        sentiment = options.get('sentiment')
+        if workers > 0:
+            importer_class = functools.partial(ParallelImporter, workers=workers, sentiment=sentiment)
+        elif options.get('bulk'):
+            importer_class = functools.partial(BulkImporter, sentiment=sentiment)
+        else:
+            importer_class = functools.partial(Importer, sentiment=sentiment)
+        batch_size = options.get('batch_size')
+        if batch_size is not None:
+            batch_size = int(batch_size)
+
         start = time()
+        lines = 0
+        bytes_read = 0
         dataset_obj, created = Dataset.objects.get_or_create(name=dataset, description=dataset)
         if created:
             print "Created dataset '%s' (%d)" % (dataset_obj.name, dataset_obj.id)
@@ -50,60 +154,146 @@ class Command(BaseCommand):
             print "Adding to existing dataset '%s' (%d)" % (dataset_obj.name, dataset_obj.id)
 
 
-        for i, corpus_filename in enumerate(filenames):
-            with open(corpus_filename, 'rb') as fp:
-                if len(filenames) > 1:
-                    print "Reading file %d of %d %s" % (i + 1, len(filenames), corpus_filename)
-                else:
-                    print "Reading file %s" % corpus_filename
-
-                importer = Importer(fp, dataset_obj)
+        pending = []
+        for corpus_filename in filenames:
+            checkpoint, created = ImportCheckpoint.objects.get_or_create(dataset=dataset_obj,
+                                                                         filename=os.path.abspath(corpus_filename))
+            if not options.get('resume'):
+                checkpoint.line = 0
+                checkpoint.offset = 0
+                checkpoint.min_time = None
+                checkpoint.max_time = None
+                checkpoint.completed = False
+                checkpoint.save()
+
+            if checkpoint.completed:
+                print "Skipping %s, which was already imported" % corpus_filename
+                self.extend_time_range(dataset_obj, checkpoint.min_time, checkpoint.max_time)
+            else:
+                pending.append((corpus_filename, checkpoint))
+
+        if file_workers > 0 and pending:
+            print "Reading %d files with %d processes" % (len(pending), file_workers)
+            importer = MultiFileImporter(pending, dataset_obj, workers=file_workers, sentiment=sentiment)
+            if batch_size:
+                importer.commit_every = batch_size
+            try:
                 importer.run()
+            finally:
+                if any(file_importer.imported for file_importer in importer.importers):
+                    self.increment_version(dataset_obj)
 
-                min_time, max_time = importer.get_time_range()
+            # merge the time ranges of all the files at the end
+            for file_importer in importer.importers:
+                lines += file_importer.line - file_importer.start_line
+                bytes_read += file_importer.offset - file_importer.start_offset
+                min_time, max_time = file_importer.get_time_range()
+                self.extend_time_range(dataset_obj, min_time, max_time)
 
-                if min_time is not None and \
-                    (dataset_obj.start_time is None
-                     or dataset_obj.start_time > min_time):
-                    dataset_obj.start_time = min_time
+            dataset_obj.save()
+
+            if importer.failed:
+                raise CommandError("Failed to import %s; use --resume to continue from the last checkpoint" %
+                                   ", ".join(importer.failed))
+
+        else:
+            for i, (corpus_filename, checkpoint) in enumerate(pending):
+                with open_corpus_file(corpus_filename) as fp:
+                    if len(pending) > 1:
+                        print "Reading file %d of %d %s" % (i + 1, len(pending), corpus_filename)
+                    else:
+                        print "Reading file %s" % corpus_filename
+
+                    if checkpoint.line > 0:
+                        print "Resuming from line %d" % checkpoint.line
+                        fp.seek(checkpoint.offset)
+
+                    importer = importer_class(fp, dataset_obj, checkpoint=checkpoint)
+                    if batch_size:
+                        importer.commit_every = batch_size
+                    try:
+                        importer.run()
+                    finally:
+                        if importer.imported:
+                            self.increment_version(dataset_obj)
+                    lines += importer.line - importer.start_line
+                    bytes_read += importer.offset - importer.start_offset
 
-                if max_time is not None and \
-                    (dataset_obj.end_time is None
-                     or dataset_obj.end_time < max_time):
-                    dataset_obj.end_time = max_time
+                    min_time, max_time = importer.get_time_range()
+                    self.extend_time_range(dataset_obj, min_time, max_time)
 
-        dataset_obj.save()
+                # keep the time range of finished files even if a later one fails
+                dataset_obj.save()
 
         print "Dataset '%s' (%d) contains %d messages spanning %s, from %s to %s" % (
             dataset_obj.name, dataset_obj.id, dataset_obj.message_set.count(),
             dataset_obj.end_time - dataset_obj.start_time,
             dataset_obj.start_time, dataset_obj.end_time
         )
-        
-        print "Time: %.2fs" % (time() - start)
+
+        elapsed = time() - start
+        if elapsed > 0:
+            print "Time: %.2fs (%.1f lines/s, %.2f MB/s)" % (elapsed, lines / elapsed, bytes_read / elapsed / 1e6)
+
+    def increment_version(self, dataset_obj):
+        """Mark the dataset's messages as changed, so precalculated data built from them is not used."""
+        with transaction.atomic():
+            dataset = Dataset.objects.select_for_update().get(pk=dataset_obj.pk)
+            dataset.version += 1
+            dataset.save(update_fields=['version'])
+        dataset_obj.version = dataset.version
+
+    def extend_time_range(self, dataset_obj, min_time, max_time):
+        if min_time is not None and \
+            (dataset_obj.start_time is None
+             or dataset_obj.start_time > min_time):
+            dataset_obj.start_time = min_time
+
+        if max_time is not None and \
+            (dataset_obj.end_time is None
+             or dataset_obj.end_time < max_time):
+            dataset_obj.end_time = max_time
 
 
 class Importer(object):
     commit_every = 100
     print_every = 1000
 
-    def __init__(self, fp, dataset):
+    def __init__(self, fp, dataset, checkpoint=None, sentiment=True):
         self.fp = fp
         self.dataset = dataset
+        self.sentiment = sentiment
         self.line = 0
+        self.offset = 0
         self.imported = 0
         self.not_tweets = 0
         self.errors = 0
         self.min_time = None
         self.max_time = None
 
+        # Continue from where an earlier import of the file stopped.
+        # The caller is responsible for seeking fp to checkpoint.offset.
+        self.checkpoint = checkpoint
+        if checkpoint is not None:
+            self.line = checkpoint.line
+            self.offset = checkpoint.offset
+            self.min_time = checkpoint.min_time
+            self.max_time = checkpoint.max_time
+
+        self.start_line = self.line
+        self.start_offset = self.offset
+
     def _import_group(self, lines):
+        # reply, share and mention counts are written once for the whole group
+        counters = CounterDeltas()
+
         with transaction.atomic(savepoint=False):
             for json_str in lines:
 
                 if len(json_str) > 0:
                     try:
-                        message = create_an_instance_from_json(json_str, self.dataset)
+                        message = create_an_instance_from_json(json_str, self.dataset, counters=counters,
+                                                               sentiment=self.sentiment)
                         if message:
                             self.imported += 1
 
@@ -118,6 +308,9 @@ class Importer(object):
                         print >> sys.stderr, "Import error on line %d" % self.line
                         traceback.print_exc()
 
+            counters.apply()
+            self._save_checkpoint()
+
         #if settings.DEBUG:
             # prevent memory leaks
         #    from django.db import connection
@@ -131,6 +324,7 @@ class Importer(object):
 
         for json_str in self.fp:
             self.line += 1
+            self.offset += len(json_str)
             json_str = json_str.strip()
             transaction_group.append(json_str)
 
@@ -139,14 +333,387 @@ class Importer(object):
                 transaction_group = []
 
             if self.line > 0 and self.line % self.print_every == 0:
-                print "%6.2fs | Reached line %d. Imported: %d; Non-tweets: %d; Errors: %d" % (
-                time() - start, self.line, self.imported, self.not_tweets, self.errors)
+                self._report(start)
 
         if len(transaction_group) >= 0:
             self._import_group(transaction_group)
 
-        print "%6.2fs | Finished %d lines. Imported: %d; Non-tweets: %d; Errors: %d" % (
-        time() - start, self.line, self.imported, self.not_tweets, self.errors)
+        self._save_checkpoint(completed=True)
+        self._report(start, finished=True)
+
+    def _report(self, start, finished=False):
+        elapsed = time() - start
+        lines_per_second, mb_per_second = self.get_throughput(elapsed)
+        print "%6.2fs | %s (%.1f lines/s, %.2f MB/s). Imported: %d; Non-tweets: %d; Errors: %d" % (
+        elapsed, ("Finished %d lines" if finished else "Reached line %d") % self.line,
+        lines_per_second, mb_per_second,
+        self.imported, self.not_tweets, self.errors)
+
+    def get_throughput(self, elapsed):
+        """Lines and (uncompressed) megabytes per second read since this importer started."""
+        if elapsed <= 0:
+            return 0, 0
+        return (self.line - self.start_line) / elapsed, (self.offset - self.start_offset) / elapsed / 1e6
+
+    def _save_checkpoint(self, completed=False):
+        """Record how far the import has gotten. Call this inside the group's transaction."""
+        if self.checkpoint is None:
+            return
+
+        self.checkpoint.line = self.line
+        self.checkpoint.offset = self.offset
+        self.checkpoint.min_time = self.min_time
+        self.checkpoint.max_time = self.max_time
+        self.checkpoint.completed = completed
+        self.checkpoint.save()
 
     def get_time_range(self):
         return self.min_time, self.max_time
+
+    def _track_time(self, message_time):
+        if message_time is None:
+            return
+        if self.min_time is None or self.min_time > message_time:
+            self.min_time = message_time
+        if self.max_time is None or self.max_time < message_time:
+            self.max_time = message_time
+
+
+class BulkImporter(Importer):
+    """
+    Imports each group of lines with a :class:`msgvis.apps.importer.bulk.BulkTweetWriter`.
+    If writing a group fails, it is imported again one line at a time so that
+    a single bad tweet only costs itself.
+    """
+    commit_every = 1000
+    print_every = 10000
+
+    def __init__(self, fp, dataset, checkpoint=None, sentiment=True):
+        super(BulkImporter, self).__init__(fp, dataset, checkpoint=checkpoint, sentiment=sentiment)
+        self.writer = BulkTweetWriter(dataset, sentiment=sentiment)
+
+    def _import_group(self, lines):
+        first_line = self.line - len(lines) + 1
+        records, not_tweets, errors = normalize_lines(first_line, lines, self.sentiment)
+        self._write_group(lines, records, not_tweets, errors)
+
+    def _write_group(self, lines, records, not_tweets, errors):
+        """Write the normalized records for a group of lines ending at ``self.line``."""
+        for line_number, error in errors:
+            print >> sys.stderr, "Import error on line %d" % line_number
+            print >> sys.stderr, error,
+
+        min_time, max_time = self.min_time, self.max_time
+        try:
+            with transaction.atomic(savepoint=False):
+                self.writer.write(records)
+
+                # the checkpoint includes the times of this group
+                for record in records:
+                    self._track_time(record.time)
+                self._save_checkpoint()
+        except:
+            self.min_time, self.max_time = min_time, max_time
+            print >> sys.stderr, "Bulk import failed for lines %d-%d; retrying one line at a time" % (
+                self.line - len(lines) + 1, self.line)
+            traceback.print_exc()
+            # ids cached by the writer may belong to the rolled back transaction
+            self.writer = BulkTweetWriter(self.dataset, sentiment=self.sentiment)
+            super(BulkImporter, self)._import_group(lines)
+            return
+
+        self.imported += len(records)
+        self.not_tweets += not_tweets
+        self.errors += len(errors)
+
+
+def _parse_worker(input_queue, output_queue, sentiment=True):
+    """Runs in a parser process: normalizes groups of lines until it gets None."""
+    while True:
+        task = input_queue.get()
+        if task is None:
+            output_queue.put(None)
+            return
+
+        sequence, first_line, lines = task
+        output_queue.put((sequence, normalize_lines(first_line, lines, sentiment)))
+
+
+class ParallelImporter(BulkImporter):
+    """
+    A :class:`BulkImporter` that parses in a pool of worker processes.
+
+    A reader thread splits the file into groups of lines for the workers,
+    which do the JSON decoding, date parsing and sentiment scoring. This
+    process is the only one that talks to the database: it writes the
+    parsed groups in file order, so the result is the same as a serial
+    import. At most ``max_pending`` groups are in flight at once, so a slow
+    database makes the reader wait instead of filling up memory.
+    """
+
+    def __init__(self, fp, dataset, workers=2, checkpoint=None, sentiment=True):
+        super(ParallelImporter, self).__init__(fp, dataset, checkpoint=checkpoint, sentiment=sentiment)
+        self.workers = workers
+        self.max_pending = workers * 4
+        self._read_error = None
+
+    def _read_groups(self, input_queue, pending, slots):
+        try:
+            sequence = 0
+            group = []
+            line = self.start_line
+            offset = self.start_offset
+            for json_str in self.fp:
+                line += 1
+                offset += len(json_str)
+                group.append(json_str.strip())
+                if len(group) >= self.commit_every:
+                    slots.acquire()
+                    pending[sequence] = (group, offset)
+                    input_queue.put((sequence, line - len(group) + 1, group))
+                    sequence += 1
+                    group = []
+
+            if len(group) > 0:
+                slots.acquire()
+                pending[sequence] = (group, offset)
+                input_queue.put((sequence, line - len(group) + 1, group))
+        except Exception as e:
+            self._read_error = e
+            traceback.print_exc()
+        finally:
+            for i in xrange(self.workers):
+                input_queue.put(None)
+
+    def run(self):
+        start = time()
+
+        input_queue = multiprocessing.Queue(self.max_pending)
+        output_queue = multiprocessing.Queue(self.max_pending)
+
+        # The workers never touch the database, and multiprocessing exits
+        # them with os._exit, so they don't disturb the inherited connection.
+        workers = [multiprocessing.Process(target=_parse_worker, args=(input_queue, output_queue, self.sentiment))
+                   for i in xrange(self.workers)]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+
+        pending = {}
+        slots = threading.Semaphore(self.max_pending)
+        reader = threading.Thread(target=self._read_groups, args=(input_queue, pending, slots))
+        reader.daemon = True
+        reader.start()
+
+        parsed = {}
+        next_sequence = 0
+        finished = 0
+        next_report = (self.line / self.print_every + 1) * self.print_every
+
+        try:
+            while finished < len(workers):
+                try:
+                    result = output_queue.get(timeout=1)
+                except Queue.Empty:
+                    if any(worker.exitcode not in (None, 0) for worker in workers):
+                        raise RuntimeError("A parser process exited unexpectedly")
+                    continue
+
+                if result is None:
+                    finished += 1
+                    continue
+
+                sequence, normalized = result
+                parsed[sequence] = normalized
+
+                # write in file order so later lines win, as in a serial import
+                while next_sequence in parsed:
+                    lines, self.offset = pending.pop(next_sequence)
+                    self.line += len(lines)
+                    self._write_group(lines, *parsed.pop(next_sequence))
+                    slots.release()
+                    next_sequence += 1
+
+                if self.line >= next_report:
+                    self._report(start)
+                    next_report = (self.line / self.print_every + 1) * self.print_every
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+                worker.join()
+
+        if self._read_error is not None:
+            raise self._read_error
+
+        self._save_checkpoint(completed=True)
+        self._report(start, finished=True)
+
+
+def _file_worker(task_queue, output_queue, commit_every, sentiment=True):
+    """
+    Runs in a file reader process: reads, decompresses and normalizes
+    whole files in groups of lines until it gets None.
+    """
+    while True:
+        task = task_queue.get()
+        if task is None:
+            output_queue.put(None)
+            return
+
+        index, filename, line, offset = task
+        try:
+            with open_corpus_file(filename) as fp:
+                if offset > 0:
+                    fp.seek(offset)
+
+                group = []
+                for json_str in fp:
+                    line += 1
+                    offset += len(json_str)
+                    group.append(json_str.strip())
+                    if len(group) >= commit_every:
+                        output_queue.put(('group', index, line, offset, group,
+                                          normalize_lines(line - len(group) + 1, group, sentiment)))
+                        group = []
+
+                if len(group) > 0:
+                    output_queue.put(('group', index, line, offset, group,
+                                      normalize_lines(line - len(group) + 1, group, sentiment)))
+
+            output_queue.put(('done', index))
+        except Exception:
+            output_queue.put(('error', index, traceback.format_exc()))
+
+
+class MultiFileImporter(object):
+    """
+    Imports several files at once. Each worker process takes a whole file
+    at a time, reading, decompressing and parsing it into groups of lines.
+
+    Like :class:`ParallelImporter`, this process is the only one that
+    writes to the database. It uses one :class:`BulkImporter` per file to
+    keep track of the file's checkpoint and time range, so every person,
+    hashtag, url and message is resolved against ``(dataset, original_id)``
+    by a single writer and can't be created twice. Groups are written in
+    the order of the files and their lines, as a serial import would, so
+    the result doesn't depend on which worker finishes first: the groups
+    of files read ahead of the one being written are held in memory until
+    it is finished.
+
+    Files that fail part way are reported in ``failed`` and keep their
+    checkpoint, so they can be resumed.
+    """
+    commit_every = 1000
+    print_every = 10000
+
+    def __init__(self, files, dataset, workers=2, sentiment=True):
+        self.dataset = dataset
+        self.workers = workers
+        self.max_pending = workers * 4
+        self.sentiment = sentiment
+        self.filenames = [filename for filename, checkpoint in files]
+        self.importers = [BulkImporter(None, dataset, checkpoint=checkpoint, sentiment=sentiment)
+                          for filename, checkpoint in files]
+        self.failed = []
+
+    @property
+    def line(self):
+        return sum(importer.line - importer.start_line for importer in self.importers)
+
+    def run(self):
+        start = time()
+
+        task_queue = multiprocessing.Queue()
+        for index, filename in enumerate(self.filenames):
+            importer = self.importers[index]
+            importer.commit_every = self.commit_every
+            task_queue.put((index, filename, importer.line, importer.offset))
+        for i in xrange(self.workers):
+            task_queue.put(None)
+
+        output_queue = multiprocessing.Queue(self.max_pending)
+
+        # As with ParallelImporter, the workers never touch the database.
+        workers = [multiprocessing.Process(target=_file_worker,
+                                           args=(task_queue, output_queue, self.commit_every, self.sentiment))
+                   for i in xrange(self.workers)]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+
+        finished = 0
+        next_report = self.print_every
+        next_index = 0
+        buffered = defaultdict(deque)
+
+        try:
+            while finished < len(workers):
+                try:
+                    result = output_queue.get(timeout=1)
+                except Queue.Empty:
+                    if any(worker.exitcode not in (None, 0) for worker in workers):
+                        raise RuntimeError("A file reader process exited unexpectedly")
+                    continue
+
+                if result is None:
+                    finished += 1
+                    continue
+
+                # write in file order so later files win, as in a serial import
+                buffered[result[1]].append(result)
+                while next_index < len(self.importers) and buffered[next_index]:
+                    if self._write_result(buffered[next_index].popleft()):
+                        del buffered[next_index]
+                        next_index += 1
+
+                if self.line >= next_report:
+                    self._report(start)
+                    next_report = (self.line / self.print_every + 1) * self.print_every
+        finally:
+            for worker in workers:
+                if worker.is_alive():
+                    worker.terminate()
+                worker.join()
+
+        self._report(start, finished=True)
+
+    def _write_result(self, result):
+        """Write one result from a file reader. Returns True once the file is finished."""
+        kind, index = result[:2]
+        importer = self.importers[index]
+        if kind == 'group':
+            importer.line, importer.offset, lines, normalized = result[2:]
+            importer._write_group(lines, *normalized)
+            return False
+        elif kind == 'done':
+            importer._save_checkpoint(completed=True)
+            print "Finished %s (%d lines)" % (self.filenames[index], importer.line)
+        else:
+            print >> sys.stderr, "Failed to read %s after line %d" % (self.filenames[index], importer.line)
+            print >> sys.stderr, result[2],
+            self.failed.append(self.filenames[index])
+        return True
+
+    def _report(self, start, finished=False):
+        elapsed = time() - start
+        lines_per_second, mb_per_second = self.get_throughput(elapsed)
+        print "%6.2fs | %s (%.1f lines/s, %.2f MB/s). Imported: %d; Non-tweets: %d; Errors: %d" % (
+        elapsed, ("Finished %d lines" if finished else "Reached line %d") % self.line,
+        lines_per_second, mb_per_second,
+        sum(importer.imported for importer in self.importers),
+        sum(importer.not_tweets for importer in self.importers),
+        sum(importer.errors for importer in self.importers))
+
+    def get_throughput(self, elapsed):
+        """Lines and (uncompressed) megabytes per second read across all the files."""
+        if elapsed <= 0:
+            return 0, 0
+        bytes_read = sum(importer.offset - importer.start_offset for importer in self.importers)
+        return self.line / elapsed, bytes_read / elapsed / 1e6
+
+    def get_time_range(self):
+        ranges = [importer.get_time_range() for importer in self.importers]
+        min_times = [min_time for min_time, max_time in ranges if min_time is not None]
+        max_times = [max_time for min_time, max_time in ranges if max_time is not None]
+        return min(min_times) if min_times else None, max(max_times) if max_times else None
@@ -0,0 +1,216 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from optparse import make_option
+from time import time
+import os
+
+from msgvis.apps.corpus.models import Dataset, Message
+from msgvis.apps.enhance.tasks import count_categorical_levels, update_categorical_distributions
+from msgvis.apps.importer.bulk import normalize_lines, chunked, MESSAGE
+from msgvis.apps.importer.models import ImportCheckpoint
+from msgvis.apps.importer.streams import tail_lines, socket_lines
+from msgvis.apps.importer.management.commands.import_corpus import BulkImporter
+
+
+class Command(BaseCommand):
+    """
+    Continuously ingest tweets into a dataset as they arrive, either by
+    following a file that another process appends to:
+
+    .. code-block :: bash
+
+        $ python manage.py ingest_stream -d my_dataset <file_path>
+
+    or by listening for newline-delimited tweets on a TCP port:
+
+    .. code-block :: bash
+
+        $ python manage.py ingest_stream -d my_dataset --listen localhost:9000
+
+    Tweets are committed in micro-batches (see :class:`StreamIngester`), so they
+    show up in the explorer within a few seconds. Progress through a file is
+    checkpointed, and restarting the command continues where it stopped.
+
+    """
+    args = '[<file_path>]'
+    help = "Continuously ingest tweets from a growing file or a socket."
+    option_list = BaseCommand.option_list + (
+        make_option('-d', '--dataset',
+                    action='store',
+                    dest='dataset',
+                    help='Set a target dataset to add to'
+        ),
+        make_option('--listen',
+                    action='store',
+                    dest='listen',
+                    default=None,
+                    help='Receive tweets on host:port instead of reading a file'
+        ),
+        make_option('--batch-size',
+                    action='store',
+                    dest='batch_size',
+                    default=None,
+                    help='The largest number of lines per batch'
+        ),
+        make_option('--max-delay',
+                    action='store',
+                    dest='max_delay',
+                    default=None,
+                    help='The longest a line may wait before it is committed, in seconds'
+        ),
+        make_option('--no-sentiment',
+                    action='store_false',
+                    dest='sentiment',
+                    default=True,
+                    help='Leave new and changed messages without a sentiment, for compute_sentiment'
+        ),
+    )
+
+    def handle(self, filename=None, *args, **options):
+
+        dataset = options.get('dataset')
+        if not dataset:
+            raise CommandError("A dataset must be provided.")
+
+        if (filename is None) == (options.get('listen') is None):
+            raise CommandError("Provide either a filename or --listen host:port.")
+
+        dataset_obj, created = Dataset.objects.get_or_create(name=dataset, description=dataset)
+        if created:
+            print "Created dataset '%s' (%d)" % (dataset_obj.name, dataset_obj.id)
+        else:
+            print "Adding to existing dataset '%s' (%d)" % (dataset_obj.name, dataset_obj.id)
+
+        checkpoint = None
+        fp = None
+        if filename is not None:
+            checkpoint, created = ImportCheckpoint.objects.get_or_create(dataset=dataset_obj,
+                                                                         filename=os.path.abspath(filename))
+            fp = open(filename, 'rb')
+            if checkpoint.offset > 0:
+                print "Resuming %s from line %d" % (filename, checkpoint.line)
+                fp.seek(checkpoint.offset)
+            lines = tail_lines(fp)
+            print "Following %s" % filename
+        else:
+            try:
+                host, port = options.get('listen').rsplit(':', 1)
+                port = int(port)
+            except ValueError:
+                raise CommandError("--listen must look like host:port")
+            lines = socket_lines(host, port)
+            print "Listening on %s:%d" % (host, port)
+
+        ingester = StreamIngester(lines, dataset_obj, checkpoint=checkpoint, sentiment=options.get('sentiment'))
+        if options.get('batch_size'):
+            ingester.commit_every = int(options.get('batch_size'))
+        if options.get('max_delay'):
+            ingester.max_delay = float(options.get('max_delay'))
+
+        try:
+            ingester.run()
+        except KeyboardInterrupt:
+            print "Stopped after %d batches" % ingester.batches
+        finally:
+            if fp is not None:
+                fp.close()
+
+
+class StreamIngester(BulkImporter):
+    """
+    A :class:`BulkImporter` for a never-ending source of lines, such as
+    :func:`msgvis.apps.importer.streams.tail_lines`. The source yields
+    None whenever it is idle.
+
+    Lines are written in micro-batches of at most ``commit_every`` lines,
+    and no line waits more than ``max_delay`` seconds. After each batch,
+    the dataset's time range is extended, its ``version`` is incremented,
+    and the messages the batch created or changed are recounted into its
+    precalculated distributions. The rest of the dataset is never
+    recounted, so older messages that only fall inside the (padded) time
+    range of the distributions once it grows are not added; run
+    ``precalc_categorical_distribution`` now and then to catch up.
+    """
+    commit_every = 500
+    print_every = 10000
+    max_delay = 2.0
+
+    def __init__(self, lines, dataset, checkpoint=None, sentiment=True):
+        super(StreamIngester, self).__init__(lines, dataset, checkpoint=checkpoint, sentiment=sentiment)
+        self.batches = 0
+
+        # everything after this id is new
+        self.last_message_id = dataset.message_set.aggregate(last=Max('id'))['last'] or 0
+
+    def run(self):
+        start = time()
+        batch = []
+        waiting_since = None
+        next_report = (self.line / self.print_every + 1) * self.print_every
+
+        for json_str in self.fp:
+            if json_str is not None:
+                self.line += 1
+                self.offset += len(json_str)
+                batch.append(json_str.strip())
+                if waiting_since is None:
+                    waiting_since = time()
+
+            if batch and (len(batch) >= self.commit_every or time() - waiting_since >= self.max_delay):
+                self.ingest(batch)
+                batch = []
+                waiting_since = None
+
+            if self.line >= next_report:
+                self._report(start)
+                next_report = (self.line / self.print_every + 1) * self.print_every
+
+        # only finite sources end
+        if batch:
+            self.ingest(batch)
+        self._report(start, finished=True)
+
+    def ingest(self, lines):
+        """Write a batch of lines and fold the changes into the dataset's summaries."""
+        records, not_tweets, errors = normalize_lines(self.line - len(lines) + 1, lines, self.sentiment)
+
+        # Messages already in the dataset may be updated by the batch,
+        # so their old counts are taken out before the new ones are added.
+        original_ids = set(op['original_id'] for record in records for kind, op in record.ops if kind == MESSAGE)
+        existing_ids = []
+        for chunk in chunked(original_ids):
+            existing_ids.extend(self.dataset.message_set.filter(original_id__in=chunk).values_list('id', flat=True))
+
+        dimension_keys = list(self.dataset.distributions.values_list('dimension_key', flat=True).distinct())
+        before = {}
+        for chunk in chunked(existing_ids):
+            count_categorical_levels(self.dataset, dimension_keys, Message.objects.filter(id__in=chunk), before)
+
+        self._write_group(lines, records, not_tweets, errors)
+
+        with transaction.atomic():
+            dataset = Dataset.objects.select_for_update().get(pk=self.dataset.pk)
+            if self.min_time is not None and (dataset.start_time is None or dataset.start_time > self.min_time):
+                dataset.start_time = self.min_time
+            if self.max_time is not None and (dataset.end_time is None or dataset.end_time < self.max_time):
+                dataset.end_time = self.max_time
+            dataset.version += 1
+            dataset.save(update_fields=['start_time', 'end_time', 'version'])
+
+            new_messages = dataset.message_set.filter(id__gt=self.last_message_id)
+            last_message_id = new_messages.aggregate(last=Max('id'))['last']
+
+            after = {}
+            for chunk in chunked(existing_ids):
+                count_categorical_levels(dataset, dimension_keys, Message.objects.filter(id__in=chunk), after)
+            if last_message_id is not None:
+                count_categorical_levels(dataset, dimension_keys, new_messages.filter(id__lte=last_message_id), after)
+                self.last_message_id = last_message_id
+
+            for key, count in before.iteritems():
+                after[key] = after.get(key, 0) - count
+            update_categorical_distributions(dataset, after)
+
+        self.dataset = dataset
+        self.batches += 1
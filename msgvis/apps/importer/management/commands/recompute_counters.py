@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand, CommandError
+from time import time
+
+from msgvis.apps.corpus.models import Dataset
+from msgvis.apps.importer.counters import recompute_counters
+
+
+class Command(BaseCommand):
+    """
+    Recalculate the reply, share and mention counts of a dataset's
+    messages and people from the messages themselves.
+
+    .. code-block :: bash
+
+        $ python manage.py recompute_counters <corpus_name_or_id>
+
+    """
+    args = "<corpus_name_or_id>"
+    help = "Recompute reply, share and mention counters for a dataset."
+
+    def handle(self, corpus_name_or_id=None, *args, **options):
+
+        if not corpus_name_or_id:
+            raise CommandError("Corpus name or id must be provided")
+
+        try:
+            corpus_id = int(corpus_name_or_id)
+            dataset = Dataset.objects.get(pk=corpus_id)
+        except ValueError:
+            dataset = Dataset.objects.get(name=corpus_name_or_id)
+
+        # messages imported before replies and retweets were linked can't be counted
+        unlinked = dataset.message_set.filter(type__name='retweet', retweet_of__isnull=True).count() + \
+            dataset.message_set.filter(type__name='reply', reply_to__isnull=True).count()
+        if unlinked:
+            print "Warning: %d retweets and replies are not linked to their original messages " \
+                  "and will not be counted." % unlinked
+
+        start = time()
+        counts = recompute_counters(dataset)
+
+        print "Recomputed counters for dataset %s:" % dataset.name
+        print "  %d messages shared, %d replied to" % (counts['shared_messages'], counts['replied_messages'])
+        print "  %d people mentioned, %d shared, %d replied to" % (counts['mentioned_persons'],
+                                                                  counts['shared_persons'],
+                                                                  counts['replied_persons'])
+        print "Time: %.2fs" % (time() - start)
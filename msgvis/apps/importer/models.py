@@ -1,5 +1,5 @@
 import sys, six
-from django.db import IntegrityError
+from django.db import models, IntegrityError
 from django.utils.timezone import utc
 from urlparse import urlparse
 
@@ -9,6 +9,44 @@ from email.utils import parsedate
 from msgvis.apps.questions.models import Article, Question
 from msgvis.apps.corpus.models import *
 from msgvis.apps.enhance.models import set_message_sentiment
+from msgvis.apps.importer.counters import CounterDeltas
+
+
+class ImportCheckpoint(models.Model):
+    """
+    How far ``import_corpus`` has gotten through a file. The checkpoint
+    is saved in the same transaction as each group of imported lines,
+    so an interrupted import can be resumed from it.
+    """
+    class Meta:
+        unique_together = ('dataset', 'filename')
+
+    dataset = models.ForeignKey(Dataset, related_name="import_checkpoints")
+    """The :class:`.Dataset` the file is being imported into"""
+
+    filename = models.CharField(max_length=250)
+    """The absolute path of the file"""
+
+    line = models.PositiveIntegerField(default=0)
+    """The number of lines imported so far"""
+
+    offset = models.BigIntegerField(default=0)
+    """The number of (uncompressed) bytes imported so far"""
+
+    min_time = models.DateTimeField(null=True, blank=True, default=None)
+    """The earliest message time seen so far"""
+
+    max_time = models.DateTimeField(null=True, blank=True, default=None)
+    """The latest message time seen so far"""
+
+    completed = models.BooleanField(default=False)
+    """True once the whole file has been imported"""
+
+    updated_at = models.DateTimeField(auto_now=True)
+    """When the checkpoint was last saved"""
+
+    def __unicode__(self):
+        return "%s line %d" % (self.filename, self.line)
 
 
 def create_an_user_from_json_obj(user_data, dataset_obj):
@@ -33,17 +71,22 @@ def create_an_user_from_json_obj(user_data, dataset_obj):
     return sender
 
 
-def create_an_instance_from_json(json_str, dataset_obj):
+def create_an_instance_from_json(json_str, dataset_obj, counters=None, sentiment=True):
     """
     Given a dataset object, imports a tweet from json string into
     the dataset.
+
+    If a :class:`msgvis.apps.importer.counters.CounterDeltas` is given,
+    reply, share and mention counts are added to it instead of being
+    written immediately. Without ``sentiment``, new and changed texts
+    are left unscored.
     """
     tweet_data = json.loads(json_str)
     if tweet_data.get('lang'):
         lang = tweet_data.get('lang')
         if lang != "en":
             return False
-    return get_or_create_a_tweet_from_json_obj(tweet_data, dataset_obj)
+    return get_or_create_a_tweet_from_json_obj(tweet_data, dataset_obj, counters=counters, sentiment=sentiment)
 
 
 def get_or_create_language(code):
@@ -81,8 +124,8 @@ def get_or_create_media(mediablob):
     return media
 
 
-def handle_reply_to(status_id, user_id, screen_name, dataset_obj):
-    # update original tweet shared_count
+def handle_reply_to(status_id, user_id, screen_name, dataset_obj, counters, sentiment=True):
+    # update original tweet replied_to_count
     tmp_tweet = {
         'id': status_id,
         'user': {
@@ -92,27 +135,27 @@ def handle_reply_to(status_id, user_id, screen_name, dataset_obj):
         'in_reply_to_status_id': None
     }
 
-    original_tweet = get_or_create_a_tweet_from_json_obj(tmp_tweet, dataset_obj)
+    original_tweet = get_or_create_a_tweet_from_json_obj(tmp_tweet, dataset_obj, counters=counters,
+                                                         sentiment=sentiment)
     if original_tweet is not None:
-        original_tweet.replied_to_count += 1
-        original_tweet.save()
+        counters.add(Message, original_tweet.pk, 'replied_to_count')
+        counters.add(Person, original_tweet.sender_id, 'replied_to_count')
 
-        original_tweet.sender.replied_to_count += 1
-        original_tweet.sender.save()
+    return original_tweet
 
 
-def handle_retweet(retweeted_status, dataset_obj):
+def handle_retweet(retweeted_status, dataset_obj, counters, sentiment=True):
     # update original tweet shared_count
-    original_tweet = get_or_create_a_tweet_from_json_obj(retweeted_status, dataset_obj)
+    original_tweet = get_or_create_a_tweet_from_json_obj(retweeted_status, dataset_obj, counters=counters,
+                                                         sentiment=sentiment)
     if original_tweet is not None:
-        original_tweet.shared_count += 1
-        original_tweet.save()
+        counters.add(Message, original_tweet.pk, 'shared_count')
+        counters.add(Person, original_tweet.sender_id, 'shared_count')
 
-        original_tweet.sender.shared_count += 1
-        original_tweet.sender.save()
+    return original_tweet
 
 
-def handle_entities(tweet, entities, dataset_obj):
+def handle_entities(tweet, entities, dataset_obj, counters):
     # hashtags
     if entities.get('hashtags') and len(entities['hashtags']) > 0:
         tweet.contains_hashtag = True
@@ -136,12 +179,11 @@ def handle_entities(tweet, entities, dataset_obj):
         tweet.contains_mention = True
         for mention in entities['user_mentions']:
             mention_obj = create_an_user_from_json_obj(mention, dataset_obj)
-            mention_obj.mentioned_count += 1
-            mention_obj.save()
+            counters.add(Person, mention_obj.pk, 'mentioned_count')
             tweet.mentions.add(mention_obj)
 
 
-def get_or_create_a_tweet_from_json_obj(tweet_data, dataset_obj):
+def get_or_create_a_tweet_from_json_obj(tweet_data, dataset_obj, counters=None, sentiment=True):
     """
     Given a dataset object, imports a tweet from json object into
     the dataset.
@@ -149,6 +191,10 @@ def get_or_create_a_tweet_from_json_obj(tweet_data, dataset_obj):
     if 'in_reply_to_status_id' not in tweet_data:
         return None
 
+    apply_counters = counters is None
+    if apply_counters:
+        counters = CounterDeltas()
+
     # if tweet_data.get('lang') != 'en':
     #     return None
 
@@ -156,6 +202,7 @@ def get_or_create_a_tweet_from_json_obj(tweet_data, dataset_obj):
                                                    original_id=tweet_data['id'])
 
     # text
+    old_text = tweet.text
     if tweet_data.get('text'):
         tweet.text = tweet_data['text']
 
@@ -180,27 +227,36 @@ def get_or_create_a_tweet_from_json_obj(tweet_data, dataset_obj):
     if tweet_data.get('retweeted_status') is not None:
         tweet.type = get_or_create_messagetype("retweet")
 
-        handle_retweet(tweet_data['retweeted_status'], dataset_obj)
+        tweet.retweet_of = handle_retweet(tweet_data['retweeted_status'], dataset_obj, counters, sentiment)
 
     elif tweet_data.get('in_reply_to_status_id') is not None:
         tweet.type = get_or_create_messagetype("reply")
 
-        handle_reply_to(status_id=tweet_data['in_reply_to_status_id'],
-                        user_id=tweet_data['in_reply_to_user_id'],
-                        screen_name=tweet_data['in_reply_to_screen_name'],
-                        dataset_obj=dataset_obj)
+        tweet.reply_to = handle_reply_to(status_id=tweet_data['in_reply_to_status_id'],
+                                         user_id=tweet_data['in_reply_to_user_id'],
+                                         screen_name=tweet_data['in_reply_to_screen_name'],
+                                         dataset_obj=dataset_obj,
+                                         counters=counters,
+                                         sentiment=sentiment)
 
     else:
         tweet.type = get_or_create_messagetype('tweet')
 
     if tweet_data.get('entities'):
-        handle_entities(tweet, tweet_data.get('entities'), dataset_obj)
+        handle_entities(tweet, tweet_data.get('entities'), dataset_obj, counters)
 
     # sentiment
-    set_message_sentiment(tweet, save=False)
+    if sentiment:
+        set_message_sentiment(tweet, save=False)
+    elif created or tweet.text != old_text:
+        # left for compute_sentiment
+        tweet.sentiment = None
 
     tweet.save()
 
+    if apply_counters:
+        counters.apply()
+
     return tweet
 
 
@@ -0,0 +1,124 @@
+"""
+Utilities for reading corpus files.
+
+Archived collections are usually compressed, so ``.gz``, ``.bz2`` and
+``.xz`` files are decompressed while they are read instead of being
+unpacked to disk first.
+
+For live ingest, :func:`tail_lines` follows a file as it grows and
+:func:`socket_lines` receives lines over TCP. Both yield ``None`` whenever
+nothing has arrived for a while, so the consumer can commit what it has.
+"""
+import bz2
+import gzip
+import io
+import select
+import socket
+import time
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
+
+def lzma_installed():
+    """Return True if .xz files can be read"""
+    return lzma is not None
+
+
+def is_compressed(filename):
+    return filename.lower().endswith(('.gz', '.bz2', '.xz'))
+
+
+def open_corpus_file(filename):
+    """
+    Open a corpus file for reading in binary mode, decompressing it on the
+    fly if its name ends in ``.gz``, ``.bz2`` or ``.xz``.
+
+    The returned file supports ``seek()`` to a position in the
+    *uncompressed* data, though for compressed files that means
+    decompressing everything before it.
+    """
+    lower = filename.lower()
+    if lower.endswith('.gz'):
+        # GzipFile.readline is slow in Python 2, so buffer it
+        return io.BufferedReader(gzip.open(filename, 'rb'))
+    elif lower.endswith('.bz2'):
+        return bz2.BZ2File(filename, 'rb')
+    elif lower.endswith('.xz'):
+        if not lzma_installed():
+            raise Exception("Reading .xz files requires lzma. Run 'pip install backports.lzma'.")
+        return lzma.LZMAFile(filename, 'rb')
+    else:
+        return open(filename, 'rb')
+
+
+def tail_lines(fp, poll_interval=0.5):
+    """
+    Follow a file like ``tail -f``, yielding each complete line as it is
+    written, or None after waiting ``poll_interval`` seconds for more.
+    """
+    partial = ''
+    while True:
+        line = fp.readline()
+        if not line:
+            yield None
+            time.sleep(poll_interval)
+            continue
+
+        # a writer may be in the middle of a line
+        partial += line
+        if partial.endswith('\n'):
+            yield partial
+            partial = ''
+
+
+def socket_lines(host, port, poll_interval=0.5):
+    """
+    Listen on a TCP port and yield the lines sent by each client in turn,
+    or None after waiting ``poll_interval`` seconds for more.
+
+    .. code-block :: bash
+
+        $ nc localhost 9000 < tweets.json
+
+    """
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    server.bind((host, port))
+    server.listen(1)
+    try:
+        while True:
+            if not select.select([server], [], [], poll_interval)[0]:
+                yield None
+                continue
+
+            client, address = server.accept()
+            client.settimeout(poll_interval)
+            buffered = ''
+            try:
+                while True:
+                    try:
+                        data = client.recv(65536)
+                    except socket.timeout:
+                        yield None
+                        continue
+                    if not data:
+                        break
+
+                    buffered += data
+                    lines = buffered.split('\n')
+                    buffered = lines.pop()
+                    for line in lines:
+                        yield line + '\n'
+
+                if buffered:
+                    yield buffered
+            finally:
+                client.close()
+    finally:
+        server.close()
@@ -0,0 +1,313 @@
+"""
+Generate synthetic tweet corpora for testing and benchmarking.
+
+The generated lines are Twitter API style JSON objects that can be
+consumed by :func:`msgvis.apps.importer.models.create_an_instance_from_json`
+(and therefore by the ``import_corpus`` command).
+
+Senders, hashtags, mentions, url domains and words are drawn from
+Zipfian distributions, a fraction of the messages are replies to
+or retweets of earlier messages, and the timestamps follow a
+daily cycle with occasional bursts of activity.
+
+.. code-block:: python
+
+    from msgvis.apps.importer.synthetic import SyntheticTweetGenerator
+
+    generator = SyntheticTweetGenerator(seed=1)
+    with open('tweets.json', 'wb') as fp:
+        generator.write(fp, count=100000)
+
+"""
+import json
+import math
+import random
+import bisect
+from datetime import datetime, timedelta
+from collections import deque
+
+# Tweet ids in this range look like (2015-era) real ids
+FIRST_TWEET_ID = 600000000000000000
+FIRST_USER_ID = 100000000
+
+_WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+_MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun',
+           'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+_TIMEZONES = ['Pacific Time (US & Canada)', 'Eastern Time (US & Canada)',
+              'Central Time (US & Canada)', 'London', 'Amsterdam',
+              'Quito', 'Tokyo', 'Sydney', 'Hawaii', 'Taipei', None]
+
+_STOPWORDS = ['the', 'a', 'to', 'and', 'of', 'in', 'is', 'for', 'on',
+              'it', 'this', 'that', 'with', 'at', 'be', 'you', 'i']
+
+_SYLLABLES = ['ka', 'lo', 'mi', 'ra', 'te', 'su', 'no', 'vi', 'pe', 'da',
+              'zu', 'ri', 'an', 'el', 'or', 'us', 'ex', 'in', 'bo', 'fa']
+
+
+def format_twitter_time(dt):
+    """Format a (UTC) datetime the way the Twitter API does, independent of locale."""
+    return "%s %s %02d %02d:%02d:%02d +0000 %d" % (
+        _WEEKDAYS[dt.weekday()], _MONTHS[dt.month - 1], dt.day,
+        dt.hour, dt.minute, dt.second, dt.year
+    )
+
+
+class ZipfSampler(object):
+    """Draws ranks in ``[0, n)`` with probability proportional to ``1 / (rank + 1) ** exponent``."""
+
+    def __init__(self, n, exponent, rng):
+        self.n = n
+        self.rng = rng
+        self.cumulative = []
+        total = 0.0
+        for rank in xrange(n):
+            total += 1.0 / math.pow(rank + 1, exponent)
+            self.cumulative.append(total)
+        self.total = total
+
+    def sample(self):
+        return bisect.bisect_left(self.cumulative, self.rng.random() * self.total)
+
+
+class SyntheticTweetGenerator(object):
+    """
+    Produces a stream of realistic-looking tweet dictionaries.
+
+    All randomness comes from a seeded :py:class:`random.Random`, so
+    the same parameters always produce the same corpus.
+    """
+
+    def __init__(self, seed=0,
+                 num_users=10000,
+                 num_hashtags=2000,
+                 num_words=20000,
+                 num_domains=500,
+                 start_time=datetime(2015, 2, 1),
+                 duration=timedelta(days=7),
+                 retweet_rate=0.3,
+                 reply_rate=0.1,
+                 hashtag_rate=0.35,
+                 mention_rate=0.25,
+                 url_rate=0.2,
+                 media_rate=0.05,
+                 non_english_rate=0.03,
+                 bursts_per_day=2.0,
+                 zipf_exponent=1.1):
+
+        self.rng = random.Random(seed)
+        self.num_users = num_users
+        self.start_time = start_time
+        self.duration = duration
+
+        self.retweet_rate = retweet_rate
+        self.reply_rate = reply_rate
+        self.hashtag_rate = hashtag_rate
+        self.mention_rate = mention_rate
+        self.url_rate = url_rate
+        self.media_rate = media_rate
+        self.non_english_rate = non_english_rate
+        self.bursts_per_day = bursts_per_day
+
+        self.user_sampler = ZipfSampler(num_users, zipf_exponent, self.rng)
+        self.hashtag_sampler = ZipfSampler(num_hashtags, zipf_exponent, self.rng)
+        self.word_sampler = ZipfSampler(num_words, zipf_exponent, self.rng)
+        self.domain_sampler = ZipfSampler(num_domains, zipf_exponent, self.rng)
+
+        self.hashtags = [self._make_word(2, 4) for i in xrange(num_hashtags)]
+        self.words = _STOPWORDS + [self._make_word(1, 4) for i in xrange(max(0, num_words - len(_STOPWORDS)))]
+        self.domains = ["%s.%s" % (self._make_word(2, 3), self.rng.choice(['com', 'org', 'net', 'co']))
+                        for i in xrange(num_domains)]
+
+        self._users = {}
+        self._recent = deque(maxlen=5000)
+        self._next_id = FIRST_TWEET_ID
+
+    def _make_word(self, min_syllables, max_syllables):
+        return ''.join(self.rng.choice(_SYLLABLES)
+                       for i in xrange(self.rng.randint(min_syllables, max_syllables)))
+
+    def _get_user(self, rank):
+        """Get the (lazily created, then stable) profile for the user at a popularity rank."""
+        user = self._users.get(rank)
+        if user is None:
+            user_id = FIRST_USER_ID + rank
+            screen_name = "%s%d" % (self._make_word(2, 3), rank)
+            # popular users have more followers
+            followers = int(1000000 / (rank + 1)) + self.rng.randint(0, 200)
+            user = {
+                'id': user_id,
+                'id_str': str(user_id),
+                'screen_name': screen_name,
+                'name': "%s %s" % (self._make_word(1, 2).title(), self._make_word(2, 3).title()),
+                'lang': 'en',
+                'followers_count': followers,
+                'friends_count': self.rng.randint(0, 2000),
+                'statuses_count': self.rng.randint(1, 50000),
+                'time_zone': self.rng.choice(_TIMEZONES),
+                'profile_image_url': "http://pbs.twimg.com/profile_images/%d/%s_normal.jpeg" % (user_id, screen_name),
+            }
+            self._users[rank] = user
+        return user
+
+    def _mention_blob(self, user, start):
+        return {
+            'id': user['id'],
+            'id_str': user['id_str'],
+            'screen_name': user['screen_name'],
+            'name': user['name'],
+            'indices': [start, start + len(user['screen_name']) + 1],
+        }
+
+    def _timestamps(self, count):
+        """
+        Generate ``count`` increasing timestamps covering roughly ``duration``.
+        The rate follows a daily cycle, and bursts multiply it for a while.
+        """
+        span = self.duration.total_seconds()
+        mean_gap = span / max(count, 1)
+        current = 0.0
+        burst_end = -1.0
+        burst_factor = 1.0
+        day = 24 * 3600.0
+
+        for i in xrange(count):
+            rate = 1.0 + 0.6 * math.sin(2 * math.pi * current / day)
+            if current <= burst_end:
+                rate *= burst_factor
+
+            gap = self.rng.expovariate(1.0) * mean_gap / rate
+
+            if current > burst_end and self.rng.random() < self.bursts_per_day * gap / day:
+                # start a burst lasting up to a couple of hours
+                burst_end = current + self.rng.uniform(600, 7200)
+                burst_factor = self.rng.uniform(3, 10)
+
+            current += gap
+            yield self.start_time + timedelta(seconds=current)
+
+    def _new_tweet(self, time):
+        tweet_id = self._next_id
+        self._next_id += self.rng.randint(1, 1000)
+
+        user = self._get_user(self.user_sampler.sample())
+        lang = 'en'
+        if self.rng.random() < self.non_english_rate:
+            lang = self.rng.choice(['es', 'fr', 'ja', 'pt'])
+
+        return {
+            'id': tweet_id,
+            'id_str': str(tweet_id),
+            'created_at': format_twitter_time(time),
+            'lang': lang,
+            'user': user,
+            'text': '',
+            'entities': {'hashtags': [], 'urls': [], 'user_mentions': [], 'symbols': []},
+            'in_reply_to_status_id': None,
+            'in_reply_to_status_id_str': None,
+            'in_reply_to_user_id': None,
+            'in_reply_to_user_id_str': None,
+            'in_reply_to_screen_name': None,
+            'retweet_count': 0,
+            'favorite_count': 0,
+        }
+
+    def _fill_original(self, tweet, prefix=u""):
+        """Build the text and entities of a tweet that is not a retweet."""
+        text = prefix
+        entities = tweet['entities']
+
+        if self.rng.random() < self.mention_rate:
+            for i in xrange(self.rng.randint(1, 2)):
+                mentioned = self._get_user(self.user_sampler.sample())
+                entities['user_mentions'].append(self._mention_blob(mentioned, len(text)))
+                text += u"@%s " % mentioned['screen_name']
+
+        text += u' '.join(self.words[self.word_sampler.sample()]
+                          for i in xrange(self.rng.randint(4, 18)))
+
+        if self.rng.random() < self.hashtag_rate:
+            for i in xrange(self.rng.randint(1, 3)):
+                tag = self.hashtags[self.hashtag_sampler.sample()]
+                text += u" "
+                entities['hashtags'].append({'text': tag, 'indices': [len(text), len(text) + len(tag) + 1]})
+                text += u"#" + tag
+
+        if self.rng.random() < self.url_rate:
+            domain = self.domains[self.domain_sampler.sample()]
+            short_url = u"http://t.co/%s" % self._make_word(3, 4)
+            text += u" "
+            entities['urls'].append({
+                'url': short_url,
+                'expanded_url': u"http://%s/%s/%d" % (domain, self._make_word(1, 3), self.rng.randint(1, 10 ** 6)),
+                'display_url': domain,
+                'indices': [len(text), len(text) + len(short_url)],
+            })
+            text += short_url
+
+        if self.rng.random() < self.media_rate:
+            short_url = u"http://t.co/%s" % self._make_word(3, 4)
+            media_id = self.rng.randint(1, 10 ** 12)
+            text += u" "
+            entities['media'] = [{
+                'id': media_id,
+                'type': 'photo',
+                'url': short_url,
+                'media_url': u"http://pbs.twimg.com/media/%d.jpg" % media_id,
+                'indices': [len(text), len(text) + len(short_url)],
+            }]
+            text += short_url
+
+        tweet['text'] = text[:140]
+        return tweet
+
+    def generate(self, count):
+        """Yield ``count`` tweet dictionaries in time order."""
+
+        for time in self._timestamps(count):
+            tweet = self._new_tweet(time)
+            roll = self.rng.random()
+
+            if roll < self.retweet_rate and len(self._recent) > 0:
+                original = self._pick_recent()
+                original_user = original['user']
+                tweet['retweeted_status'] = original
+                tweet['text'] = (u"RT @%s: %s" % (original_user['screen_name'], original['text']))[:140]
+
+                entities = tweet['entities']
+                entities['user_mentions'].append(self._mention_blob(original_user, 3))
+                entities['hashtags'] = list(original['entities']['hashtags'])
+                entities['urls'] = list(original['entities']['urls'])
+
+            elif roll < self.retweet_rate + self.reply_rate and len(self._recent) > 0:
+                original = self._pick_recent()
+                original_user = original['user']
+                tweet['in_reply_to_status_id'] = original['id']
+                tweet['in_reply_to_status_id_str'] = original['id_str']
+                tweet['in_reply_to_user_id'] = original_user['id']
+                tweet['in_reply_to_user_id_str'] = original_user['id_str']
+                tweet['in_reply_to_screen_name'] = original_user['screen_name']
+
+                tweet['entities']['user_mentions'].append(self._mention_blob(original_user, 0))
+                self._fill_original(tweet, prefix=u"@%s " % original_user['screen_name'])
+                self._recent.append(tweet)
+
+            else:
+                self._fill_original(tweet)
+                self._recent.append(tweet)
+
+            yield tweet
+
+    def _pick_recent(self):
+        """Pick an earlier tweet, strongly preferring the most recent ones."""
+        index = min(int(self.rng.expovariate(1.0 / 50)), len(self._recent) - 1)
+        return self._recent[-1 - index]
+
+    def write(self, fp, count):
+        """Write ``count`` tweets to a file-like object, one JSON object per line."""
+        written = 0
+        for tweet in self.generate(count):
+            fp.write(json.dumps(tweet))
+            fp.write("\n")
+            written += 1
+        return written
@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+from django.db.models import Min, Max
 from django.test import TestCase
 from msgvis.apps.corpus.models import Dataset, Message
 from msgvis.apps.questions.models import Article, Question
@@ -65,4 +66,534 @@ class ImportTest(TestCase):
         self.assertEquals(len(question.dimensions.all()), 9)
 
         article = question.source
-        self.assertEquals(article.year, 2011)
\ No newline at end of file
+        self.assertEquals(article.year, 2011)
+
+class SyntheticCorpusTest(TestCase):
+
+    def test_generator_is_deterministic(self):
+        from synthetic import SyntheticTweetGenerator
+
+        first = list(SyntheticTweetGenerator(seed=3, num_users=50).generate(100))
+        second = list(SyntheticTweetGenerator(seed=3, num_users=50).generate(100))
+        self.assertEquals(first, second)
+
+    def test_generated_tweets_import(self):
+        import json
+        from synthetic import SyntheticTweetGenerator
+
+        dset = Dataset.objects.create(name="Synthetic Corpus", description="My Dataset")
+        tweets = list(SyntheticTweetGenerator(seed=1, num_users=50, non_english_rate=0).generate(200))
+
+        # the generator should produce some of every message type
+        self.assertTrue(any(t.get('retweeted_status') for t in tweets))
+        self.assertTrue(any(t.get('in_reply_to_status_id') for t in tweets))
+
+        for tweet in tweets:
+            self.assertTrue(create_an_instance_from_json(json.dumps(tweet), dset))
+
+        top_level_ids = set(t['id'] for t in tweets)
+        imported = set(dset.message_set.values_list('original_id', flat=True))
+        self.assertTrue(top_level_ids.issubset(imported))
+
+        self.assertEquals(dset.message_set.filter(time__isnull=True).count(), 0)
+
+
+def snapshot_dataset(dataset):
+    """Describe the messages and people in a dataset independently of row ids."""
+    messages = {}
+    for msg in dataset.message_set.all():
+        messages[msg.original_id] = (
+            msg.text, msg.time, msg.sentiment,
+            msg.language.code if msg.language else None,
+            msg.timezone.name if msg.timezone else None,
+            msg.sender.original_id if msg.sender else None,
+            msg.type.name if msg.type else None,
+            msg.replied_to_count, msg.shared_count,
+            msg.reply_to.original_id if msg.reply_to else None,
+            msg.retweet_of.original_id if msg.retweet_of else None,
+            msg.contains_hashtag, msg.contains_url, msg.contains_media, msg.contains_mention,
+            sorted(msg.hashtags.values_list('text', flat=True)),
+            sorted(msg.urls.values_list('full_url', 'domain', 'short_url')),
+            sorted(msg.media.values_list('media_url', 'type')),
+            sorted(msg.mentions.values_list('original_id', flat=True)),
+        )
+
+    persons = {}
+    for person in dataset.person_set.all():
+        persons[person.original_id] = (
+            person.username, person.full_name,
+            person.language.code if person.language else None,
+            person.message_count, person.replied_to_count, person.shared_count, person.mentioned_count,
+            person.friend_count, person.follower_count, person.profile_image_url,
+        )
+
+    return messages, persons
+
+
+class BulkImportTest(TestCase):
+
+    def setUp(self):
+        import json
+        from django.core.cache import cache
+        from synthetic import SyntheticTweetGenerator
+
+        # cache-machine would otherwise hand out languages and timezones from earlier tests
+        cache.clear()
+
+        generator = SyntheticTweetGenerator(seed=2, num_users=40, num_hashtags=20, non_english_rate=0.1)
+        self.lines = [json.dumps(t) for t in generator.generate(300)]
+
+    def test_bulk_matches_per_line_import(self):
+        from bulk import normalize_json_line, BulkTweetWriter
+
+        serial = Dataset.objects.create(name="Serial", description="Serial")
+        for line in self.lines:
+            create_an_instance_from_json(line, serial)
+
+        bulk = Dataset.objects.create(name="Bulk", description="Bulk")
+        writer = BulkTweetWriter(bulk)
+        # later batches retweet and reply to messages written by earlier ones
+        for start in xrange(0, len(self.lines), 70):
+            records = [normalize_json_line(line) for line in self.lines[start:start + 70]]
+            writer.write([r for r in records if r])
+
+        self.assertEquals(snapshot_dataset(bulk), snapshot_dataset(serial))
+
+    def test_self_mentions_match_per_line_import(self):
+        import json
+        from synthetic import SyntheticTweetGenerator
+        from bulk import normalize_json_line, BulkTweetWriter
+
+        # with few users, many of them mention themselves
+        generator = SyntheticTweetGenerator(seed=2, num_users=5, num_hashtags=20, mention_rate=0.9)
+        lines = [json.dumps(t) for t in generator.generate(100)]
+        self_mentions = [line for line in lines
+                         if any(m['id'] == json.loads(line)['user']['id']
+                                for m in json.loads(line)['entities']['user_mentions'])]
+        self.assertGreater(len(self_mentions), 0)
+
+        serial = Dataset.objects.create(name="Serial", description="Serial")
+        for line in lines:
+            create_an_instance_from_json(line, serial)
+
+        bulk = Dataset.objects.create(name="Bulk", description="Bulk")
+        writer = BulkTweetWriter(bulk)
+        for start in xrange(0, len(lines), 30):
+            records = [normalize_json_line(line) for line in lines[start:start + 30]]
+            writer.write([r for r in records if r])
+
+        self.assertEquals(snapshot_dataset(bulk), snapshot_dataset(serial))
+
+    def test_parallel_import_matches_per_line_import(self):
+        from StringIO import StringIO
+        from msgvis.apps.importer.management.commands.import_corpus import Importer, ParallelImporter
+
+        serial = Dataset.objects.create(name="Serial", description="Serial")
+        Importer(StringIO("\n".join(self.lines)), serial).run()
+
+        parallel = Dataset.objects.create(name="Parallel", description="Parallel")
+        importer = ParallelImporter(StringIO("\n".join(self.lines)), parallel, workers=2)
+        importer.commit_every = 40
+        importer.run()
+
+        self.assertEquals(importer.line, len(self.lines))
+        self.assertEquals(importer.errors, 0)
+        self.assertEquals(importer.imported + importer.not_tweets, len(self.lines))
+        self.assertEquals(snapshot_dataset(parallel), snapshot_dataset(serial))
+
+    def test_import_without_sentiment_then_compute(self):
+        from StringIO import StringIO
+        from msgvis.apps.enhance.models import PrecalcCategoricalDistribution
+        from msgvis.apps.enhance.tasks import compute_sentiment, precalc_categorical_dimension
+        from msgvis.apps.importer.management.commands.import_corpus import Importer, ParallelImporter
+
+        def distribution(dset):
+            return dict((d.level, d.count) for d in
+                        PrecalcCategoricalDistribution.objects.filter(dataset=dset, dimension_key='sentiment'))
+
+        serial = Dataset.objects.create(name="Serial", description="Serial")
+        Importer(StringIO("\n".join(self.lines)), serial).run()
+        serial.start_time, serial.end_time = serial.message_set.aggregate(Min('time'), Max('time')).values()
+        serial.save()
+        precalc_categorical_dimension(dataset_id=serial.id, dimension_key='sentiment')
+        expected = distribution(serial)
+
+        unscored = Dataset.objects.create(name="Unscored", description="Unscored")
+        Importer(StringIO("\n".join(self.lines)), unscored, sentiment=False).run()
+        self.assertFalse(unscored.message_set.filter(sentiment__isnull=False).exists())
+
+        parallel = Dataset.objects.create(name="Parallel", description="Parallel")
+        importer = ParallelImporter(StringIO("\n".join(self.lines)), parallel, workers=2, sentiment=False)
+        importer.commit_every = 40
+        importer.run()
+        self.assertFalse(parallel.message_set.filter(sentiment__isnull=False).exists())
+        parallel.start_time, parallel.end_time = serial.start_time, serial.end_time
+        parallel.save()
+        precalc_categorical_dimension(dataset_id=parallel.id, dimension_key='sentiment')
+
+        changed = compute_sentiment(parallel.id, workers=2, batch_size=40, missing_only=True)
+        self.assertEquals(changed, parallel.message_set.count())
+        self.assertEquals(snapshot_dataset(parallel), snapshot_dataset(serial))
+        self.assertEquals(distribution(parallel), expected)
+        self.assertEquals(Dataset.objects.get(pk=parallel.pk).version, 1)
+
+        # nothing is left to score
+        self.assertEquals(compute_sentiment(parallel.id, missing_only=True), 0)
+        self.assertEquals(compute_sentiment(parallel.id, batch_size=25), 0)
+
+    def test_recompute_counters(self):
+        import json
+        from collections import Counter
+        from msgvis.apps.corpus.models import Person
+        from counters import recompute_counters
+
+        dset = Dataset.objects.create(name="Counters", description="Counters")
+        for line in self.lines:
+            create_an_instance_from_json(line, dset)
+        Person.objects.filter(dataset=dset).update(shared_count=0, replied_to_count=0, mentioned_count=0)
+        recompute_counters(dset)
+
+        # every distinct tweet object in the corpus, including retweeted ones
+        tweets = {}
+        for line in self.lines:
+            tweet = json.loads(line)
+            if tweet['lang'] == 'en':
+                tweets[tweet['id']] = tweet
+                if tweet.get('retweeted_status'):
+                    tweets[tweet['retweeted_status']['id']] = tweet['retweeted_status']
+        shares = Counter(t['retweeted_status']['id'] for t in tweets.itervalues() if t.get('retweeted_status'))
+        replies = Counter(t['in_reply_to_status_id'] for t in tweets.itervalues() if t['in_reply_to_status_id'])
+        self.assertTrue(len(shares) > 0)
+        self.assertTrue(len(replies) > 0)
+
+        sender_shares = Counter()
+        sender_replies = Counter()
+        for msg in dset.message_set.all():
+            self.assertEquals(msg.shared_count, shares[msg.original_id])
+            self.assertEquals(msg.replied_to_count, replies[msg.original_id])
+            sender_shares[msg.sender_id] += msg.shared_count
+            sender_replies[msg.sender_id] += msg.replied_to_count
+
+        for person in dset.person_set.all():
+            self.assertEquals(person.shared_count, sender_shares[person.id])
+            self.assertEquals(person.replied_to_count, sender_replies[person.id])
+            self.assertEquals(person.mentioned_count, person.mentioned_in.count())
+
+    def test_non_english_and_non_tweets(self):
+        from bulk import normalize_json_line
+
+        self.assertEquals(normalize_json_line('{"lang": "fr", "in_reply_to_status_id": null, "id": 1}'), False)
+        self.assertEquals(normalize_json_line('{"delete": {"status": {"id": 1}}}'), None)
+
+    def test_resume_compressed_import(self):
+        import gzip
+        import itertools
+        import os
+        import tempfile
+        from StringIO import StringIO
+        from models import ImportCheckpoint
+        from streams import open_corpus_file
+        from msgvis.apps.importer.management.commands.import_corpus import BulkImporter
+
+        fd, filename = tempfile.mkstemp(suffix='.json.gz')
+        os.close(fd)
+        try:
+            with gzip.open(filename, 'wb') as out:
+                out.write("\n".join(self.lines))
+
+            serial = Dataset.objects.create(name="Serial", description="Serial")
+            expected = BulkImporter(StringIO("\n".join(self.lines)), serial)
+            expected.run()
+
+            resumed = Dataset.objects.create(name="Resumed", description="Resumed")
+            checkpoint = ImportCheckpoint.objects.create(dataset=resumed, filename=filename)
+
+            # stop partway through, as if the import had been interrupted
+            with open_corpus_file(filename) as fp:
+                importer = BulkImporter(fp, resumed, checkpoint=checkpoint)
+                importer.commit_every = 50
+                importer.fp = itertools.islice(fp, 120)
+                importer.run()
+            checkpoint.completed = False
+            checkpoint.save()
+
+            checkpoint = ImportCheckpoint.objects.get(pk=checkpoint.pk)
+            self.assertEquals(checkpoint.line, 120)
+            with open_corpus_file(filename) as fp:
+                fp.seek(checkpoint.offset)
+                importer = BulkImporter(fp, resumed, checkpoint=checkpoint)
+                importer.run()
+
+            self.assertEquals(importer.line, len(self.lines))
+            self.assertTrue(ImportCheckpoint.objects.get(pk=checkpoint.pk).completed)
+            self.assertEquals(importer.get_time_range(), expected.get_time_range())
+            self.assertEquals(snapshot_dataset(resumed), snapshot_dataset(serial))
+        finally:
+            os.remove(filename)
+
+    def test_multi_file_import_matches_serial_import(self):
+        import gzip
+        import os
+        import shutil
+        import tempfile
+        from StringIO import StringIO
+        from models import ImportCheckpoint
+        from msgvis.apps.importer.management.commands.import_corpus import BulkImporter, MultiFileImporter
+
+        serial = Dataset.objects.create(name="Serial", description="Serial")
+        expected = BulkImporter(StringIO("\n".join(self.lines)), serial)
+        expected.run()
+
+        directory = tempfile.mkdtemp()
+        try:
+            files = []
+            parallel = Dataset.objects.create(name="Files", description="Files")
+            for i, start in enumerate(xrange(0, len(self.lines), 100)):
+                filename = os.path.join(directory, 'corpus-%d.json.gz' % i)
+                with gzip.open(filename, 'wb') as out:
+                    out.write("\n".join(self.lines[start:start + 100]))
+                files.append((filename, ImportCheckpoint.objects.create(dataset=parallel, filename=filename)))
+
+            importer = MultiFileImporter(files, parallel, workers=2)
+            importer.commit_every = 40
+            importer.run()
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertEquals(importer.failed, [])
+        self.assertEquals(importer.line, len(self.lines))
+        self.assertEquals(ImportCheckpoint.objects.filter(dataset=parallel, completed=True).count(), 3)
+        self.assertEquals(importer.get_time_range(), expected.get_time_range())
+        self.assertEquals(snapshot_dataset(parallel), snapshot_dataset(serial))
+
+    def test_multi_file_import_follows_file_order(self):
+        import gzip
+        import os
+        import shutil
+        import tempfile
+        from StringIO import StringIO
+        from models import ImportCheckpoint
+        from msgvis.apps.importer.management.commands.import_corpus import BulkImporter, MultiFileImporter
+
+        # the first file is the longest, so the others are likely to be read before it
+        chunks = [self.lines[100:], self.lines[50:100], self.lines[:50]]
+
+        # a reply in a later file turns its target into a plain tweet, so the order matters
+        forward = Dataset.objects.create(name="Forward", description="Forward")
+        BulkImporter(StringIO("\n".join(self.lines)), forward).run()
+        serial = Dataset.objects.create(name="Serial", description="Serial")
+        BulkImporter(StringIO("\n".join(line for chunk in chunks for line in chunk)), serial).run()
+        self.assertNotEqual(snapshot_dataset(serial), snapshot_dataset(forward))
+
+        directory = tempfile.mkdtemp()
+        try:
+            files = []
+            parallel = Dataset.objects.create(name="Files", description="Files")
+            for i, chunk in enumerate(chunks):
+                filename = os.path.join(directory, 'corpus-%d.json.gz' % i)
+                with gzip.open(filename, 'wb') as out:
+                    out.write("\n".join(chunk))
+                files.append((filename, ImportCheckpoint.objects.create(dataset=parallel, filename=filename)))
+
+            importer = MultiFileImporter(files, parallel, workers=3)
+            importer.commit_every = 20
+            importer.run()
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertEquals(importer.failed, [])
+        self.assertEquals(snapshot_dataset(parallel), snapshot_dataset(serial))
+
+    def test_import_increments_version(self):
+        import os
+        import tempfile
+        from django.core.management import call_command
+        from msgvis.apps.enhance.models import TermTimeline
+        from msgvis.apps.enhance.cooccurrence import CooccurrenceMatrix
+
+        fd, filename = tempfile.mkstemp(suffix='.json')
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                out.write("\n".join(self.lines[:100]))
+            call_command('import_corpus', filename, dataset="Versioned", bulk=True)
+            dataset = Dataset.objects.get(name="Versioned")
+            self.assertEquals(dataset.version, 1)
+            TermTimeline.objects.create(dataset=dataset, dataset_version=dataset.version, complete=True,
+                                        start_time=dataset.start_time, end_time=dataset.end_time)
+            self.assertIsNotNone(TermTimeline.get_current(dataset))
+            CooccurrenceMatrix.build(dataset)
+            self.assertIsNotNone(CooccurrenceMatrix.for_dataset(dataset))
+
+            # messages within the time range the timeline was built for
+            with open(filename, 'wb') as out:
+                out.write("\n".join(self.lines[20:60]))
+            for options in ({'bulk': True}, {}, {'file_workers': 1}):
+                call_command('import_corpus', filename, dataset="Versioned", **options)
+            dataset = Dataset.objects.get(name="Versioned")
+            self.assertEquals(dataset.version, 4)
+            self.assertIsNone(TermTimeline.get_current(dataset))
+            self.assertIsNone(CooccurrenceMatrix.for_dataset(dataset))
+        finally:
+            os.remove(filename)
+            CooccurrenceMatrix.delete(Dataset.objects.get(name="Versioned").id)
+
+    def test_multi_file_import_fails_on_a_broken_file(self):
+        import gzip
+        import os
+        import shutil
+        import tempfile
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        from models import ImportCheckpoint
+
+        directory = tempfile.mkdtemp()
+        try:
+            filenames = []
+            for i, start in enumerate(xrange(0, 200, 100)):
+                filename = os.path.join(directory, 'corpus-%d.json.gz' % i)
+                with gzip.open(filename, 'wb') as out:
+                    out.write("\n".join(self.lines[start:start + 100]))
+                filenames.append(filename)
+
+            # cut the second file off part way
+            with open(filenames[1], 'rb') as fp:
+                data = fp.read()
+            with open(filenames[1], 'wb') as fp:
+                fp.write(data[:len(data) / 2])
+
+            with self.assertRaises(CommandError) as raised:
+                call_command('import_corpus', *filenames, dataset="Broken", file_workers=2)
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertIn(filenames[1], str(raised.exception))
+        self.assertNotIn(filenames[0], str(raised.exception))
+        checkpoints = ImportCheckpoint.objects.filter(dataset__name="Broken")
+        self.assertTrue(checkpoints.get(filename=filenames[0]).completed)
+        self.assertFalse(checkpoints.get(filename=filenames[1]).completed)
+
+    def test_delete_dataset(self):
+        from msgvis.apps.corpus.models import Hashtag, Person, Url, Media
+        from msgvis.apps.enhance.models import Dictionary, Word, MessageWord, TweetWord, \
+            PrecalcCategoricalDistribution
+        from bulk import normalize_json_line, BulkTweetWriter
+        from deletion import delete_dataset, delete_orphans
+
+        datasets = []
+        for name, lines in (("Deleted", self.lines[:200]), ("Kept", self.lines[100:])):
+            dset = Dataset.objects.create(name=name, description=name)
+            records = [normalize_json_line(line) for line in lines]
+            BulkTweetWriter(dset).write([r for r in records if r])
+            datasets.append(dset)
+        deleted, kept = datasets
+
+        dictionary = Dictionary.objects.create(dataset=deleted, name="words", settings="{}",
+                                               num_docs=0, num_pos=0, num_nnz=0)
+        word = Word.objects.create(dictionary=dictionary, index=0, text="word", document_frequency=1)
+        tweet_word = TweetWord.objects.create(dataset=deleted, original_text="word", text="word")
+        for message in deleted.message_set.all()[:20]:
+            MessageWord.objects.create(dictionary=dictionary, word=word, message=message,
+                                       word_index=0, count=1, tfidf=1)
+            tweet_word.messages.add(message)
+        PrecalcCategoricalDistribution.objects.create(dataset=deleted, dimension_key="hashtags",
+                                                      level="a", count=1)
+
+        expected = snapshot_dataset(kept)
+        delete_dataset(deleted, chunk_size=50)
+        delete_orphans(chunk_size=50)
+
+        self.assertFalse(Dataset.objects.filter(pk=deleted.pk).exists())
+        self.assertEquals(Person.objects.filter(dataset_id=deleted.pk).count(), 0)
+        self.assertEquals(Message.objects.filter(dataset_id=deleted.pk).count(), 0)
+        self.assertEquals(Word.objects.count(), 0)
+        self.assertEquals(MessageWord.objects.count(), 0)
+        self.assertEquals(TweetWord.objects.count(), 0)
+        self.assertEquals(PrecalcCategoricalDistribution.objects.count(), 0)
+
+        self.assertEquals(snapshot_dataset(kept), expected)
+        for model in (Hashtag, Url, Media):
+            used = model.objects.filter(message__dataset=kept).distinct().count()
+            self.assertEquals(model.objects.count(), used)
+
+    def test_stream_ingest_updates_distributions(self):
+        from StringIO import StringIO
+        from msgvis.apps.enhance.models import PrecalcCategoricalDistribution
+        from msgvis.apps.enhance.tasks import precalc_categorical_dimension
+        from msgvis.apps.importer.management.commands.import_corpus import BulkImporter
+        from msgvis.apps.importer.management.commands.ingest_stream import StreamIngester
+
+        dimension_keys = ["hashtags", "urls", "type", "sender", "mentions", "sentiment"]
+
+        def distributions(dset):
+            return dict(((d.dimension_key, d.level), d.count)
+                        for d in PrecalcCategoricalDistribution.objects.filter(dataset=dset))
+
+        expected = Dataset.objects.create(name="Static", description="Static")
+        importer = BulkImporter(StringIO("\n".join(self.lines)), expected)
+        importer.run()
+        expected.start_time, expected.end_time = importer.get_time_range()
+        expected.save()
+        for key in dimension_keys:
+            precalc_categorical_dimension(dataset_id=expected.id, dimension_key=key)
+        expected_distributions = distributions(expected)
+        PrecalcCategoricalDistribution.objects.filter(dataset=expected).delete()
+
+        live = Dataset.objects.create(name="Live", description="Live")
+        importer = BulkImporter(StringIO("\n".join(self.lines[:100])), live)
+        importer.run()
+        live.start_time, live.end_time = importer.get_time_range()
+        live.save()
+        for key in dimension_keys:
+            precalc_categorical_dimension(dataset_id=live.id, dimension_key=key)
+
+        # an idle source yields None, which commits the lines waiting so far
+        source = []
+        for i, line in enumerate(self.lines[100:]):
+            source.append(line + "\n")
+            if i % 30 == 29:
+                source.append(None)
+        ingester = StreamIngester(iter(source), live)
+        ingester.commit_every = 50
+        ingester.max_delay = 0
+        ingester.run()
+
+        live = Dataset.objects.get(pk=live.pk)
+        self.assertEquals(live.version, ingester.batches)
+        self.assertTrue(ingester.batches >= 4)
+        self.assertEquals((live.start_time, live.end_time), (expected.start_time, expected.end_time))
+        self.assertEquals(snapshot_dataset(live), snapshot_dataset(expected))
+        self.assertEquals(distributions(live), expected_distributions)
+
+    def test_tail_lines(self):
+        import itertools
+        import tempfile
+        from streams import tail_lines
+
+        with tempfile.TemporaryFile() as fp:
+            fp.write('{"id": 1}\n{"id": 2}\n{"id"')
+            fp.seek(0)
+            lines = tail_lines(fp, poll_interval=0)
+            self.assertEquals(list(itertools.islice(lines, 3)), ['{"id": 1}\n', '{"id": 2}\n', None])
+
+            # the rest of the partial line arrives
+            position = fp.tell()
+            fp.seek(0, 2)
+            fp.write(': 3}\n')
+            fp.seek(position)
+            self.assertEquals(next(lines), '{"id": 3}\n')
+
+    def test_load_rows(self):
+        from loading import load_rows, LoadStats, _infile_value
+        from msgvis.apps.corpus.models import Hashtag
+
+        # more rows than sqlite allows parameters in one statement
+        stats = LoadStats()
+        rows = [(u"tag%d" % i,) for i in xrange(1200)] + [(u"caf\xe9",)]
+        self.assertEquals(load_rows(Hashtag, ('text',), rows, stats), 1201)
+        self.assertEquals(stats.rows, 1201)
+        self.assertEquals(Hashtag.objects.filter(text__startswith="tag").count(), 1200)
+        self.assertTrue(Hashtag.objects.filter(text=u"caf\xe9").exists())
+
+        self.assertEquals(_infile_value(None), '\\N')
+        self.assertEquals(_infile_value(u"a\tb\\c\n"), 'a\\tb\\\\c\\n')
+        self.assertEquals(_infile_value(0.1), '0.1')
@@ -74,6 +74,11 @@ if DATABASES['default']['ENGINE'] == 'django.db.backends.mysql':
         'init_command': 'SET storage_engine=INNODB',
     }
 
+# Load large tables with LOAD DATA LOCAL INFILE (the server must allow local_infile)
+BULK_LOAD_INFILE = bool(get_env_setting('BULK_LOAD_INFILE', False))
+if BULK_LOAD_INFILE and DATABASES['default']['ENGINE'] == 'django.db.backends.mysql':
+    DATABASES['default']['OPTIONS']['local_infile'] = 1
+
 ########## END DATABASE CONFIGURATION
 
 
@@ -434,3 +439,31 @@ TWITTER_ACCESS_TOKEN_SECRET = get_env_setting('TWITTER_ACCESS_TOKEN_SECRET', '')
 QUANTITATIVE_DIMENSION_BINS = 50
 ######### END DIMENSION SETTINGS
 
+
+######### CO-OCCURRENCE SETTINGS
+# How often words, hashtags and mentions appear together (see msgvis.apps.enhance.cooccurrence)
+COOCCURRENCE_ROOT = get_env_setting('COOCCURRENCE_ROOT', PROJECT_ROOT / 'cooccurrence')
+if not isinstance(COOCCURRENCE_ROOT, path):
+    COOCCURRENCE_ROOT = path(COOCCURRENCE_ROOT)
+######### END CO-OCCURRENCE SETTINGS
+
+
+######### TOPIC MODELING SETTINGS
+# Tokenized messages are cached here, one directory per dataset
+TOKEN_CACHE_ROOT = get_env_setting('TOKEN_CACHE_ROOT', PROJECT_ROOT / 'token_cache')
+if not isinstance(TOKEN_CACHE_ROOT, path):
+    TOKEN_CACHE_ROOT = path(TOKEN_CACHE_ROOT)
+
+# Bags of words are exported here for topic modeling, one directory per dictionary
+BOW_CORPUS_ROOT = get_env_setting('BOW_CORPUS_ROOT', PROJECT_ROOT / 'bow_corpus')
+if not isinstance(BOW_CORPUS_ROOT, path):
+    BOW_CORPUS_ROOT = path(BOW_CORPUS_ROOT)
+
+# Topic models are saved here (see msgvis.apps.enhance.store)
+TOPIC_MODEL_ROOT = get_env_setting('TOPIC_MODEL_ROOT', PROJECT_ROOT / 'topic_models')
+if not isinstance(TOPIC_MODEL_ROOT, path):
+    TOPIC_MODEL_ROOT = path(TOPIC_MODEL_ROOT)
+
+# The number of loaded topic models each process keeps
+TOPIC_MODEL_CACHE_SIZE = int(get_env_setting('TOPIC_MODEL_CACHE_SIZE', 4))
+######### END TOPIC MODELING SETTINGS
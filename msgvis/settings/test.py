@@ -15,3 +15,12 @@ DATABASES = {
 PASSWORD_HASHERS = (
     'django.contrib.auth.hashers.MD5PasswordHasher',
 )
+
+########## TOPIC MODELING CACHES OUTSIDE THE PROJECT
+import tempfile
+TOKEN_CACHE_ROOT = path(tempfile.gettempdir()) / 'msgvis_test_token_cache'
+BOW_CORPUS_ROOT = path(tempfile.gettempdir()) / 'msgvis_test_bow_corpus'
+TOPIC_MODEL_ROOT = path(tempfile.gettempdir()) / 'msgvis_test_topic_models'
+
+########## CO-OCCURRENCE MATRICES OUTSIDE THE PROJECT
+COOCCURRENCE_ROOT = path(tempfile.gettempdir()) / 'msgvis_test_cooccurrence'